@@ -1,8 +1,42 @@
-from graphsimqt.run_similarity_analysis import run_similarity_analysis
-from graphsimqt.normalize_graph import normalize_graph
-from graphsimqt.run_permutation_tests import run_permutation_tests
-from graphsimqt.compute_empirical_p_values import compute_empirical_p_values
-from graphsimqt.compute_mwu_p_values import compute_mwu_p_values
-from graphsimqt.run_shortest_path_analysis import run_shortest_path_analysis
-from graphsimqt.compute_shortest_path_distances import compute_shortest_path_distances
-from graphsimqt.analyze_shortest_path_distances import analyze_shortest_path_distances
+import importlib
+import sys
+import types
+
+# The pipeline functions are imported from their modules on first access (PEP 562), so that importing a single
+# module (e.g., python -m graphsimqt.compute_empirical_p_values) does not import graph_tool and the other heavy
+# dependencies of the remaining modules.
+_FUNCTION_MODULES = {'run_similarity_analysis': 'graphsimqt.run_similarity_analysis',
+                     'run_similarity_batch': 'graphsimqt.run_similarity_batch',
+                     'run_similarity_matrix': 'graphsimqt.run_similarity_matrix',
+                     'normalize_graph': 'graphsimqt.normalize_graph',
+                     'run_permutation_tests': 'graphsimqt.run_permutation_tests',
+                     'compute_empirical_p_values': 'graphsimqt.compute_empirical_p_values',
+                     'compute_mwu_p_values': 'graphsimqt.compute_mwu_p_values',
+                     'run_shortest_path_analysis': 'graphsimqt.run_shortest_path_analysis',
+                     'compute_shortest_path_distances': 'graphsimqt.compute_shortest_path_distances',
+                     'analyze_shortest_path_distances': 'graphsimqt.analyze_shortest_path_distances'}
+
+__all__ = list(_FUNCTION_MODULES)
+
+
+def __getattr__(name: str):
+    if name in _FUNCTION_MODULES:
+        return getattr(importlib.import_module(_FUNCTION_MODULES[name]), name)
+    raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
+
+
+def __dir__():
+    return sorted(set(globals()).union(__all__))
+
+
+class _Package(types.ModuleType):
+
+    def __setattr__(self, name: str, value):
+        # Importing a submodule binds it as attribute of the package. As before, the functions take precedence over
+        # the submodules of the same name, which remain accessible via sys.modules.
+        if name in _FUNCTION_MODULES and isinstance(value, types.ModuleType):
+            value = getattr(value, name)
+        super().__setattr__(name, value)
+
+
+sys.modules[__name__].__class__ = _Package
@@ -0,0 +1,49 @@
+import argparse
+import runpy
+import sys
+from typing import List, Optional
+from graphsimqt.utils.get_parsers import get_similarity_parser, get_shortest_path_parser, get_benchmark_parser, \
+    SIMILARITY_DESCRIPTIONS, SHORTEST_PATH_DESCRIPTIONS, BENCHMARK_DESCRIPTION
+
+COMMANDS = {**SIMILARITY_DESCRIPTIONS, **SHORTEST_PATH_DESCRIPTIONS, 'benchmarks': BENCHMARK_DESCRIPTION}
+
+
+def _get_parser(command: str) -> argparse.ArgumentParser:
+    if command in SIMILARITY_DESCRIPTIONS:
+        return get_similarity_parser(command)
+    if command in SHORTEST_PATH_DESCRIPTIONS:
+        return get_shortest_path_parser(command)
+    return get_benchmark_parser()
+
+
+def main(argv: Optional[List[str]] = None):
+    """Runs one of the GraphSimQT commands, e.g., python -m graphsimqt compute_empirical_p_values --dirname NAME.
+
+    The arguments of the command are validated (and --help is answered) before its module is imported, so that
+    invalid calls and help requests do not load any heavy dependencies. The module is then run exactly as via
+    python -m graphsimqt.<command>.
+
+    Parameters
+    ----------
+    argv : list of str, optional
+        Command followed by its arguments. If not provided, sys.argv[1:] is used.
+
+    """
+    if argv is None:
+        argv = sys.argv[1:]
+    commands = '\n'.join(f'  {command:<34}{description}' for command, description in COMMANDS.items())
+    parser = argparse.ArgumentParser('graphsimqt', description='Graph similarity quantification tool.',
+                                     epilog=f'commands:\n{commands}',
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('command', type=str, help='Command to run, see below.', choices=list(COMMANDS),
+                        metavar='command')
+    parser.add_argument('args', nargs=argparse.REMAINDER, help='Arguments of the command. Run python -m graphsimqt '
+                                                               '<command> --help for details.')
+    args = parser.parse_args(argv)
+    _get_parser(args.command).parse_args(args.args)
+    sys.argv = [f'graphsimqt {args.command}'] + args.args
+    runpy.run_module(f'graphsimqt.{args.command}', run_name='__main__', alter_sys=True)
+
+
+if __name__ == '__main__':
+    main()
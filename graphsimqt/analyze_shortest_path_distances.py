@@ -1,4 +1,3 @@
-import scipy.stats as sps
 import pandas as pd
 import numpy as np
 import json
@@ -19,6 +18,7 @@ def analyze_shortest_path_distances(result_directory_name: str, silent: bool = F
         Set to True to suppress printing progress to stdout.
 
     """
+    import scipy.stats as sps
     if not silent:
         spinner = Spinner('Analyzing shortest path distances. ')
         spinner.next()
@@ -0,0 +1,272 @@
+import graph_tool as gt
+import pandas as pd
+import numpy as np
+import json
+import os
+import platform
+import time
+from datetime import datetime
+from typing import List, Optional, Sequence, Tuple, Callable
+from progress.bar import IncrementalBar
+from graphsimqt.normalize_graph import normalize_graph
+from graphsimqt.run_permutation_tests import run_permutation_tests, ENGINES
+from graphsimqt.compute_empirical_p_values import compute_empirical_p_values
+from graphsimqt.compute_mwu_p_values import compute_mwu_p_values
+from graphsimqt.compute_shortest_path_distances import compute_shortest_path_distances
+from graphsimqt.utils.get_directory_paths import get_result_directory_path
+from graphsimqt.utils.run_metrics import collect_run_metrics
+from graphsimqt.utils.get_parsers import get_benchmark_parser
+
+
+GRAPH_MODELS = {'degree_preserving', 'block'}
+
+
+def _get_unique_edges(edges: np.ndarray, is_directed: bool) -> np.ndarray:
+    # Removes self-loops and parallel edges. Returns the indices of the first occurrence of each remaining edge.
+    if not is_directed:
+        edges = np.sort(edges, axis=1)
+    is_loop = edges[:, 0] == edges[:, 1]
+    _, indices = np.unique(edges[~is_loop], axis=0, return_index=True)
+    return np.flatnonzero(~is_loop)[np.sort(indices)]
+
+
+def _sample_edges(rng: np.random.Generator, model: str, num_edges: int, node_weights: np.ndarray, blocks: np.ndarray,
+                  within_block_fraction: float) -> np.ndarray:
+    # 'degree_preserving': the endpoints are drawn proportionally to heavy-tailed node weights (Chung-Lu model).
+    # 'block': the sources are drawn uniformly, and the targets are drawn from the block of the source with
+    # probability within_block_fraction and uniformly otherwise (stochastic block model with fixed edge number).
+    num_nodes = node_weights.shape[0]
+    if model == 'degree_preserving':
+        probabilities = node_weights / node_weights.sum()
+        return rng.choice(num_nodes, size=(num_edges, 2), p=probabilities)
+    sources = rng.integers(0, num_nodes, num_edges)
+    targets = rng.integers(0, num_nodes, num_edges)
+    nodes_by_block = np.argsort(blocks, kind='stable')
+    block_sizes = np.bincount(blocks)
+    block_starts = np.cumsum(block_sizes) - block_sizes
+    is_within = rng.random(num_edges) < within_block_fraction
+    source_blocks = blocks[sources[is_within]]
+    offsets = (rng.random(source_blocks.shape[0]) * block_sizes[source_blocks]).astype(np.int64)
+    targets[is_within] = nodes_by_block[block_starts[source_blocks] + offsets]
+    return np.column_stack((sources, targets))
+
+
+def generate_graph_pair(num_nodes: int, mean_degree: float = 10.0, overlap: float = 0.5,
+                        model: str = 'degree_preserving', num_blocks: int = 10, within_block_fraction: float = 0.8,
+                        is_directed: bool = False, seed: Optional[int] = None) -> Tuple[pd.DataFrame, pd.DataFrame,
+                                                                                         pd.DataFrame]:
+    """Generates a synthetic pair of weighted graphs with controlled size, density, and overlap.
+
+    The first graph is sampled from the given model. The second graph keeps a fraction of overlap of the edges of the
+    first graph, whose scores are perturbed by Gaussian noise, and replaces the remaining edges. For the
+    'degree_preserving' model, the replaced edges are rewired by shuffling their targets, which preserves the degrees
+    of all nodes. For the 'block' model, they are resampled from the stochastic block model.
+
+    Parameters
+    ----------
+    num_nodes : int
+        Number of nodes of both graphs. Nodes without edges do not appear in the edge lists.
+    mean_degree : float, default: 10.0
+        Expected mean degree of the graphs before self-loops and parallel edges are removed.
+    overlap : float, default: 0.5
+        Fraction of the edges of the first graph that are kept in the second graph.
+    model : {'degree_preserving', 'block'}, default: 'degree_preserving'
+        Model used to sample the edges. 'degree_preserving': Chung-Lu model with heavy-tailed expected degrees, where
+        the second graph is a partial degree-preserving rewiring of the first one. 'block': stochastic block model.
+    num_blocks : int, default: 10
+        Number of blocks. The blocks are returned as node sets in both models, but only the 'block' model uses them
+        to sample the edges.
+    within_block_fraction : float, default: 0.8
+        Fraction of the edges within blocks in the 'block' model.
+    is_directed : bool, default: False
+        Specifies if the graphs are directed.
+    seed : int, optional
+        Seed of the random number generator.
+
+    Returns
+    -------
+    edge_list_1, edge_list_2 : pandas.DataFrame
+        Edge lists of the graphs with the columns source, target, and score.
+    node_sets : pandas.DataFrame
+        Block of each node, with the columns node and block.
+
+    """
+    if model not in GRAPH_MODELS:
+        raise ValueError(f'Unsupported graph model {model}.\n'
+                         f'Supported models: {", ".join(GRAPH_MODELS)}.')
+    rng = np.random.default_rng(seed)
+    num_edges = int(round(num_nodes * mean_degree / (1 if is_directed else 2)))
+    blocks = rng.integers(0, num_blocks, num_nodes)
+    node_weights = rng.pareto(2.5, num_nodes) + 1
+    edges_1 = _sample_edges(rng, model, num_edges, node_weights, blocks, within_block_fraction)
+    edges_1 = edges_1[_get_unique_edges(edges_1, is_directed)]
+    scores_1 = rng.random(edges_1.shape[0])
+    is_kept = rng.random(edges_1.shape[0]) < overlap
+    if model == 'degree_preserving':
+        replaced_edges = edges_1[~is_kept].copy()
+        replaced_edges[:, 1] = rng.permutation(replaced_edges[:, 1])
+    else:
+        replaced_edges = _sample_edges(rng, model, int((~is_kept).sum()), node_weights, blocks, within_block_fraction)
+    # The kept edges come first, so that their perturbed scores survive the removal of parallel edges.
+    edges_2 = np.concatenate((edges_1[is_kept], replaced_edges))
+    scores_2 = np.concatenate((np.clip(scores_1[is_kept] + rng.normal(0, 0.1, int(is_kept.sum())), 0.01, None),
+                               rng.random(replaced_edges.shape[0])))
+    unique_edges_2 = _get_unique_edges(edges_2, is_directed)
+    node_ids = np.array([f'n{node}' for node in range(num_nodes)], dtype=object)
+    edge_list_1 = pd.DataFrame(data={'source': node_ids[edges_1[:, 0]], 'target': node_ids[edges_1[:, 1]],
+                                     'score': scores_1})
+    edge_list_2 = pd.DataFrame(data={'source': node_ids[edges_2[unique_edges_2, 0]],
+                                     'target': node_ids[edges_2[unique_edges_2, 1]],
+                                     'score': scores_2[unique_edges_2]})
+    node_sets = pd.DataFrame(data={'node': node_ids, 'block': [f'block_{block}' for block in blocks]})
+    return edge_list_1, edge_list_2, node_sets
+
+
+def _generate_reference_graph(rng: np.random.Generator, node_ids: List[str], num_terminals: int,
+                              is_directed: bool) -> gt.Graph:
+    # Reference graph for the shortest path benchmark: random scored edges among randomly chosen terminals.
+    terminal_ids = rng.choice(np.array(node_ids, dtype=object), min(num_terminals, len(node_ids)), replace=False)
+    edges = rng.integers(0, terminal_ids.shape[0], (2 * terminal_ids.shape[0], 2))
+    edges = edges[_get_unique_edges(edges, is_directed)]
+    reference_graph = gt.Graph(directed=is_directed)
+    reference_graph.add_vertex(terminal_ids.shape[0])
+    reference_graph.vertex_properties['ID'] = reference_graph.new_vp('string', vals=list(terminal_ids))
+    scores = reference_graph.new_ep('double')
+    reference_graph.add_edge_list(np.column_stack((edges, rng.random(edges.shape[0]))), eprops=[scores])
+    reference_graph.edge_properties['SCORE'] = scores
+    return reference_graph
+
+
+def _time_stage(timings: dict, stage: str, function: Callable, *args, **kwargs):
+    start = time.perf_counter()
+    result = function(*args, **kwargs)
+    timings[stage] = time.perf_counter() - start
+    return result
+
+
+def _run_benchmark(result_directory_name: str, num_nodes: int, mean_degree: float, overlap: float, model: str,
+                   is_directed: bool, engine: str, num_permutations: int, num_terminals: int,
+                   shortest_path_engine: str, seed: Optional[int]) -> dict:
+    result_dir_path = get_result_directory_path(result_directory_name)
+    result_dir_path.mkdir(parents=True, exist_ok=True)
+    edge_list_1, edge_list_2, node_sets = generate_graph_pair(num_nodes, mean_degree, overlap, model,
+                                                              is_directed=is_directed, seed=seed)
+    paths_to_graphs = [result_dir_path.joinpath('graph_1.tsv'), result_dir_path.joinpath('graph_2.tsv')]
+    for edge_list, path_to_graph in zip([edge_list_1, edge_list_2], paths_to_graphs):
+        edge_list.to_csv(str(path_to_graph), sep='\t', header=False, index=False)
+    path_to_node_sets = result_dir_path.joinpath('node_sets.tsv')
+    node_sets.to_csv(str(path_to_node_sets), sep='\t', index=False)
+    timings = {}
+    start = time.perf_counter()
+    graph_1, graph_2 = [normalize_graph(path_to_graph, is_directed=is_directed, silent=True, save=False)
+                        for path_to_graph in paths_to_graphs]
+    timings['normalize_graph'] = time.perf_counter() - start
+    # The nested run_permutation_tests() records its stages and permutations into the metrics collected here, from
+    # which the distance and permutation timings are taken.
+    with collect_run_metrics(result_dir_path) as run_metrics:
+        _time_stage(timings, 'run_permutation_tests', run_permutation_tests, graph_1, graph_2, result_directory_name,
+                    num_permutations, True, engine, seed=seed)
+    stages = {stage['stage']: stage for stage in run_metrics.stages}
+    timings['graph_distance'] = stages['run_permutation_tests.graph_distance']['wall_time']
+    timings['permutation_iteration'] = run_metrics.permutations[0]['wall_time'] if run_metrics.permutations else None
+    _time_stage(timings, 'compute_empirical_p_values', compute_empirical_p_values, result_directory_name, silent=True)
+    _time_stage(timings, 'compute_mwu_p_values', compute_mwu_p_values, result_directory_name,
+                paths_to_node_sets=[path_to_node_sets], silent=True)
+    reference_graph = _generate_reference_graph(np.random.default_rng(seed), list(node_sets['node']), num_terminals,
+                                                is_directed)
+    _time_stage(timings, 'compute_shortest_path_distances', compute_shortest_path_distances, reference_graph,
+                gt.Graph(graph_1), result_directory_name, reference_node_id_attribute_name='ID',
+                distance_node_id_attribute_name='ID', reference_edge_score_attribute_name='SCORE', silent=True,
+                engine=shortest_path_engine)
+    return {'num_nodes': num_nodes, 'num_vertices_1': graph_1.num_vertices(), 'num_edges_1': graph_1.num_edges(),
+            'num_vertices_2': graph_2.num_vertices(), 'num_edges_2': graph_2.num_edges(),
+            'num_shared_nodes': stages['run_permutation_tests.prepare']['counts']['num_nodes'], 'timings': timings}
+
+
+def run_benchmarks(result_directory_name: str = 'benchmarks', sizes: Sequence[int] = (1000, 10000, 100000),
+                   mean_degree: float = 10.0, overlap: float = 0.5, model: str = 'degree_preserving',
+                   is_directed: bool = False, engine: str = 'graph_tool', num_permutations: int = 10,
+                   num_terminals: int = 100, shortest_path_engine: str = 'bfs', seed: Optional[int] = 0,
+                   silent: bool = False) -> dict:
+    """Times the stages of the pipeline on synthetic graph pairs and saves the timings as JSON file.
+
+    For each size, a graph pair is generated with generate_graph_pair() and saved as edge lists together with its
+    blocks, which serve as node sets. The following stages are timed (in seconds): normalize_graph (both graphs),
+    run_permutation_tests (with num_permutations permutations), graph_distance (one evaluation of the distance engine
+    for all distance types) and permutation_iteration (the first permutation of both graphs including the distances)
+    as recorded in the run metrics of run_permutation_tests, compute_empirical_p_values, compute_mwu_p_values
+    (including the block node sets), and compute_shortest_path_distances (between num_terminals random nodes of the
+    first graph). The timings are saved to benchmark_results.json in the result directory, together with the
+    parameters and the versions of the main dependencies, so that they can be compared across versions.
+
+    Parameters
+    ----------
+    result_directory_name : str, default: 'benchmarks'
+        Name of the subdirectory of the results/ directory where the results should be saved. The graphs and the
+        results of the individual stages are saved in subdirectories nodes_<size>.
+    sizes : sequence of int, default: (1000, 10000, 100000)
+        Numbers of nodes of the generated graph pairs.
+    mean_degree : float, default: 10.0
+        Expected mean degree of the generated graphs.
+    overlap : float, default: 0.5
+        Fraction of shared edges of the generated graphs.
+    model : {'degree_preserving', 'block'}, default: 'degree_preserving'
+        Model used to generate the graphs. See generate_graph_pair() for details.
+    is_directed : bool, default: False
+        Specifies if the generated graphs are directed.
+    engine : {'graph_tool', 'sparse', 'incremental'}, default: 'graph_tool'
+        Engine used to compute the distances.
+        See graphsimqt.run_permutation_tests.run_permutation_tests() for details.
+    num_permutations : int, default: 10
+        Number of permutations of the timed permutation tests.
+    num_terminals : int, default: 100
+        Number of nodes of the reference graph of the timed shortest path computation.
+    shortest_path_engine : {'pairwise', 'bfs', 'landmark'}, default: 'bfs'
+        Engine used to compute the shortest path distances.
+        See graphsimqt.compute_shortest_path_distances.compute_shortest_path_distances() for details.
+    seed : int, optional, default: 0
+        Seed used to generate the graphs and to run the permutations.
+    silent : bool, default: False
+        Set to True to suppress printing progress to stdout.
+
+    Returns
+    -------
+    benchmark_results : dict
+        Timings saved to benchmark_results.json.
+
+    """
+    if engine not in ENGINES:
+        raise ValueError(f'Unsupported distance engine {engine}.\n'
+                         f'Supported engines: {", ".join(ENGINES)}.')
+    benchmark_results = {'created': datetime.now().isoformat(timespec='seconds'),
+                         'environment': {'python': platform.python_version(), 'platform': platform.platform(),
+                                         'cpu_count': os.cpu_count(), 'numpy': np.__version__,
+                                         'pandas': pd.__version__, 'graph_tool': getattr(gt, '__version__', None)},
+                         'parameters': {'mean_degree': mean_degree, 'overlap': overlap, 'model': model,
+                                        'is_directed': is_directed, 'engine': engine,
+                                        'num_permutations': num_permutations, 'num_terminals': num_terminals,
+                                        'shortest_path_engine': shortest_path_engine, 'seed': seed},
+                         'results': []}
+    if not silent:
+        bar = IncrementalBar('Running benchmarks.', max=len(sizes))
+    for num_nodes in sizes:
+        benchmark_results['results'].append(_run_benchmark(f'{result_directory_name}/nodes_{num_nodes}', num_nodes,
+                                                           mean_degree, overlap, model, is_directed, engine,
+                                                           num_permutations, num_terminals, shortest_path_engine,
+                                                           seed))
+        if not silent:
+            bar.next()
+    if not silent:
+        bar.finish()
+    path_to_benchmark_results = get_result_directory_path(result_directory_name).joinpath('benchmark_results.json')
+    with open(str(path_to_benchmark_results), 'w') as fp:
+        json.dump(benchmark_results, fp, indent=2)
+    if not silent:
+        print(f'Saved benchmark results to {str(path_to_benchmark_results)}.')
+    return benchmark_results
+
+
+if __name__ == '__main__':
+    args = get_benchmark_parser().parse_args()
+    run_benchmarks(args.dirname, args.sizes, args.mean_degree, args.overlap, args.model, args.directed, args.engine,
+                   args.permutations, args.terminals, args.shortest_path_engine, args.seed, args.silent)
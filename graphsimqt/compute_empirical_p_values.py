@@ -1,36 +1,67 @@
 import pandas as pd
-import itertools as itt
+import numpy as np
+import json
+from pathlib import Path
+from typing import List, Optional
 from progress.spinner import Spinner
-from progress.bar import IncrementalBar
 from graphsimqt.utils.compute_adjusted_p_values import compute_adjusted_p_values
 from graphsimqt.utils.get_directory_paths import get_result_directory_path
+from graphsimqt.utils.local_distance_store import load_local_distances
+from graphsimqt.utils.run_metrics import collect_run_metrics, measure_stage
 from graphsimqt.utils.get_parsers import get_similarity_parser
 
 
-def _compute_empirical_p_value(distances: pd.DataFrame, selection: pd.Series):
-    true_distance = distances['distance'][selection & ~distances['permuted']].to_numpy()[0]
-    num_leq = distances[selection & (distances['distance'] <= true_distance)].shape[0]
-    return num_leq / distances[selection].shape[0]
+def _compute_empirical_p_values(distances: pd.DataFrame, keys: List[str],
+                                stopped_distance_types: Optional[List[str]] = None) -> pd.DataFrame:
+    # Broadcasts the unpermuted distance of each group to all rows of the group and counts the permuted distances that
+    # are at least as small in one grouped pass. The groups may contain different numbers of permutations, e.g., if
+    # the permutation tests have been stopped early for some distance types.
+    groups = [distances[key] for key in keys]
+    true_distances = distances['distance'].where(~distances['permuted']).groupby(groups, sort=False).transform('first')
+    is_leq = (distances['distance'] <= true_distances).rename('p_value')
+    p_values = is_leq.groupby(groups, sort=False).mean().reset_index()
+    p_values['num_permutations'] = distances['permuted'].groupby(groups, sort=False).sum().to_numpy()
+    if stopped_distance_types:
+        # Distance types stopped at their h-th permuted distance that is at most as small as the unpermuted one after
+        # l permutations have the Besag-Clifford p-value h / l.
+        is_stopped = p_values['distance_type'].isin(stopped_distance_types).to_numpy()
+        num_leq = is_leq.groupby(groups, sort=False).sum().to_numpy() - 1
+        p_values.loc[is_stopped, 'p_value'] = num_leq[is_stopped] / p_values['num_permutations'].to_numpy()[is_stopped]
+    return p_values
+
+
+def _load_stopped_distance_types(result_dir_path: Path) -> List[str]:
+    path_to_checkpoint = result_dir_path.joinpath('checkpoint.json')
+    if not path_to_checkpoint.exists():
+        return []
+    with open(str(path_to_checkpoint)) as fp:
+        return json.load(fp).get('stopped_distance_types', [])
+
+
+def _compute_empirical_p_values_from_matrix(distances: np.ndarray, block_size: int = 100) -> np.ndarray:
+    # The rows of the (memory-mapped) matrix are processed block-wise to bound the memory usage.
+    true_distances = np.asarray(distances[0])
+    num_leq = np.zeros(distances.shape[1], dtype=np.int64)
+    for start in range(0, distances.shape[0], block_size):
+        num_leq += (np.asarray(distances[start:start + block_size]) <= true_distances).sum(axis=0)
+    return num_leq / distances.shape[0]
 
 
 def _compute_global_empirical_p_values(result_directory_name: str, silent: bool):
     if not silent:
         spinner = Spinner('Computating global empirical p-values. ')
         spinner.next()
-    result_dir_path = get_result_directory_path(result_directory_name)
-    path_to_global_distances = result_dir_path.joinpath('global_distances.csv')
-    global_distances = pd.read_csv(str(path_to_global_distances))
-    distance_types = list(set(global_distances['distance_type']))
-    p_values = {'distance_type': [], 'p_value': []}
-    for distance_type in distance_types:
+    with measure_stage('compute_empirical_p_values.global') as counts:
+        result_dir_path = get_result_directory_path(result_directory_name)
+        path_to_global_distances = result_dir_path.joinpath('global_distances.csv')
+        global_distances = pd.read_csv(str(path_to_global_distances))
         if not silent:
             spinner.next()
-        selection = (global_distances['distance_type'] == distance_type)
-        p_values['distance_type'].append(distance_type)
-        p_values['p_value'].append(_compute_empirical_p_value(global_distances, selection))
-    p_values = pd.DataFrame(data=p_values)
-    path_to_global_p_values = result_dir_path.joinpath('global_empirical_p_values.csv')
-    p_values.to_csv(str(path_to_global_p_values), index=False)
+        p_values = _compute_empirical_p_values(global_distances, ['distance_type'],
+                                               _load_stopped_distance_types(result_dir_path))
+        counts.update(num_rows=global_distances.shape[0], num_distance_types=p_values.shape[0])
+        path_to_global_p_values = result_dir_path.joinpath('global_empirical_p_values.csv')
+        p_values.to_csv(str(path_to_global_p_values), index=False)
     if not silent:
         spinner.finish()
         print(f'Saved global empirical p-values to {str(path_to_global_p_values)}.')
@@ -40,42 +71,49 @@ def _compute_local_empirical_p_values(result_directory_name: str, adjust_method:
     if not silent:
         spinner = Spinner('Preparing computation of local empirical p-values. ')
         spinner.next()
-    result_dir_path = get_result_directory_path(result_directory_name)
-    path_to_local_distances = result_dir_path.joinpath('local_distances.csv')
-    local_distances = pd.read_csv(str(path_to_local_distances))
-    distance_types = list(set(local_distances['distance_type']))
-    node_ids = list(set(local_distances['node']))
-    if not silent:
-        spinner.next()
-    p_values = {'node': [], 'distance_type': [], 'p_value': []}
-    if not silent:
-        spinner.finish()
-        bar = IncrementalBar('Computing local empirical p-values.', max=len(node_ids) * len(distance_types))
-    for node_id, distance_type in itt.product(node_ids, distance_types):
+    with measure_stage('compute_empirical_p_values.local') as counts:
+        result_dir_path = get_result_directory_path(result_directory_name)
+        node_ids, local_distances = load_local_distances(result_dir_path)
+        counts.update(num_nodes=len(node_ids), num_distance_types=len(local_distances))
         if not silent:
-            bar.next()
-        selection = (local_distances['distance_type'] == distance_type) & (local_distances['node'] == node_id)
-        p_values['node'].append(node_id)
-        p_values['distance_type'].append(distance_type)
-        p_values['p_value'].append(_compute_empirical_p_value(local_distances, selection))
-    if not silent:
-        bar.finish()
-        spinner = Spinner('Computing adjusted p-values and saving results. ')
-        spinner.next()
-    p_values = pd.DataFrame(data=p_values)
-    compute_adjusted_p_values(p_values, adjust_method)
-    if not silent:
-        spinner.next()
-    path_to_local_p_values = result_dir_path.joinpath('local_empirical_p_values.csv')
-    p_values.to_csv(str(path_to_local_p_values), index=False)
+            spinner.finish()
+            spinner = Spinner('Computing local empirical p-values. ')
+            spinner.next()
+        # The local distances of distance types stopped early are only available for the permutations carried out
+        # before the global statistic stopped them, so their local p-values are based on this number of permutations.
+        p_values = []
+        for distance_type, distances in local_distances.items():
+            if not silent:
+                spinner.next()
+            p_values.append(pd.DataFrame(data={'node': node_ids, 'distance_type': distance_type,
+                                               'p_value': _compute_empirical_p_values_from_matrix(distances),
+                                               'num_permutations': distances.shape[0] - 1}))
+        p_values = pd.concat(p_values, ignore_index=True)
+        if not silent:
+            spinner.finish()
+            spinner = Spinner('Computing adjusted p-values and saving results. ')
+            spinner.next()
+        compute_adjusted_p_values(p_values, adjust_method)
+        if not silent:
+            spinner.next()
+        path_to_local_p_values = result_dir_path.joinpath('local_empirical_p_values.csv')
+        p_values.to_csv(str(path_to_local_p_values), index=False)
     if not silent:
         spinner.finish()
         print(f'Saved local empirical p-values to {str(path_to_local_p_values)}.')
 
 
-def compute_empirical_p_values(result_directory_name: str, adjust_method: str = 'holm-sidak', silent: bool = False):
+def compute_empirical_p_values(result_directory_name: str, adjust_method: str = 'holm-sidak', silent: bool = False,
+                               profiler: Optional[str] = None):
     """Computes empirical p-values and saves them as CSV files.
 
+    The p-value of each distance type is computed from the permutations carried out for this type, whose number is
+    saved in the column num_permutations. The global p-values of distance types whose permutation tests have been
+    stopped early are computed as h / l (see graphsimqt.run_permutation_tests.run_permutation_tests()). Their local
+    p-values are ordinary empirical p-values computed from the l permutations, i.e., from a number of permutations
+    chosen by the global statistic rather than by the local ones. The wall time, CPU time, peak memory, and item counts
+    of the stages are saved to run_metrics.json, see graphsimqt.utils.run_metrics.
+
     Parameters
     ----------
     result_directory_name : str
@@ -86,12 +124,16 @@ def compute_empirical_p_values(result_directory_name: str, adjust_method: str =
         Can be set to any of the methods available in statsmodels.stats.multitest.multipletests().
     silent : bool, default: False
         Set to True to suppress printing progress to stdout.
+    profiler : {'cprofile', 'pyinstrument'}, optional
+        If provided, the run is profiled and the profile is saved to the result directory.
+        See graphsimqt.utils.run_metrics.collect_run_metrics() for details.
 
     """
-    _compute_global_empirical_p_values(result_directory_name, silent)
-    _compute_local_empirical_p_values(result_directory_name, adjust_method, silent)
+    with collect_run_metrics(get_result_directory_path(result_directory_name), profiler):
+        _compute_global_empirical_p_values(result_directory_name, silent)
+        _compute_local_empirical_p_values(result_directory_name, adjust_method, silent)
 
 
 if __name__ == '__main__':
     args = get_similarity_parser('compute_empirical_p_values').parse_args()
-    compute_empirical_p_values(args.dirname, args.adjust, args.silent)
+    compute_empirical_p_values(args.dirname, args.adjust, args.silent, args.profile)
@@ -3,12 +3,21 @@ import graph_tool.topology as gtt
 from typing import Union, Tuple, Optional, List, Dict, Sequence
 from pathlib import Path
 import pandas as pd
-import itertools as itt
 import numpy as np
+import multiprocessing as mp
+import contextlib
+import os
+import json
 from progress.spinner import Spinner
 from progress.bar import IncrementalBar
 from graphsimqt.utils.get_directory_paths import get_result_directory_path
 from graphsimqt.utils.get_parsers import get_shortest_path_parser
+from graphsimqt.utils.graph_snapshot import GraphSnapshot, is_graph_snapshot
+from graphsimqt.utils.node_alignment import NodeAlignment
+from graphsimqt.utils.run_metrics import collect_run_metrics, measure_stage
+
+
+_worker_state = {}
 
 
 def _get_node_ids(graph: gt.Graph, node_id_attribute_name: Optional[str]) -> gt.VertexPropertyMap:
@@ -40,52 +49,249 @@ def _get_attributes(reference_graph: gt.Graph, distance_graph: gt.Graph,
     return ref_ids, dist_ids, ref_scores
 
 
-def _initialize_node_filter(distance_graph: gt.Graph, exclude_as_connectors: Optional[Sequence[Tuple[str, str]]],
-                            exclude_terminals: bool, ref_ids: gt.VertexPropertyMap,
-                            dist_ids: gt.VertexPropertyMap) -> gt.VertexPropertyMap:
-    node_filter = distance_graph.new_vp('boolean', val=False)
-    if exclude_as_connectors:
+def _get_connector_exclusions(exclude_as_connectors: Optional[Union[Tuple[str, str], Sequence[Tuple[str, str]]]]
+                              ) -> Dict[str, List[str]]:
+    # Accepts a single key-value pair or a sequence of pairs and groups the excluded values by attribute name.
+    if not exclude_as_connectors:
+        return {}
+    if len(exclude_as_connectors) == 2 and all(isinstance(item, str) for item in exclude_as_connectors):
+        exclude_as_connectors = [exclude_as_connectors]
+    exclusions = {}
+    for attribute_name, value in exclude_as_connectors:
+        exclusions.setdefault(attribute_name, []).append(value)
+    return exclusions
 
-        for node in distance_graph.vertices():
-            node_filter[node] = (distance_graph.vp[exclude_as_connectors[0]][node] == exclude_as_connectors[1])
-            # modify here to be able to filter for two dif. node types
-            # for c in exclude_as_connectors:
-            #     node_filter[node] = (distance_graph.vp[c[0]][node] == c[1])
+
+def _initialize_node_filter(distance_graph: Union[gt.Graph, GraphSnapshot],
+                            exclude_as_connectors: Optional[Union[Tuple[str, str], Sequence[Tuple[str, str]]]],
+                            exclude_terminals: bool, alignment: NodeAlignment) -> Union[gt.VertexPropertyMap,
+                                                                                        np.ndarray]:
+    # The values of each attribute are factorized once, so that all excluded values are matched in a single pass.
+    # The node filter of a graph snapshot is the boolean array of the excluded nodes.
+    is_excluded = np.zeros(distance_graph.num_vertices(), dtype=bool)
+    for attribute_name, values in _get_connector_exclusions(exclude_as_connectors).items():
+        if isinstance(distance_graph, GraphSnapshot) and attribute_name not in distance_graph.vp:
+            raise ValueError(f'Graph snapshots contain no node attribute {attribute_name}, only ID.\n'
+                             f'Please provide the distance graph as graph_tool.Graph or file to exclude connectors.')
+        codes, uniques = pd.factorize(np.array(list(distance_graph.vp[attribute_name]), dtype=object))
+        value_codes = pd.Index(uniques).get_indexer(values)
+        is_excluded |= np.isin(codes, value_codes[value_codes >= 0])
     if exclude_terminals:
-        ref_ids_as_set = set(ref_ids)
-        for node in distance_graph.vertices():
-            node_filter[node] = (node_filter[node] or (dist_ids[node] in ref_ids_as_set))
+        is_excluded |= alignment.is_shared_1
+    if isinstance(distance_graph, GraphSnapshot):
+        return is_excluded
+    node_filter = distance_graph.new_vp('boolean', val=False)
+    node_filter.a = is_excluded
     distance_graph.set_vertex_filter(node_filter, inverted=True)
     return node_filter
 
 
-def _get_terminals(distance_graph: gt.Graph, ref_ids: gt.VertexPropertyMap,
-                   dist_ids: gt.VertexPropertyMap) -> List[gt.Vertex]:
-    dist_ids_to_nodes = {dist_ids[node]: node for node in distance_graph.vertices()}
-    terminals = [dist_ids_to_nodes[node_id] for node_id in set(ref_ids).intersection(set(dist_ids))]
-    terminals = [node for node in terminals if distance_graph.get_total_degrees([node])[0] > 0]
-    return terminals
+def _get_is_filtered(node_filter: Union[gt.VertexPropertyMap, np.ndarray]) -> np.ndarray:
+    if isinstance(node_filter, np.ndarray):
+        return node_filter
+    return node_filter.a.astype(bool)
+
 
+def _get_terminals(distance_graph: Union[gt.Graph, GraphSnapshot], alignment: NodeAlignment) -> List[gt.Vertex]:
+    degrees = distance_graph.get_total_degrees(alignment.shared_vertices_1)
+    return [distance_graph.vertex(index) for index in alignment.shared_vertices_1[degrees > 0].tolist()]
 
-def _compute_distance(reference_graph: gt.Graph, distance_graph: gt.Graph, dist_ids: gt.VertexPropertyMap,
-                      ref_ids_to_nodes: Dict[str, gt.Vertex], node_filter: gt.VertexPropertyMap, source: gt.Vertex,
-                      target: gt.Vertex, edge_scores: Optional[gt.EdgePropertyMap], distances: Dict[str, list]):
+
+def _compute_pair_distance(distance_graph: gt.Graph, node_filter: gt.VertexPropertyMap, source: gt.Vertex,
+                           target: gt.Vertex, max_distance: Optional[int]) -> Union[int, float]:
     filter_source = node_filter[source]
     filter_target = node_filter[target]
     node_filter[source] = node_filter[target] = False
-    distance = gtt.shortest_distance(distance_graph, source, target, directed=False)
-    if distance > distance_graph.num_vertices():
+    distance = gtt.shortest_distance(distance_graph, source, target, directed=False, max_dist=max_distance)
+    if distance > distance_graph.num_vertices() or (max_distance is not None and distance > max_distance):
         distance = np.inf
     node_filter[source] = filter_source
     node_filter[target] = filter_target
+    return distance
+
+
+def _get_terminal_positions(distance_graph: gt.Graph, terminals: List[gt.Vertex]) -> np.ndarray:
+    terminal_positions = np.full(distance_graph.num_vertices(), -1, dtype=np.int64)
+    terminal_positions[[int(node) for node in terminals]] = np.arange(len(terminals))
+    return terminal_positions
+
+
+def _get_terminal_edges(distance_graph: gt.Graph, terminals: List[gt.Vertex]) -> Tuple[np.ndarray, np.ndarray]:
+    # Returns the neighbors and terminal positions of all (unfiltered) edges incident to terminals, in both directions.
+    terminal_positions = _get_terminal_positions(distance_graph, terminals)
+    edges = distance_graph.get_edges().astype(np.int64)
+    neighbors = np.concatenate((edges[:, 0], edges[:, 1]))
+    positions = np.concatenate((terminal_positions[edges[:, 1]], terminal_positions[edges[:, 0]]))
+    is_terminal_edge = positions >= 0
+    return neighbors[is_terminal_edge], positions[is_terminal_edge]
+
+
+def _apply_max_distance(distances: np.ndarray, max_distance: Optional[int]) -> np.ndarray:
+    if max_distance is not None:
+        distances[distances > max_distance] = np.inf
+    return distances
+
+
+def _compute_snapshot_node_distances(snapshot: GraphSnapshot, is_filtered: np.ndarray, source: int,
+                                     max_distance: Optional[int]) -> np.ndarray:
+    # Level-synchronous BFS on the undirected CSR arrays of the snapshot, in which only the source may be filtered.
+    indptr, indices = snapshot.get_undirected_csr()
+    node_distances = np.full(snapshot.num_vertices(), np.inf)
+    node_distances[source] = 0
+    frontier = np.array([source], dtype=np.int64)
+    distance = 0
+    while frontier.shape[0] > 0 and (max_distance is None or distance < max_distance):
+        starts = indptr[frontier].astype(np.int64)
+        counts = indptr[frontier + 1].astype(np.int64) - starts
+        offsets = np.repeat(starts - np.cumsum(counts) + counts, counts) + np.arange(counts.sum())
+        frontier = np.unique(indices[offsets]).astype(np.int64)
+        frontier = frontier[~is_filtered[frontier] & (node_distances[frontier] == np.inf)]
+        distance += 1
+        node_distances[frontier] = distance
+    return node_distances
+
+
+def _compute_bfs_distances(distance_graph: Union[gt.Graph, GraphSnapshot],
+                           node_filter: Union[gt.VertexPropertyMap, np.ndarray], source: gt.Vertex,
+                           num_terminals: int, neighbors: np.ndarray, positions: np.ndarray,
+                           max_distance: Optional[int]) -> np.ndarray:
+    # Runs a single BFS from the source in the filtered graph, where the source is admitted temporarily. Since the
+    # targets may be filtered, their distances are obtained from the distances of their admitted neighbors.
+    if isinstance(distance_graph, GraphSnapshot):
+        node_distances = _compute_snapshot_node_distances(distance_graph, node_filter, source, max_distance)
+        node_distances[node_filter] = np.inf
+        node_distances[source] = 0
+    else:
+        filter_source = node_filter[source]
+        node_filter[source] = False
+        node_distances = gtt.shortest_distance(distance_graph, source, directed=False,
+                                               max_dist=max_distance).a.astype(np.float64)
+        node_distances[node_filter.a.astype(bool)] = np.inf
+        node_distances[node_distances > distance_graph.num_vertices()] = np.inf
+        node_filter[source] = filter_source
+    terminal_distances = np.full(num_terminals, np.inf)
+    np.minimum.at(terminal_distances, positions, node_distances[neighbors] + 1)
+    return _apply_max_distance(terminal_distances, max_distance)
+
+
+def _select_landmarks(distance_graph: Union[gt.Graph, GraphSnapshot],
+                      node_filter: Union[gt.VertexPropertyMap, np.ndarray], num_landmarks: int) -> List[gt.Vertex]:
+    # The admitted nodes with the highest degrees are used as landmarks, since many shortest paths pass through them.
+    admitted_nodes = np.flatnonzero(~_get_is_filtered(node_filter))
+    degrees = distance_graph.get_total_degrees(admitted_nodes)
+    order = np.argsort(-degrees, kind='stable')[:num_landmarks]
+    return [distance_graph.vertex(index) for index in admitted_nodes[order]]
+
+
+def _compute_landmark_distances(distance_graph: gt.Graph, node_filter: gt.VertexPropertyMap,
+                                terminals: List[gt.Vertex], landmarks: List[gt.Vertex], neighbors: np.ndarray,
+                                positions: np.ndarray) -> np.ndarray:
+    # Returns the matrix of shape (landmarks, terminals) of the exact distances between landmarks and terminals.
+    terminal_positions = {int(node): position for position, node in enumerate(terminals)}
+    landmark_distances = np.empty((len(landmarks), len(terminals)))
+    for row, landmark in enumerate(landmarks):
+        landmark_distances[row] = _compute_bfs_distances(distance_graph, node_filter, landmark, len(terminals),
+                                                         neighbors, positions, None)
+        if int(landmark) in terminal_positions:
+            landmark_distances[row, terminal_positions[int(landmark)]] = 0
+    return landmark_distances
+
+
+def _get_adjacent_terminals(distance_graph: gt.Graph, terminals: List[gt.Vertex], neighbors: np.ndarray,
+                            positions: np.ndarray) -> List[np.ndarray]:
+    # Returns the positions of the terminals adjacent to each terminal, whose distances are known to be 1.
+    neighbor_positions = _get_terminal_positions(distance_graph, terminals)[neighbors]
+    is_adjacent = neighbor_positions >= 0
+    source_positions = positions[is_adjacent]
+    order = np.argsort(source_positions, kind='stable')
+    bounds = np.searchsorted(source_positions[order], np.arange(1, len(terminals)))
+    return np.split(neighbor_positions[is_adjacent][order], bounds)
+
+
+def _estimate_distances_from_source(landmark_distances: np.ndarray, adjacent_terminals: List[np.ndarray],
+                                    source_position: int, max_distance: Optional[int]) -> np.ndarray:
+    # The estimates min_L d(source, L) + d(L, target) are upper bounds of the exact distances, since the paths via the
+    # landmarks only contain admitted inner nodes. Distances between adjacent terminals are exact.
+    estimates = (landmark_distances[:, [source_position]] + landmark_distances).min(axis=0)
+    estimates[adjacent_terminals[source_position]] = 1
+    return _apply_max_distance(estimates, max_distance)
+
+
+def _to_distance_list(terminal_distances: np.ndarray) -> List[Union[int, float]]:
+    return [int(distance) if distance < np.inf else np.inf for distance in terminal_distances]
+
+
+def _compute_distances_from_source(distance_graph: gt.Graph, node_filter: gt.VertexPropertyMap,
+                                   terminals: List[gt.Vertex], source_position: int, engine: str,
+                                   neighbors: Optional[np.ndarray], positions: Optional[np.ndarray],
+                                   max_distance: Optional[int]) -> List[Union[int, float]]:
+    # Returns the distances from the source to all terminals after it in the list of terminals.
+    source = terminals[source_position]
+    if engine == 'pairwise':
+        return [_compute_pair_distance(distance_graph, node_filter, source, target, max_distance)
+                for target in terminals[source_position + 1:]]
+    terminal_distances = _compute_bfs_distances(distance_graph, node_filter, source, len(terminals), neighbors,
+                                                positions, max_distance)
+    return _to_distance_list(terminal_distances[source_position + 1:])
+
+
+def _initialize_worker(distance_graph: Union[gt.Graph, GraphSnapshot], is_filtered: np.ndarray,
+                       terminal_indices: List[int], engine: str, neighbors: Optional[np.ndarray],
+                       positions: Optional[np.ndarray], max_distance: Optional[int]):
+    # Each worker holds its own copy of the distance graph, so that the node filter can be toggled independently.
+    # Graph snapshots are never modified and hence mapped by all workers.
+    if isinstance(distance_graph, GraphSnapshot):
+        node_filter = is_filtered
+    else:
+        node_filter = distance_graph.new_vp('boolean', vals=is_filtered)
+        distance_graph.set_vertex_filter(node_filter, inverted=True)
+    _worker_state['args'] = (distance_graph, node_filter, [distance_graph.vertex(index) for index in terminal_indices],
+                             engine, neighbors, positions, max_distance)
+
+
+def _compute_distances_from_source_in_worker(source_position: int) -> List[Union[int, float]]:
+    distance_graph, node_filter, terminals, engine, neighbors, positions, max_distance = _worker_state['args']
+    return _compute_distances_from_source(distance_graph, node_filter, terminals, source_position, engine, neighbors,
+                                          positions, max_distance)
+
+
+def _compute_landmark_error_report(distance_graph: gt.Graph, node_filter: gt.VertexPropertyMap,
+                                   terminals: List[gt.Vertex], landmarks: List[gt.Vertex],
+                                   landmark_distances: np.ndarray, adjacent_terminals: List[np.ndarray],
+                                   neighbors: np.ndarray, positions: np.ndarray,
+                                   max_distance: Optional[int], num_error_samples: int, seed: Optional[int],
+                                   dist_ids: gt.VertexPropertyMap) -> dict:
+    # Compares the estimated distances from randomly sampled source terminals to the exact BFS distances.
+    rng = np.random.default_rng(seed)
+    num_sources = min(num_error_samples, len(terminals))
+    source_positions = np.sort(rng.choice(len(terminals), num_sources, replace=False))
+    exact, estimated = [], []
+    for source_position in source_positions:
+        is_target = np.arange(len(terminals)) != source_position
+        exact.append(_compute_bfs_distances(distance_graph, node_filter, terminals[source_position], len(terminals),
+                                            neighbors, positions, max_distance)[is_target])
+        estimated.append(_estimate_distances_from_source(landmark_distances, adjacent_terminals, source_position,
+                                                         max_distance)[is_target])
+    exact = np.concatenate(exact) if exact else np.empty(0)
+    estimated = np.concatenate(estimated) if estimated else np.empty(0)
+    is_finite = (exact < np.inf) & (estimated < np.inf)
+    errors = estimated[is_finite] - exact[is_finite]
+    return {'num_landmarks': len(landmarks), 'landmarks': [dist_ids[landmark] for landmark in landmarks],
+            'max_distance': max_distance, 'num_sampled_sources': int(num_sources), 'num_pairs': int(exact.shape[0]),
+            'num_exact_pairs': int((exact == estimated).sum()), 'num_finite_pairs': int(is_finite.sum()),
+            'num_missed_pairs': int(((exact < np.inf) & (estimated == np.inf)).sum()),
+            'mean_absolute_error': float(errors.mean()) if errors.shape[0] > 0 else None,
+            'max_absolute_error': float(errors.max()) if errors.shape[0] > 0 else None,
+            'mean_relative_error': float((errors / exact[is_finite]).mean()) if errors.shape[0] > 0 else None}
+
+
+def _add_reference_edge(reference_graph: gt.Graph, dist_ids: gt.VertexPropertyMap, alignment: NodeAlignment,
+                        source: gt.Vertex, target: gt.Vertex, distance: float,
+                        edge_scores: Optional[gt.EdgePropertyMap], distances: Dict[str, list]):
     distances['source'].append(dist_ids[source])
     distances['target'].append(dist_ids[target])
     distances['distance'].append(distance)
-    # if distance_graph.vp['TYPE'][source] == 'drug':
-    #     edge = reference_graph.edge(ref_ids_to_nodes[dist_ids[source]], ref_ids_to_nodes[dist_ids[target]])
-    # elif distance_graph.vp['TYPE'][source] == 'disease':
-    #     edge = reference_graph.edge(ref_ids_to_nodes[dist_ids[target]], ref_ids_to_nodes[dist_ids[source]])
-    edge = reference_graph.edge(ref_ids_to_nodes[dist_ids[source]], ref_ids_to_nodes[dist_ids[target]])
+    edge = reference_graph.edge(alignment.index_2_of_1[int(source)], alignment.index_2_of_1[int(target)])
     distances['reference_edge'].append(bool(edge))
     if edge and edge_scores:
         distances['reference_score'].append(edge_scores[edge])
@@ -94,20 +300,30 @@ def _compute_distance(reference_graph: gt.Graph, distance_graph: gt.Graph, dist_
 
 
 def compute_shortest_path_distances(reference_graph: Union[str, Path, gt.Graph],
-                                    distance_graph: Union[str, Path, gt.Graph],
+                                    distance_graph: Union[str, Path, gt.Graph, GraphSnapshot],
                                     result_directory_name: str, reference_node_id_attribute_name: Optional[str] = None,
                                     distance_node_id_attribute_name: Optional[str] = None,
                                     reference_edge_score_attribute_name: Optional[str] = None,
                                     exclude_terminals: bool = True,
-                                    exclude_as_connectors: Optional[Sequence[Tuple[str, str]]] = None, silent: bool = False):
+                                    exclude_as_connectors: Optional[Union[Tuple[str, str],
+                                                                          Sequence[Tuple[str, str]]]] = None,
+                                    silent: bool = False,
+                                    engine: str = 'pairwise', n_jobs: int = 1, max_distance: Optional[int] = None,
+                                    num_landmarks: int = 16, num_error_samples: int = 10, seed: Optional[int] = None,
+                                    profiler: Optional[str] = None):
     """Computes shortest path distances.
 
+    The wall time, CPU time, peak memory, and item counts of the stages are saved to run_metrics.json in the result
+    directory, see graphsimqt.utils.run_metrics.
+
     Parameters
     ----------
     reference_graph : str or pathlib.Path or graph_tool.Graph
         Path to reference graph. Distances are computed for all pairs of nodes contained in this graph.
-    distance_graph : srr or pathlib.Path or graph_tool.Graph
-        Path to graph in which the distances should be computed.
+    distance_graph : srr or pathlib.Path or graph_tool.Graph or graphsimqt.utils.graph_snapshot.GraphSnapshot
+        Path to graph in which the distances should be computed. Can also be a graph snapshot or the path to a
+        snapshot directory, see graphsimqt.utils.graph_snapshot. Snapshots are supported by the 'bfs' and 'landmark'
+        engines and only contain the node attribute ID.
     result_directory_name : str
         Name of the subdirectory of the results/ directory where the results should be saved.
         Will be created if it does not exist already.
@@ -122,61 +338,167 @@ def compute_shortest_path_distances(reference_graph: Union[str, Path, gt.Graph],
         If not provided, unique node attribute is used if available.
     exclude_terminals : bool, default: True
         Specifies whether to exclude terminals as inner nodes in shortest paths.
-    exclude_as_connectors : tuple of (str, str), optional
-        Key-value pair, where the key is a node attribute name in the distance graph.
-        All nodes with the specified value are excluded as inner nodes in the shortest paths.
+    exclude_as_connectors : tuple of (str, str) or sequence of tuples of (str, str), optional
+        Key-value pair or sequence of key-value pairs, where the keys are node attribute names in the distance graph.
+        All nodes with any of the specified values are excluded as inner nodes in the shortest paths.
     silent : bool
         Set to True to suppress printing progress to stdout.
+    engine : {'pairwise', 'bfs', 'landmark'}, default: 'pairwise'
+        Engine used to compute the distances. 'pairwise': one shortest path search per pair of terminals.
+        'bfs': one breadth-first search per source terminal, from which the distances to all remaining terminals are
+        read off. Both engines yield the same distances, but 'bfs' is much faster for large numbers of terminals.
+        'landmark': approximate distances. One breadth-first search is run per landmark (the admitted nodes with the
+        highest degrees) and the distance between two terminals is estimated by the shortest path via a landmark,
+        which is an upper bound of the exact distance. The estimation error is measured on the distances from
+        num_error_samples randomly sampled source terminals, which are also computed exactly, and saved to
+        landmark_error_report.json.
+    n_jobs : int, default: 1
+        Number of worker processes among which the source terminals are split. Each worker holds its own copy of the
+        distance graph, except for snapshots, which are mapped by all workers. Set to -1 to use all available CPUs.
+        The results do not depend on the number of workers. Not used by the 'landmark' engine.
+    max_distance : int, optional
+        If provided, the searches are stopped at this depth and the distances of pairs that are farther apart are
+        reported as inf.
+    num_landmarks : int, default: 16
+        Number of landmarks used by the 'landmark' engine.
+    num_error_samples : int, default: 10
+        Number of source terminals used to measure the error of the 'landmark' engine.
+    seed : int, optional
+        Seed used to sample the source terminals for the error report of the 'landmark' engine.
+    profiler : {'cprofile', 'pyinstrument'}, optional
+        If provided, the run is profiled and the profile is saved to the result directory.
+        See graphsimqt.utils.run_metrics.collect_run_metrics() for details.
 
     """
-    if not silent:
-        spinner = Spinner('Preparing computation of shortest path distances. ')
-        spinner.next()
-    if not isinstance(reference_graph, gt.Graph):
-        reference_graph = gt.load_graph(str(reference_graph))
-    if not isinstance(distance_graph, gt.Graph):
-        distance_graph = gt.load_graph(str(distance_graph))
-    if not silent:
-        spinner.next()
-    ref_ids, dist_ids, edge_scores = _get_attributes(reference_graph, distance_graph, reference_node_id_attribute_name,
-                                                     distance_node_id_attribute_name,
-                                                     reference_edge_score_attribute_name)
-    if not silent:
-        spinner.next()
-    terminals = _get_terminals(distance_graph, ref_ids, dist_ids)
-    if not silent:
-        spinner.next()
-    node_filter = _initialize_node_filter(distance_graph, exclude_as_connectors, exclude_terminals, ref_ids, dist_ids)
-    distances = {'source': [], 'target': [], 'distance': [], 'reference_edge': [], 'reference_score': []}
-    ref_ids_to_nodes = {ref_ids[node]: node for node in reference_graph.vertices()}
-    if not silent:
-        spinner.finish()
-        bar = IncrementalBar('Computing shortest path distances.', max=len(terminals) * (len(terminals) - 1) / 2)
-    for source, target in itt.combinations(terminals, 2):
-        if not silent:
-            bar.next()
-        # For drug-disease distances uncomment the following if statement, since we don't want dr-dr or dis-dis distances when we're computing dr-dis distances
-        # if distance_graph.vp['TYPE'][source] != distance_graph.vp['TYPE'][target]:
-        #     _compute_distance(reference_graph, distance_graph, dist_ids, ref_ids_to_nodes, node_filter, source, target,
-        #                   edge_scores, distances)
-        _compute_distance(reference_graph, distance_graph, dist_ids, ref_ids_to_nodes, node_filter, source, target,
-                          edge_scores, distances)
-    if not silent:
-        bar.finish()
-        spinner = Spinner('Saving shortest path distances. ')
-        spinner.next()
-    distances = pd.DataFrame(data=distances)
+    supported_engines = {'pairwise', 'bfs', 'landmark'}
+    if engine not in supported_engines:
+        raise ValueError(f'Unsupported shortest path engine {engine}.\n'
+                         f'Supported engines: {", ".join(supported_engines)}.')
+    if max_distance is not None and max_distance < 1:
+        raise ValueError(f'The maximal distance must be positive, but is {max_distance}.')
+    if engine == 'landmark' and num_landmarks < 1:
+        raise ValueError(f'The number of landmarks must be positive, but is {num_landmarks}.')
+    if n_jobs < 1:
+        n_jobs = os.cpu_count()
+    if engine == 'landmark':
+        # The distances are estimated in the main process from the distances between landmarks and terminals.
+        n_jobs = 1
     result_dir_path = get_result_directory_path(result_directory_name)
-    result_dir_path.mkdir(exist_ok=True)
-    path_to_distances = result_dir_path.joinpath('shortest_path_distances.csv')
-    distances.to_csv(str(path_to_distances), index=False)
-    if not silent:
-        spinner.finish()
-        print(f'Saved shortest path distances to {str(path_to_distances)}.')
+    with collect_run_metrics(result_dir_path, profiler):
+        if not silent:
+            spinner = Spinner('Preparing computation of shortest path distances. ')
+            spinner.next()
+        with measure_stage('compute_shortest_path_distances.prepare') as counts:
+            if not isinstance(reference_graph, gt.Graph):
+                reference_graph = gt.load_graph(str(reference_graph))
+            if isinstance(distance_graph, (str, Path)) and is_graph_snapshot(distance_graph):
+                distance_graph = GraphSnapshot(distance_graph)
+            elif not isinstance(distance_graph, (gt.Graph, GraphSnapshot)):
+                distance_graph = gt.load_graph(str(distance_graph))
+            if isinstance(distance_graph, GraphSnapshot) and engine == 'pairwise':
+                raise ValueError(f'Graph snapshots are not supported by the pairwise engine.\n'
+                                 f'Please use the bfs or landmark engine.')
+            if not silent:
+                spinner.next()
+            ref_ids, dist_ids, edge_scores = _get_attributes(reference_graph, distance_graph,
+                                                             reference_node_id_attribute_name,
+                                                             distance_node_id_attribute_name,
+                                                             reference_edge_score_attribute_name)
+            if not silent:
+                spinner.next()
+            alignment = NodeAlignment.from_graphs(distance_graph, reference_graph, dist_ids, ref_ids)
+            terminals = _get_terminals(distance_graph, alignment)
+            neighbors, positions = None, None
+            if engine in {'bfs', 'landmark'}:
+                neighbors, positions = _get_terminal_edges(distance_graph, terminals)
+            if engine == 'landmark':
+                adjacent_terminals = _get_adjacent_terminals(distance_graph, terminals, neighbors, positions)
+            if not silent:
+                spinner.next()
+            counts.update(num_vertices=distance_graph.num_vertices(), num_edges=distance_graph.num_edges(),
+                          num_terminals=len(terminals))
+            node_filter = _initialize_node_filter(distance_graph, exclude_as_connectors, exclude_terminals, alignment)
+        distances = {'source': [], 'target': [], 'distance': [], 'reference_edge': [], 'reference_score': []}
+        if engine == 'landmark':
+            with measure_stage('compute_shortest_path_distances.landmarks', num_landmarks=num_landmarks,
+                               num_terminals=len(terminals)):
+                landmarks = _select_landmarks(distance_graph, node_filter, num_landmarks)
+                landmark_distances = _compute_landmark_distances(distance_graph, node_filter, terminals, landmarks,
+                                                                 neighbors, positions)
+        if not silent:
+            spinner.finish()
+            bar = IncrementalBar('Computing shortest path distances.', max=len(terminals))
+        with measure_stage('compute_shortest_path_distances.distances', num_terminals=len(terminals),
+                           num_pairs=len(terminals) * (len(terminals) - 1) // 2, n_jobs=n_jobs), \
+                contextlib.ExitStack() as stack:
+            if engine == 'landmark':
+                source_distances = (_to_distance_list(_estimate_distances_from_source(
+                    landmark_distances, adjacent_terminals, source_position, max_distance)[source_position + 1:])
+                                    for source_position in range(len(terminals)))
+            elif n_jobs == 1:
+                source_distances = (_compute_distances_from_source(distance_graph, node_filter, terminals,
+                                                                   source_position, engine, neighbors, positions,
+                                                                   max_distance)
+                                    for source_position in range(len(terminals)))
+            else:
+                is_filtered = _get_is_filtered(node_filter)
+                if not isinstance(distance_graph, GraphSnapshot):
+                    # The workers set their own node filters. The filter of the caller's graph is restored on exit,
+                    # after the pool has been terminated.
+                    stack.callback(distance_graph.set_vertex_filter, *distance_graph.get_vertex_filter())
+                    distance_graph.clear_filters()
+                # The pool is terminated on exit, also if the computation is interrupted by an exception.
+                pool = stack.enter_context(mp.Pool(n_jobs, initializer=_initialize_worker,
+                                                   initargs=(distance_graph, is_filtered,
+                                                             [int(node) for node in terminals], engine, neighbors,
+                                                             positions, max_distance)))
+                chunk_size = max(1, len(terminals) // (16 * n_jobs))
+                source_distances = pool.imap(_compute_distances_from_source_in_worker, range(len(terminals)),
+                                             chunk_size)
+            for source_position, target_distances in enumerate(source_distances):
+                if not silent:
+                    bar.next()
+                source = terminals[source_position]
+                for target, distance in zip(terminals[source_position + 1:], target_distances):
+                    # For drug-disease distances uncomment the following if statement, since we don't want dr-dr or dis-dis distances when we're computing dr-dis distances
+                    # if distance_graph.vp['TYPE'][source] != distance_graph.vp['TYPE'][target]:
+                    #     _add_reference_edge(reference_graph, dist_ids, alignment, source, target, distance,
+                    #                         edge_scores, distances)
+                    _add_reference_edge(reference_graph, dist_ids, alignment, source, target, distance, edge_scores,
+                                        distances)
+        if not silent:
+            bar.finish()
+            spinner = Spinner('Saving shortest path distances. ')
+            spinner.next()
+        with measure_stage('compute_shortest_path_distances.save'):
+            distances = pd.DataFrame(data=distances)
+            result_dir_path.mkdir(exist_ok=True)
+            path_to_distances = result_dir_path.joinpath('shortest_path_distances.csv')
+            distances.to_csv(str(path_to_distances), index=False)
+        if not silent:
+            spinner.finish()
+            print(f'Saved shortest path distances to {str(path_to_distances)}.')
+        if engine == 'landmark':
+            if not silent:
+                spinner = Spinner('Measuring error of landmark distances. ')
+                spinner.next()
+            with measure_stage('compute_shortest_path_distances.landmark_error_report',
+                               num_error_samples=num_error_samples):
+                report = _compute_landmark_error_report(distance_graph, node_filter, terminals, landmarks,
+                                                        landmark_distances, adjacent_terminals, neighbors, positions,
+                                                        max_distance, num_error_samples, seed, dist_ids)
+                path_to_report = result_dir_path.joinpath('landmark_error_report.json')
+                with open(str(path_to_report), 'w') as fp:
+                    json.dump(report, fp)
+            if not silent:
+                spinner.finish()
+                print(f'Saved error report of landmark distances to {str(path_to_report)}.')
 
 
 if __name__ == '__main__':
     args = get_shortest_path_parser('compute_shortest_path_distances').parse_args()
     compute_shortest_path_distances(args.path_to_reference_graph, args.path_to_distance_graph, args.dirname,
                                     args.reference_id, args.distance_id, args.score, not args.use_terminals,
-                                    args.exclude_as_connectors, args.silent)
+                                    args.exclude_as_connectors, args.silent, args.engine, args.n_jobs,
+                                    args.max_distance, args.landmarks, args.error_samples, args.seed,
+                                    args.profile)
@@ -1,10 +1,22 @@
 import graph_tool as gt
 import pandas as pd
+import numpy as np
 from pathlib import Path
-from typing import Optional, Union
+from typing import Optional, Union, Tuple
 import warnings
+import filecmp
+import json
+import shutil
 from progress.spinner import Spinner
 from graphsimqt.utils.get_parsers import get_similarity_parser
+from graphsimqt.utils.run_metrics import measure_stage
+from graphsimqt.utils.graph_snapshot import save_graph_snapshot
+from graphsimqt.utils.normalization_cache import get_normalization_cache_key, load_cached_graph, \
+    add_graph_to_cache, get_normalization_cache_stats
+
+# Compressions of edge list input by suffix, which are decompressed on the fly while parsing. zstd requires the
+# zstandard package.
+EDGE_LIST_COMPRESSIONS = {'.gz': 'gzip', '.zst': 'zstd'}
 
 
 def _compute_normalized_edge_scores(graph: gt.Graph, normalization_method: Optional[str]):
@@ -25,55 +37,102 @@ def _compute_normalized_edge_scores(graph: gt.Graph, normalization_method: Optio
 
 
 def _compute_normalized_edge_ranks(graph: gt.Graph):
-    sorted_edges = []
-    prop = graph.edge_properties['SCORE']
-    for edge in graph.edges():
-        sorted_edges.append((edge, prop[edge]))
-    sorted_edges.sort(key=lambda item: item[1])
+    # Edges are stably sorted by score in iteration order. Since last_val was never updated in the original
+    # loop-based implementation, each edge with positive score increments the rank (ties included), while edges with
+    # non-positive scores have rank 0. These semantics are preserved to keep results comparable.
+    edge_indices = graph.get_edges([graph.edge_index])[:, 2].astype(np.int64)
+    scores = graph.edge_properties['SCORE'].a[edge_indices]
+    order = np.argsort(scores, kind='stable')
     normalized_rank = graph.new_ep('double')
-    num_lower = -1
-    last_val = 0
-    for edge, val in sorted_edges:
-        if val > last_val:
-            num_lower += 1
-        normalized_rank[edge] = (num_lower + 1.0) / graph.num_edges()
+    normalized_rank.a[edge_indices[order]] = np.cumsum(scores[order] > 0) / graph.num_edges()
     graph.edge_properties['NORM-RANK'] = normalized_rank
 
 
-def _load_edge_list(path_to_graph: Path, is_directed: Optional[bool], has_header: bool) -> gt.Graph:
+def _split_graph_path(path_to_graph: Path) -> Tuple[str, str, Optional[str]]:
+    # Returns the stem, the format suffix, and the compression of the input graph, e.g., ('graph', '.csv', 'gzip') for
+    # graph.csv.gz.
+    if path_to_graph.suffix in EDGE_LIST_COMPRESSIONS:
+        uncompressed_path = path_to_graph.with_suffix('')
+        return uncompressed_path.stem, uncompressed_path.suffix, EDGE_LIST_COMPRESSIONS[path_to_graph.suffix]
+    return path_to_graph.stem, path_to_graph.suffix, None
+
+
+def _load_edge_list_in_chunks(path_to_graph: Path, is_directed: bool, has_header: bool, chunk_size: int) -> gt.Graph:
+    # The edge list is read twice, one chunk at a time. The first pass collects the node IDs in the same order as
+    # _load_edge_list() (first appearance among all sources, then among all targets), so that the graph does not depend
+    # on the chunk size. The second pass appends the edges of each chunk to the graph. Besides the graph, only the node
+    # IDs and one chunk are held in memory. The node IDs are read verbatim as strings.
+    _, suffix, compression = _split_graph_path(path_to_graph)
+    options = {'sep': {'.csv': ',', '.wsv': ' ', '.tsv': '\t', '.csv2': ';'}[suffix], 'header': None,
+               'skiprows': 1 if has_header else 0, 'compression': compression}
+    has_score = pd.read_csv(str(path_to_graph), nrows=1, **options).shape[1] > 2
+    columns = [0, 1, 2] if has_score else [0, 1]
+    dtypes = {0: str, 1: str, 2: np.float64}
+
+    def read_chunks():
+        return pd.read_csv(str(path_to_graph), usecols=columns, dtype={column: dtypes[column] for column in columns},
+                           chunksize=chunk_size, **options)
+
+    node_ids, target_ids = {}, {}
+    with read_chunks() as chunks:
+        for chunk in chunks:
+            node_ids.update(dict.fromkeys(pd.unique(chunk[0])))
+            target_ids.update(dict.fromkeys(pd.unique(chunk[1])))
+    node_ids.update(target_ids)
+    del target_ids
+    node_index = dict(zip(node_ids, range(len(node_ids))))
+    graph = gt.Graph(directed=is_directed)
+    graph.add_vertex(len(node_index))
+    graph.vertex_properties['ID'] = graph.new_vp('string', vals=list(node_index))
+    if has_score:
+        edge_score_property = graph.new_ep('double')
+        graph.edge_properties['SCORE'] = edge_score_property
+    with read_chunks() as chunks:
+        for chunk in chunks:
+            codes, uniques = pd.factorize(pd.concat((chunk[0], chunk[1]), ignore_index=True))
+            codes = np.fromiter(map(node_index.__getitem__, uniques), dtype=np.int64, count=len(uniques))[codes]
+            num_edges = chunk.shape[0]
+            if has_score:
+                graph.add_edge_list(np.column_stack((codes[:num_edges], codes[num_edges:],
+                                                     chunk[2].to_numpy(dtype=np.float64))),
+                                    eprops=[edge_score_property])
+            else:
+                graph.add_edge_list(np.column_stack((codes[:num_edges], codes[num_edges:])))
+    return graph
+
+
+def _load_edge_list(path_to_graph: Path, is_directed: Optional[bool], has_header: bool,
+                    chunk_size: Optional[int] = None) -> gt.Graph:
     if not isinstance(is_directed, bool):
         raise ValueError(f'If the graph is given as an edge list, the directedness must be specified via the '
                          f'parameter is_directed.')
-    sep = {'.csv': ',', '.wsv': ' ', '.tsv': '\t', '.csv2': ';'}[path_to_graph.suffix]
+    if chunk_size is not None:
+        return _load_edge_list_in_chunks(path_to_graph, is_directed, has_header, chunk_size)
+    _, suffix, compression = _split_graph_path(path_to_graph)
+    sep = {'.csv': ',', '.wsv': ' ', '.tsv': '\t', '.csv2': ';'}[suffix]
     if has_header:
-        edge_list = pd.read_csv(str(path_to_graph), sep=sep)
+        edge_list = pd.read_csv(str(path_to_graph), sep=sep, compression=compression)
     else:
-        edge_list = pd.read_csv(str(path_to_graph), sep=sep, header=None)
+        edge_list = pd.read_csv(str(path_to_graph), sep=sep, header=None, compression=compression)
     columns = edge_list.columns
     has_score = len(columns) > 2
     if has_score:
         edge_list.rename(columns={columns[0]: 'source', columns[1]: 'target', columns[2]: 'score'}, inplace=True)
     else:
         edge_list.rename(columns={columns[0]: 'source', columns[1]: 'target'}, inplace=True)
-    node_ids = list(set(edge_list['source']).union(edge_list['target']))
+    codes, node_ids = pd.factorize(pd.concat((edge_list['source'], edge_list['target']), ignore_index=True))
+    num_edges = edge_list.shape[0]
     graph = gt.Graph(directed=is_directed)
-    node_id_to_node = {node_id: graph.add_vertex() for node_id in node_ids}
-    node_id_property = graph.new_vp('string', vals=node_ids)
+    graph.add_vertex(len(node_ids))
+    node_id_property = graph.new_vp('string', vals=[str(node_id) for node_id in node_ids])
     graph.vertex_properties['ID'] = node_id_property
-    edges = []
-    for i in range(edge_list.shape[0]):
-        source = node_id_to_node[edge_list.loc[i, 'source']]
-        target = node_id_to_node[edge_list.loc[i, 'target']]
-        if has_score:
-            edges.append((source, target, float(edge_list.loc[i, 'score'])))
-        else:
-            edges.append((source, target))
     if has_score:
+        edges = np.column_stack((codes[:num_edges], codes[num_edges:], edge_list['score'].to_numpy(dtype=np.float64)))
         edge_score_property = graph.new_ep('double')
         graph.add_edge_list(edges, eprops=[edge_score_property])
         graph.edge_properties['SCORE'] = edge_score_property
     else:
-        graph.add_edge_list(edges)
+        graph.add_edge_list(np.column_stack((codes[:num_edges], codes[num_edges:])))
     return graph
 
 
@@ -148,12 +207,29 @@ def _load_graphml(path_to_graph: Path, node_id_attribute_name: Optional[str],
     return graph
 
 
+def _save_normalized_graph(graph: gt.Graph, path_to_normalized_graph: Path, path_to_cached_graph: Optional[Path]):
+    if path_to_cached_graph is None:
+        graph.save(str(path_to_normalized_graph))
+        return
+    # Copy the cached file unless the normalized graph saved next to the input is already up to date.
+    try:
+        if not (path_to_normalized_graph.exists() and
+                filecmp.cmp(str(path_to_cached_graph), str(path_to_normalized_graph), shallow=False)):
+            shutil.copyfile(str(path_to_cached_graph), str(path_to_normalized_graph))
+    except FileNotFoundError:
+        graph.save(str(path_to_normalized_graph))
+
+
 def normalize_graph(path_to_graph: Union[str, Path], node_id_attribute_name: Optional[str] = None,
                     edge_score_attribute_name: Optional[str] = None, is_directed: Optional[bool] = None,
                     has_header: bool = False, normalization_method: Optional[str] = 'max', silent: bool = False,
-                    save: bool = True) -> gt.Graph:
+                    save: bool = True, use_cache: bool = False, save_snapshot: bool = False,
+                    chunk_size: Optional[int] = None) -> gt.Graph:
     """Generates normalized version input graph to be used for similarity quantification.
 
+    If called within graphsimqt.utils.run_metrics.collect_run_metrics() (e.g., by run_similarity_analysis()), the wall
+    time, CPU time, peak memory, and graph size of the normalization are recorded in run_metrics.json.
+
     Parameters
     ----------
     path_to_graph : str or pathlib.Path
@@ -161,7 +237,8 @@ def normalize_graph(path_to_graph: Union[str, Path], node_id_attribute_name: Opt
         the  input is expected to be in GraphML format.
         Otherwise, an edge list with lines of the form <SOURCE><SEP><TARGET>[<SEP><SCORE>] is expected.
         The separator is derived from the suffix. csv: comma. csv2: semicolon. tsv: tab. wsv: whitespace.
-        Providing edge scores is optional.
+        Providing edge scores is optional. Edge lists can be compressed with gzip (suffix gz, e.g., graph.csv.gz) or
+        zstd (suffix zst, requires the zstandard package), they are decompressed on the fly.
     node_id_attribute_name : str, optional
         Name of node ID attribute to be used for GraphML input.
         If not provided, unique node attribute is used if available.
@@ -182,6 +259,20 @@ def normalize_graph(path_to_graph: Union[str, Path], node_id_attribute_name: Opt
     silent : bool, default: False
         Set to True to suppress printing progress to stdout.
     save : bool, default: True
+        Set to False to skip saving the normalized graph as <stem>_normalized.gt next to the input graph.
+    use_cache : bool, default: False
+        Set to True to look up the normalized graph in the normalization cache before parsing the input, see
+        graphsimqt.utils.normalization_cache. The cache is keyed on the content of the input file and the
+        normalization parameters and evicts the least recently used graphs once it exceeds its maximal size.
+    save_snapshot : bool, default: False
+        Set to True to also save the normalized graph as memory-mapped CSR snapshot directory
+        <stem>_normalized.snapshot next to the input graph, see graphsimqt.utils.graph_snapshot. Snapshots can be
+        loaded without graph_tool and shared by many processes via the page cache.
+    chunk_size : int, optional
+        If provided, edge list input is streamed in chunks of this many edges instead of being read at once, so that
+        the memory needed besides the graph is bounded by the chunk size and the number of nodes. The resulting graph
+        does not depend on the chunk size, but the node IDs are read verbatim, whereas numeric node IDs are reformatted
+        otherwise (e.g., 007 becomes 7). Not used for GraphML input.
 
     Returns
     -------
@@ -194,32 +285,65 @@ def normalize_graph(path_to_graph: Union[str, Path], node_id_attribute_name: Opt
         spinner.next()
     if isinstance(path_to_graph, str):
         path_to_graph = Path(path_to_graph)
+    stem, suffix, compression = _split_graph_path(path_to_graph)
     supported_formats = {'.graphml', '.gt', '.csv', '.csv2', '.tsv', '.wsv'}
-    if path_to_graph.suffix in {'.graphml', '.gt'}:
-        graph = _load_graphml(path_to_graph, node_id_attribute_name, edge_score_attribute_name, is_directed)
-    elif path_to_graph.suffix in supported_formats:
-        graph = _load_edge_list(path_to_graph, is_directed, has_header)
-    else:
-        raise ValueError(f'Unsupported file format {path_to_graph.suffix}.\n'
+    if suffix not in supported_formats:
+        raise ValueError(f'Unsupported file format {suffix}.\n'
                          f'Supported formats: {", ".join(supported_formats)}.')
-    if not silent:
-        spinner.next()
-    if len(graph.edge_properties) > 0:
-        _compute_normalized_edge_scores(graph, normalization_method)
-        if not silent:
-            spinner.next()
-        _compute_normalized_edge_ranks(graph)
-        if not silent:
-            spinner.next()
+    if compression is not None and suffix in {'.graphml', '.gt'}:
+        raise ValueError('Compressed input is only supported for edge lists.')
+    if chunk_size is not None and chunk_size < 1:
+        raise ValueError(f'The chunk size must be positive, but is {chunk_size}.')
+    with measure_stage('normalize_graph', graph=str(path_to_graph)) as counts:
+        graph = None
+        path_to_cached_graph = None
+        if use_cache:
+            parameters = {'node_id_attribute_name': node_id_attribute_name,
+                          'edge_score_attribute_name': edge_score_attribute_name, 'is_directed': is_directed,
+                          'has_header': has_header, 'normalization_method': normalization_method}
+            if chunk_size is not None:
+                # Streamed edge lists keep the node IDs verbatim and may hence yield different graphs. The chunk size
+                # itself does not affect the graph.
+                parameters['node_ids_verbatim'] = True
+            cache_key = get_normalization_cache_key(path_to_graph, parameters)
+            graph, path_to_cached_graph = load_cached_graph(cache_key)
+        if graph is None:
+            if suffix in {'.graphml', '.gt'}:
+                graph = _load_graphml(path_to_graph, node_id_attribute_name, edge_score_attribute_name, is_directed)
+            else:
+                graph = _load_edge_list(path_to_graph, is_directed, has_header, chunk_size)
+            if not silent:
+                spinner.next()
+            if len(graph.edge_properties) > 0:
+                _compute_normalized_edge_scores(graph, normalization_method)
+                if not silent:
+                    spinner.next()
+                _compute_normalized_edge_ranks(graph)
+                if not silent:
+                    spinner.next()
+            if use_cache:
+                path_to_cached_graph = add_graph_to_cache(cache_key, graph)
+        counts.update(num_vertices=graph.num_vertices(), num_edges=graph.num_edges())
     if save:
-        path_to_normalized_graph = path_to_graph.parent.joinpath(f'{path_to_graph.stem}_normalized.gt')
-        graph.save(str(path_to_normalized_graph))
-        if not silent:
-            spinner.finish()
+        path_to_normalized_graph = path_to_graph.parent.joinpath(f'{stem}_normalized.gt')
+        _save_normalized_graph(graph, path_to_normalized_graph, path_to_cached_graph)
+    if save_snapshot:
+        path_to_snapshot = path_to_graph.parent.joinpath(f'{stem}_normalized.snapshot')
+        with measure_stage('normalize_graph.snapshot', graph=str(path_to_graph)) as counts:
+            snapshot = save_graph_snapshot(graph, path_to_snapshot)
+            counts.update(num_entries=snapshot.indices.shape[0])
+    if not silent and (save or save_snapshot):
+        spinner.finish()
+        if save:
             print(f'Saved normalized graph to {str(path_to_normalized_graph)}.')
+        if save_snapshot:
+            print(f'Saved normalized graph snapshot to {str(path_to_snapshot)}.')
     return graph
 
 
 if __name__ == '__main__':
     args = get_similarity_parser('normalize_graph').parse_args()
-    _ = normalize_graph(args.graph, args.id, args.score, args.directed, args.header, args.normalization, args.silent)
+    _ = normalize_graph(args.graph, args.id, args.score, args.directed, args.header, args.normalization, args.silent,
+                        use_cache=args.use_cache, save_snapshot=args.snapshot, chunk_size=args.chunk_size)
+    if args.cache_stats:
+        print(json.dumps(get_normalization_cache_stats(), indent=2))
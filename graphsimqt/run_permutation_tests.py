@@ -1,43 +1,53 @@
 import graph_tool as gt
-import graph_tool.generation as gtg
 import pandas as pd
+import numpy as np
+import multiprocessing as mp
+import contextlib
+import os
+import json
+import time
+import warnings
 from pathlib import Path
-from typing import Union
+from typing import Union, Optional, List, Tuple, Dict
 from progress.spinner import Spinner
 from progress.bar import IncrementalBar
 from graphsimqt.utils.graph_distance import GraphDistance
+from graphsimqt.utils.sparse_graph_distance import SparseGraphDistance
+from graphsimqt.utils.incremental_graph_distance import IncrementalGraphDistance
+from graphsimqt.utils.node_alignment import NodeAlignment
+from graphsimqt.utils.null_model_bank import NullModelBank, build_null_model_bank, get_permutation_seeds, \
+    rewire_graph, swap_edges
 from graphsimqt.utils.get_directory_paths import get_result_directory_path
+from graphsimqt.utils.local_distance_store import LocalDistanceWriter, load_local_distances, \
+    export_local_distances_to_csv, get_local_distance_store_path
+from graphsimqt.utils.run_metrics import collect_run_metrics, measure_stage, add_permutation_metrics
 from graphsimqt.utils.get_parsers import get_similarity_parser
 
 
-def _add_to_results(distances: GraphDistance, permuted: bool, distance_type: str, global_distances: dict,
-                    local_distances: dict):
+DISTANCE_ENGINES = {'graph_tool': GraphDistance, 'sparse': SparseGraphDistance}
+
+# Engines of the permutation tests. 'incremental' updates IncrementalGraphDistance trackers with edge swaps.
+ENGINES = [*DISTANCE_ENGINES, 'incremental']
+
+_worker_state = {}
+
+
+def _add_to_results(distances: Union[GraphDistance, SparseGraphDistance, IncrementalGraphDistance], permuted: bool,
+                    distance_type: str, global_distances: dict, local_distances: dict):
     global_distances['permuted'].append(permuted)
     global_distances['distance_type'].append(distance_type)
     global_distances['distance'].append(distances.global_distance)
-    for node_id, distance in distances.local_distances.items():
-        local_distances['permuted'].append(permuted)
-        local_distances['distance_type'].append(distance_type)
-        local_distances['node'].append(node_id)
-        local_distances['distance'].append(distance)
-
-
-def _filter_exclusive_nodes(graph_1: gt.Graph, graph_2: gt.Graph):
-    node_ids_1 = {graph_1.vertex_properties['ID'][node] for node in graph_1.vertices()}
-    node_ids_2 = {graph_2.vertex_properties['ID'][node] for node in graph_2.vertices()}
-    common_diseases = node_ids_1.intersection(node_ids_2)
-    is_common_node_1 = graph_1.new_vp('bool')
-    for node in graph_1.vertices():
-        is_common_node_1[node] = graph_1.vertex_properties['ID'][node] in common_diseases
-    is_common_node_2 = graph_2.new_vp('bool')
-    for node in graph_2.vertices():
-        is_common_node_2[node] = graph_2.vertex_properties['ID'][node] in common_diseases
-    graph_1.set_vertex_filter(is_common_node_1)
+    local_distances.setdefault(distance_type, []).append(np.fromiter(distances.local_distances.values(), np.float64))
+
+
+def _filter_exclusive_nodes(graph_1: gt.Graph, graph_2: gt.Graph, alignment: NodeAlignment) -> NodeAlignment:
+    graph_1.set_vertex_filter(graph_1.new_vp('bool', vals=alignment.is_shared_1))
     graph_1.purge_vertices()
     graph_1.clear_filters()
-    graph_2.set_vertex_filter(is_common_node_2)
+    graph_2.set_vertex_filter(graph_2.new_vp('bool', vals=alignment.is_shared_2))
     graph_2.purge_vertices()
     graph_2.clear_filters()
+    return alignment.restrict_to_shared()
 
 
 def _ensure_same_directedness(graph_1: gt.Graph, graph_2: gt.Graph):
@@ -52,9 +62,201 @@ def _ensure_same_directedness(graph_1: gt.Graph, graph_2: gt.Graph):
             del graph_2.edge_properties[edge_property_name]
 
 
+def _get_edge_properties(graph_1: gt.Graph, graph_2: gt.Graph) -> Dict[str, Optional[Tuple[gt.EdgePropertyMap,
+                                                                                         gt.EdgePropertyMap]]]:
+    if 'NORM-SCORE' in graph_1.edge_properties and 'NORM-SCORE' in graph_2.edge_properties:
+        return {'topology_only': None,
+                'normalized_scores': (graph_1.edge_properties['NORM-SCORE'], graph_2.edge_properties['NORM-SCORE']),
+                'normalized_ranks': (graph_1.edge_properties['NORM-RANK'], graph_2.edge_properties['NORM-RANK'])}
+    return {'topology_only': None}
+
+
+def _run_permutations(graph_1: gt.Graph, graph_2: gt.Graph, alignment: NodeAlignment, engine: str,
+                      permutations: List[Tuple[int, int, int]], distance_types: List[str],
+                      banks: Optional[Tuple[NullModelBank, NullModelBank]],
+                      trackers: Optional[Dict[str, IncrementalGraphDistance]]) -> Tuple[dict, dict, List[dict]]:
+    # Each permutation rewires fresh copies of the graphs with its own seeds (or replays the rewirings stored in the
+    # null model banks), so the results do not depend on how the permutations are distributed among the workers.
+    # Incremental trackers are updated with the edges changed by the swaps of the permutation and reset to the original
+    # graphs afterwards for the same reason. The metrics of each permutation are measured in the process that carries it
+    # out.
+    global_distances = {'permuted': [], 'distance_type': [], 'distance': []}
+    local_distances = {}
+    permutation_metrics = []
+    for permutation, seed_1, seed_2 in permutations:
+        start_wall_time, start_cpu_time = time.perf_counter(), time.process_time()
+        if trackers is not None:
+            swaps = (swap_edges(graph_1, seed_1), swap_edges(graph_2, seed_2))
+            rewiring_wall_time = time.perf_counter() - start_wall_time
+            num_evaluated_distance_types = 0
+            for distance_type, edge_property in _get_edge_properties(graph_1, graph_2).items():
+                if distance_type not in distance_types:
+                    continue
+                num_evaluated_distance_types += 1
+                distances = trackers[distance_type]
+                for graph_index, (edge_indices, removed_edges, added_edges) in enumerate(swaps):
+                    added_weights = edge_property[graph_index].a[edge_indices] if edge_property else None
+                    distances.apply_edge_changes(graph_index, removed_edges, added_edges, added_weights)
+                _add_to_results(distances, True, distance_type, global_distances, local_distances)
+                distances.reset()
+            permutation_metrics.append({'permutation': permutation,
+                                        'wall_time': time.perf_counter() - start_wall_time,
+                                        'cpu_time': time.process_time() - start_cpu_time,
+                                        'rewiring_wall_time': rewiring_wall_time,
+                                        'num_rewired_edges': sum(edge_indices.shape[0] for edge_indices, _, _ in swaps),
+                                        'num_evaluated_nodes': num_evaluated_distance_types * len(alignment.node_ids)})
+            continue
+        if banks is None:
+            permuted_graph_1, num_rewired_edges_1 = rewire_graph(graph_1, seed_1)
+            permuted_graph_2, num_rewired_edges_2 = rewire_graph(graph_2, seed_2)
+        else:
+            permuted_graph_1, num_rewired_edges_1 = banks[0].get_graph(graph_1, permutation)
+            permuted_graph_2, num_rewired_edges_2 = banks[1].get_graph(graph_2, permutation)
+        rewiring_wall_time = time.perf_counter() - start_wall_time
+        num_evaluated_distance_types = 0
+        for distance_type, edge_property in _get_edge_properties(permuted_graph_1, permuted_graph_2).items():
+            if distance_type not in distance_types:
+                continue
+            num_evaluated_distance_types += 1
+            distances = DISTANCE_ENGINES[engine](permuted_graph_1, permuted_graph_2, alignment.node_ids, edge_property,
+                                                 alignment)
+            _add_to_results(distances, True, distance_type, global_distances, local_distances)
+        permutation_metrics.append({'permutation': permutation,
+                                    'wall_time': time.perf_counter() - start_wall_time,
+                                    'cpu_time': time.process_time() - start_cpu_time,
+                                    'rewiring_wall_time': rewiring_wall_time,
+                                    'num_rewired_edges': num_rewired_edges_1 + num_rewired_edges_2,
+                                    'num_evaluated_nodes': num_evaluated_distance_types * len(alignment.node_ids)})
+    return global_distances, local_distances, permutation_metrics
+
+
+def _initialize_worker(graph_1: gt.Graph, graph_2: gt.Graph, alignment: NodeAlignment, engine: str,
+                       banks: Optional[Tuple[NullModelBank, NullModelBank]],
+                       trackers: Optional[Dict[str, IncrementalGraphDistance]]):
+    _worker_state['graphs'] = (graph_1, graph_2)
+    _worker_state['alignment'] = alignment
+    _worker_state['engine'] = engine
+    _worker_state['banks'] = banks
+    _worker_state['trackers'] = trackers
+
+
+def _run_permutations_in_worker(args: Tuple[List[Tuple[int, int, int]], List[str]]
+                                ) -> Tuple[dict, dict, List[dict]]:
+    graph_1, graph_2 = _worker_state['graphs']
+    permutations, distance_types = args
+    return _run_permutations(graph_1, graph_2, _worker_state['alignment'], _worker_state['engine'], permutations,
+                             distance_types, _worker_state['banks'], _worker_state['trackers'])
+
+
+def _merge_results(results: dict, chunk_results: dict):
+    for key, values in chunk_results.items():
+        results.setdefault(key, []).extend(values)
+
+
+def _save_checkpoint(result_dir_path: Path, seed: int, num_permutations: int, completed_permutations: int,
+                     num_rows: Dict[str, int], stopped_distance_types: List[str]):
+    checkpoint = {'seed': seed, 'num_permutations': num_permutations,
+                  'completed_permutations': completed_permutations, 'num_rows': num_rows,
+                  'stopped_distance_types': stopped_distance_types}
+    path_to_checkpoint = result_dir_path.joinpath('checkpoint.json')
+    path_to_tmp_checkpoint = result_dir_path.joinpath('checkpoint.json.tmp')
+    with open(str(path_to_tmp_checkpoint), 'w') as fp:
+        json.dump(checkpoint, fp)
+    os.replace(str(path_to_tmp_checkpoint), str(path_to_checkpoint))
+
+
+def _load_checkpoint(result_dir_path: Path, num_permutations: int, num_nodes: int, distance_types: List[str],
+                     seed: Optional[int]) -> Optional[dict]:
+    path_to_checkpoint = result_dir_path.joinpath('checkpoint.json')
+    if not path_to_checkpoint.exists():
+        warnings.warn(f'No checkpoint found in {str(result_dir_path)}. Starting permutation tests from scratch.')
+        return None
+    with open(str(path_to_checkpoint)) as fp:
+        checkpoint = json.load(fp)
+    if checkpoint['num_permutations'] != num_permutations:
+        raise ValueError(f'Cannot resume permutation tests with {num_permutations} permutations from a checkpoint '
+                         f'for {checkpoint["num_permutations"]} permutations.')
+    if seed is not None and checkpoint['seed'] != seed:
+        raise ValueError(f'Cannot resume permutation tests with seed {seed} from a checkpoint with seed '
+                         f'{checkpoint["seed"]}.')
+    node_ids, _ = load_local_distances(result_dir_path)
+    if len(node_ids) != num_nodes or set(checkpoint['num_rows']) != set(distance_types):
+        raise ValueError(f'The checkpoint in {str(result_dir_path)} was created for different input graphs.')
+    return checkpoint
+
+
+def _truncate_global_distances(path_to_global_distances: Path, num_rows: Dict[str, int]):
+    # Drops global distances that have been written after the last checkpoint.
+    global_distances = pd.read_csv(str(path_to_global_distances))
+    row = global_distances.groupby('distance_type').cumcount()
+    max_rows = global_distances['distance_type'].map(num_rows)
+    global_distances[row < max_rows].to_csv(str(path_to_global_distances), index=False)
+
+
+def _get_num_exceedances(alpha: float, num_permutations: int) -> int:
+    # Smallest number h of permuted global distances at most as small as the unpermuted one for which the empirical
+    # p-value (h + 1) / (num_permutations + 1) after all permutations exceeds alpha.
+    return max(1, int(np.floor(alpha * (num_permutations + 1))))
+
+
+def _count_exceedances(path_to_global_distances: Path) -> Tuple[Dict[str, float], Dict[str, int]]:
+    # Returns the unpermuted global distance of each distance type and the number of permuted global distances that
+    # are at most as small.
+    global_distances = pd.read_csv(str(path_to_global_distances), float_precision='round_trip')
+    true_distances, num_leq = {}, {}
+    for distance_type, distances in global_distances.groupby('distance_type', sort=False):
+        true_distances[distance_type] = distances.loc[~distances['permuted'], 'distance'].iloc[0]
+        num_leq[distance_type] = int((distances.loc[distances['permuted'], 'distance'] <=
+                                      true_distances[distance_type]).sum())
+    return true_distances, num_leq
+
+
+def _stop_sequentially(global_distances: dict, local_distances: dict, true_distances: Dict[str, float],
+                       num_leq: Dict[str, int], num_exceedances: int):
+    # Besag-Clifford sequential stopping: the permuted global distances of each distance type are counted in
+    # permutation order, and the type is stopped at the permutation that yields its num_exceedances-th distance that
+    # is at most as small as the unpermuted one. The results of the type for later permutations are discarded.
+    is_kept = []
+    num_kept = dict.fromkeys(local_distances, 0)
+    for distance_type, distance in zip(global_distances['distance_type'], global_distances['distance']):
+        is_kept.append(num_leq[distance_type] < num_exceedances)
+        if is_kept[-1]:
+            num_leq[distance_type] += int(distance <= true_distances[distance_type])
+            num_kept[distance_type] += 1
+    for values in global_distances.values():
+        values[:] = [value for value, keep in zip(values, is_kept) if keep]
+    for distance_type, rows in local_distances.items():
+        del rows[num_kept[distance_type]:]
+
+
+def _flush_results(result_dir_path: Path, writer: LocalDistanceWriter, global_distances: dict, local_distances: dict,
+                   seed: int, num_permutations: int, completed_permutations: int,
+                   stopped_distance_types: Optional[List[str]] = None):
+    for distance_type, rows in local_distances.items():
+        writer.write(distance_type, np.vstack(rows))
+    writer.flush()
+    path_to_global_distances = result_dir_path.joinpath('global_distances.csv')
+    pd.DataFrame(data=global_distances).to_csv(str(path_to_global_distances), index=False, mode='a',
+                                               header=not path_to_global_distances.exists())
+    _save_checkpoint(result_dir_path, seed, num_permutations, completed_permutations, writer.num_rows,
+                     stopped_distance_types or [])
+    for values in global_distances.values():
+        values.clear()
+    local_distances.clear()
+
+
 def run_permutation_tests(graph_1: Union[str, Path, gt.Graph], graph_2: Union[str, Path, gt.Graph],
-                          result_directory_name: str, num_permutations: int = 1000, silent: bool = False):
-    """Runs permutation tests and saves global and local distances for original and permuted graphs as CSV files.
+                          result_directory_name: str, num_permutations: int = 1000, silent: bool = False,
+                          engine: str = 'graph_tool', n_jobs: int = 1, seed: Optional[int] = None,
+                          save_csv: bool = False, resume: bool = False, checkpoint_interval: int = 100,
+                          use_null_model_banks: bool = False, early_stopping_alpha: Optional[float] = None,
+                          profiler: Optional[str] = None):
+    """Runs permutation tests and saves global and local distances for original and permuted graphs.
+
+    Global distances are saved as CSV file. Local distances are saved in a binary store with one memory-mappable
+    matrix of shape (permutations + 1, nodes) per distance type, see graphsimqt.utils.local_distance_store. The wall
+    time, CPU time, peak memory, and item counts of the stages and of the individual permutations are saved to
+    run_metrics.json, see graphsimqt.utils.run_metrics.
 
     Parameters
     ----------
@@ -69,68 +271,196 @@ def run_permutation_tests(graph_1: Union[str, Path, gt.Graph], graph_2: Union[st
         Number of permutations.
     silent : bool, default: False
         Set to True to suppress printing progress to stdout.
+    engine : {'graph_tool', 'sparse', 'incremental'}, default: 'graph_tool'
+        Engine used to compute the distances. 'graph_tool': iterate over the neighborhoods of the nodes.
+        'sparse': align both graphs into shared-index sparse adjacency matrices and compute all distances with
+        vectorized SciPy operations. Both engines yield the same distances, but 'sparse' is much faster on large graphs.
+        'incremental': initialize the distances once on the original graphs and rewire each permutation with
+        degree-preserving double edge swaps (see graphsimqt.utils.null_model_bank.swap_edges()) instead of
+        random_rewire(), updating only the node pairs whose edges are changed by the swaps. The time per permutation
+        is hence proportional to the number of changed edges. Since the rewirings differ, the permuted distances
+        differ from the ones of the other engines. Null model banks are not supported.
+    n_jobs : int, default: 1
+        Number of worker processes among which the permutations are split. Set to -1 to use all available CPUs.
+        The results do not depend on the number of worker processes.
+    seed : int, optional
+        Master seed from which the seeds of the individual permutations are derived.
+        If not provided, fresh entropy is used and the results are not reproducible.
+    save_csv : bool, default: False
+        Set to True to additionally export the local distances to local_distances.csv in long format.
+    resume : bool, default: False
+        Set to True to resume interrupted permutation tests from the checkpoint saved in the result directory.
+        If no checkpoint is found, the permutation tests are started from scratch.
+    checkpoint_interval : int, default: 100
+        Number of permutations after which the results are flushed to disk and the checkpoint is updated.
+    use_null_model_banks : bool, default: False
+        Set to True to store the rewirings of both graphs in null model banks (see graphsimqt.utils.null_model_bank)
+        and to replay them from there. Banks are keyed on the graph after its restriction to the nodes shared with the
+        other graph, i.e., on the graph that is rewired without banks, and on the seed. They are reused by later runs
+        on the same pair with the same seed, which then skip the rewiring. The results are identical to the ones
+        obtained without banks. Requires a seed, since banks of fresh entropy could never be reused. Without seed, a
+        warning is issued and the graphs are rewired without banks.
+    early_stopping_alpha : float, optional
+        If provided, the permutations of each distance type are stopped with the sequential Monte Carlo rule of Besag
+        and Clifford as soon as h = max(1, floor(early_stopping_alpha * (num_permutations + 1))) permuted global
+        distances are at most as small as the unpermuted one. The global empirical p-value of a type stopped after l
+        permutations is h / l, which exceeds early_stopping_alpha, i.e., only distance types that are not significant
+        at this level are stopped, and the p-values of all other types are the ones of the full permutation tests.
+        Local distances are stopped together with the global distance of their type. The stopped distance types are
+        stored in the checkpoint and taken into account by
+        graphsimqt.compute_empirical_p_values.compute_empirical_p_values().
+    profiler : {'cprofile', 'pyinstrument'}, optional
+        If provided, the run is profiled and the profile is saved to the result directory.
+        See graphsimqt.utils.run_metrics.collect_run_metrics() for details.
 
     """
-    if not silent:
-        spinner = Spinner('Preparing permutation tests. ')
-        spinner.next()
-    if not isinstance(graph_1, gt.Graph):
-        graph_1 = gt.load_graph(str(graph_1))
-    if not silent:
-        spinner.next()
-    if not isinstance(graph_2, gt.Graph):
-        graph_2 = gt.load_graph(str(graph_2))
-    if not silent:
-        spinner.next()
-    _filter_exclusive_nodes(graph_1, graph_2)
-    node_ids = [graph_1.vertex_properties['ID'][node] for node in graph_1.vertices()]
-    global_distances = {'permuted': [], 'distance_type': [], 'distance': []}
-    local_distances = {'permuted': [], 'distance_type': [], 'node': [], 'distance': []}
-    if 'NORM-SCORE' in graph_1.edge_properties and 'NORM-SCORE' in graph_2.edge_properties:
-        edge_properties = {'topology_only': None,
-                           'normalized_scores': (graph_1.edge_properties['NORM-SCORE'],
-                                                 graph_2.edge_properties['NORM-SCORE']),
-                           'normalized_ranks': (graph_1.edge_properties['NORM-RANK'],
-                                                graph_2.edge_properties['NORM-RANK'])}
-    else:
-        edge_properties = {'topology_only': None}
-    for distance_type, edge_property in edge_properties.items():
+    if engine not in ENGINES:
+        raise ValueError(f'Unsupported distance engine {engine}.\n'
+                         f'Supported engines: {", ".join(ENGINES)}.')
+    if engine == 'incremental' and use_null_model_banks:
+        raise ValueError('Null model banks are not supported by the incremental engine.')
+    graph_distance = DISTANCE_ENGINES.get(engine)
+    if n_jobs < 1:
+        n_jobs = os.cpu_count()
+    result_dir_path = get_result_directory_path(result_directory_name)
+    with collect_run_metrics(result_dir_path, profiler):
         if not silent:
+            spinner = Spinner('Preparing permutation tests. ')
             spinner.next()
-        distances = GraphDistance(graph_1, graph_2, node_ids, edge_property)
-        _add_to_results(distances, False, distance_type, global_distances, local_distances)
-    if not silent:
-        spinner.finish()
-        bar = IncrementalBar('Running permutation tests.', max=num_permutations)
-    for _ in range(num_permutations):
+        with measure_stage('run_permutation_tests.prepare') as counts:
+            if not isinstance(graph_1, gt.Graph):
+                graph_1 = gt.load_graph(str(graph_1))
+            if not silent:
+                spinner.next()
+            if not isinstance(graph_2, gt.Graph):
+                graph_2 = gt.load_graph(str(graph_2))
+            if not silent:
+                spinner.next()
+            alignment = _filter_exclusive_nodes(graph_1, graph_2, NodeAlignment.from_graphs(graph_1, graph_2))
+            node_ids = alignment.node_ids
+            edge_properties = _get_edge_properties(graph_1, graph_2)
+            distance_types = list(edge_properties)
+            result_dir_path.mkdir(exist_ok=True)
+            counts.update(num_nodes=len(node_ids), num_edges_1=graph_1.num_edges(), num_edges_2=graph_2.num_edges())
+        path_to_global_distances = result_dir_path.joinpath('global_distances.csv')
+        checkpoint = None
+        if resume:
+            checkpoint = _load_checkpoint(result_dir_path, num_permutations, len(node_ids), distance_types, seed)
+        global_distances = {'permuted': [], 'distance_type': [], 'distance': []}
+        local_distances = {}
+        trackers = None
+        if engine == 'incremental':
+            with measure_stage('run_permutation_tests.initialize_trackers', num_nodes=len(node_ids),
+                               num_distance_types=len(distance_types)):
+                trackers = {distance_type: IncrementalGraphDistance(graph_1, graph_2, node_ids, edge_property,
+                                                                    alignment)
+                            for distance_type, edge_property in edge_properties.items()}
+        if checkpoint is None:
+            if seed is None:
+                if use_null_model_banks:
+                    warnings.warn('Null model banks require a seed. Rewiring without banks.')
+                    use_null_model_banks = False
+                seed = np.random.SeedSequence().entropy
+            if path_to_global_distances.exists():
+                path_to_global_distances.unlink()
+            writer = LocalDistanceWriter(result_dir_path, node_ids, distance_types, num_permutations + 1)
+            with measure_stage('run_permutation_tests.graph_distance', num_nodes=len(node_ids),
+                               num_distance_types=len(distance_types)):
+                for distance_type, edge_property in edge_properties.items():
+                    if not silent:
+                        spinner.next()
+                    if trackers is None:
+                        distances = graph_distance(graph_1, graph_2, node_ids, edge_property, alignment)
+                    else:
+                        distances = trackers[distance_type]
+                    _add_to_results(distances, False, distance_type, global_distances, local_distances)
+            completed_permutations = 0
+            _flush_results(result_dir_path, writer, global_distances, local_distances, seed, num_permutations,
+                           completed_permutations)
+        else:
+            seed = checkpoint['seed']
+            completed_permutations = checkpoint['completed_permutations']
+            writer = LocalDistanceWriter(result_dir_path, node_ids, distance_types, num_permutations + 1,
+                                         checkpoint['num_rows'])
+            _truncate_global_distances(path_to_global_distances, checkpoint['num_rows'])
+        active_distance_types = distance_types
+        if early_stopping_alpha is not None:
+            # The counts are kept in memory and updated with each chunk of permutations.
+            num_exceedances = _get_num_exceedances(early_stopping_alpha, num_permutations)
+            true_distances, num_leq = _count_exceedances(path_to_global_distances)
+            active_distance_types = [distance_type for distance_type in distance_types
+                                     if num_leq[distance_type] < num_exceedances]
+        banks = None
+        if use_null_model_banks:
+            with measure_stage('run_permutation_tests.null_model_banks', num_permutations=num_permutations):
+                banks = (build_null_model_bank(graph_1, seed, 0, num_permutations, n_jobs),
+                         build_null_model_bank(graph_2, seed, 1, num_permutations, n_jobs))
+        seeds = get_permutation_seeds(seed, num_permutations)
+        permutations = [(permutation, seed_1, seed_2) for permutation, (seed_1, seed_2) in enumerate(seeds)]
+        permutations = permutations[completed_permutations:]
+        # The results are flushed after every round of checkpoint_interval permutations, whose chunks are distributed
+        # among the workers.
+        rounds = [permutations[start:start + checkpoint_interval]
+                  for start in range(0, len(permutations), checkpoint_interval)]
+        permutation_chunk_size = max(1, min(10, min(len(permutations), checkpoint_interval) // (4 * n_jobs)))
         if not silent:
-            bar.next()
-        gtg.random_rewire(graph_1, n_iter=100)
-        # graph_1.set_directed(False)
-        gtg.random_rewire(graph_2, n_iter=100)
-        # graph_2.set_directed(False)
-        for distance_type, edge_property in edge_properties.items():
-            distances = GraphDistance(graph_1, graph_2, node_ids, edge_property)
-            _add_to_results(distances, True, distance_type, global_distances, local_distances)
-    if not silent:
-        bar.finish()
-        spinner = Spinner('Saving results of permutation tests. ')
-        spinner.next()
-
-    local_distances = pd.DataFrame(data=local_distances)
-    global_distances = pd.DataFrame(data=global_distances)
-    result_dir_path = get_result_directory_path(result_directory_name)
-    result_dir_path.mkdir(exist_ok=True)
-    path_to_local_distances = result_dir_path.joinpath('local_distances.csv')
-    path_to_global_distances = result_dir_path.joinpath('global_distances.csv')
-    local_distances.to_csv(str(path_to_local_distances), index=False)
-    global_distances.to_csv(str(path_to_global_distances), index=False)
-    if not silent:
-        spinner.finish()
-        print(f'Saved global distances to {str(path_to_global_distances)}.')
-        print(f'Saved local distances to {str(path_to_local_distances)}.')
+            spinner.finish()
+            bar = IncrementalBar('Running permutation tests.', max=num_permutations)
+            if completed_permutations > 0:
+                bar.next(completed_permutations)
+        with measure_stage('run_permutation_tests.permutations', num_permutations=0, n_jobs=n_jobs) as counts, \
+                contextlib.ExitStack() as stack:
+            if n_jobs > 1:
+                # The pool is terminated on exit, also if the permutations are interrupted by an exception.
+                pool = stack.enter_context(mp.Pool(n_jobs, initializer=_initialize_worker,
+                                                   initargs=(graph_1, graph_2, alignment, engine, banks, trackers)))
+            for permutation_round in rounds:
+                if not active_distance_types:
+                    break
+                chunks = [permutation_round[start:start + permutation_chunk_size]
+                          for start in range(0, len(permutation_round), permutation_chunk_size)]
+                if n_jobs == 1:
+                    chunk_results = (_run_permutations(graph_1, graph_2, alignment, engine, chunk,
+                                                       active_distance_types, banks, trackers) for chunk in chunks)
+                else:
+                    chunk_results = pool.imap(_run_permutations_in_worker,
+                                              [(chunk, active_distance_types) for chunk in chunks])
+                for chunk, (chunk_global_distances, chunk_local_distances, chunk_metrics) in zip(chunks, chunk_results):
+                    if not silent:
+                        bar.next(len(chunk))
+                    if early_stopping_alpha is not None:
+                        _stop_sequentially(chunk_global_distances, chunk_local_distances, true_distances, num_leq,
+                                           num_exceedances)
+                    _merge_results(global_distances, chunk_global_distances)
+                    _merge_results(local_distances, chunk_local_distances)
+                    add_permutation_metrics(chunk_metrics)
+                completed_permutations += len(permutation_round)
+                counts['num_permutations'] += len(permutation_round)
+                if early_stopping_alpha is not None:
+                    active_distance_types = [distance_type for distance_type in active_distance_types
+                                             if num_leq[distance_type] < num_exceedances]
+                _flush_results(result_dir_path, writer, global_distances, local_distances, seed, num_permutations,
+                               completed_permutations, [distance_type for distance_type in distance_types
+                                                        if distance_type not in active_distance_types])
+        if not silent:
+            bar.finish()
+        path_to_local_distances = get_local_distance_store_path(result_dir_path)
+        if save_csv:
+            if not silent:
+                spinner = Spinner('Exporting local distances to CSV. ')
+                spinner.next()
+            with measure_stage('run_permutation_tests.export_csv'):
+                path_to_local_distances = export_local_distances_to_csv(result_dir_path)
+            if not silent:
+                spinner.finish()
+        if not silent:
+            print(f'Saved global distances to {str(path_to_global_distances)}.')
+            print(f'Saved local distances to {str(path_to_local_distances)}.')
 
 
 if __name__ == '__main__':
     args = get_similarity_parser('run_permutation_tests').parse_args()
-    run_permutation_tests(args.path_to_graph_1, args.path_to_graph_2, args.dirname, args.permutations, args.silent)
+    run_permutation_tests(args.path_to_graph_1, args.path_to_graph_2, args.dirname, args.permutations, args.silent,
+                          args.engine, args.n_jobs, args.seed, args.csv, args.resume,
+                          use_null_model_banks=args.null_model_banks, early_stopping_alpha=args.early_stopping_alpha,
+                          profiler=args.profile)
@@ -1,19 +1,26 @@
 import graph_tool as gt
-from typing import Union, Tuple, Optional
+from typing import Union, Tuple, Optional, Sequence
 from pathlib import Path
 from graphsimqt.compute_shortest_path_distances import compute_shortest_path_distances
 from graphsimqt.analyze_shortest_path_distances import analyze_shortest_path_distances
+from graphsimqt.utils.get_directory_paths import get_result_directory_path
+from graphsimqt.utils.graph_snapshot import GraphSnapshot
+from graphsimqt.utils.run_metrics import collect_run_metrics, measure_stage
 from graphsimqt.utils.get_parsers import get_shortest_path_parser
 
 
-def run_shortest_path_analysis(reference_graph: Union[str, Path, gt.Graph], distance_graph: Union[str, Path, gt.Graph],
+def run_shortest_path_analysis(reference_graph: Union[str, Path, gt.Graph],
+                               distance_graph: Union[str, Path, gt.Graph, GraphSnapshot],
                                result_directory_name: str, reference_node_id_attribute_name: Optional[str] = None,
                                distance_node_id_attribute_name: Optional[str] = None,
                                reference_edge_score_attribute_name: Optional[str] = None,
                                exclude_terminals: bool = True,
-                               exclude_as_connectors: Optional[Tuple[str, str]] = None,
-                               # exclude_as_connectors: Optional[Sequence[Tuple[str, str]]] = None,
-                               silent: bool = False):
+                               exclude_as_connectors: Optional[Union[Tuple[str, str],
+                                                                     Sequence[Tuple[str, str]]]] = None,
+                               silent: bool = False, engine: str = 'pairwise', n_jobs: int = 1,
+                               max_distance: Optional[int] = None, num_landmarks: int = 16,
+                               num_error_samples: int = 10, seed: Optional[int] = None,
+                               profiler: Optional[str] = None):
     """Runs the entire shortest path analysis pipeline.
 
     Sequentially runs graphsimqt.compute_shortest_path_distances.compute_shortest_path_distances() and
@@ -23,8 +30,9 @@ def run_shortest_path_analysis(reference_graph: Union[str, Path, gt.Graph], dist
     ----------
     reference_graph : str or pathlib.Path or graph_tool.Graph
         Path to reference graph. Distances are computed for all pairs of nodes contained in this graph.
-    distance_graph : srr or pathlib.Path or graph_tool.Graph
-        Path to graph in which the distances should be computed.
+    distance_graph : srr or pathlib.Path or graph_tool.Graph or graphsimqt.utils.graph_snapshot.GraphSnapshot
+        Path to graph in which the distances should be computed. Can also be a graph snapshot or the path to a
+        snapshot directory, see graphsimqt.utils.graph_snapshot.
     result_directory_name : str
         Name of the subdirectory of the results/ directory where the results should be saved.
         Will be created if it does not exist already.
@@ -39,22 +47,42 @@ def run_shortest_path_analysis(reference_graph: Union[str, Path, gt.Graph], dist
         If not provided, unique node attribute is used if available.
     exclude_terminals : bool, default: True
         Specifies whether to exclude terminals as inner nodes in shortest paths.
-    exclude_as_connectors : tuple of (str, str), optional
-        Key-value pair, where the key is a node attribute name in the distance graph.
-        All nodes with the specified value are excluded as inner nodes in the shortest paths.
+    exclude_as_connectors : tuple of (str, str) or sequence of tuples of (str, str), optional
+        Key-value pair or sequence of key-value pairs, where the keys are node attribute names in the distance graph.
+        All nodes with any of the specified values are excluded as inner nodes in the shortest paths.
     silent : bool
         Set to True to suppress printing progress to stdout.
+    engine : {'pairwise', 'bfs', 'landmark'}, default: 'pairwise'
+        Engine used to compute the distances.
+        See graphsimqt.compute_shortest_path_distances.compute_shortest_path_distances() for details.
+    n_jobs : int, default: 1
+        Number of worker processes among which the source terminals are split. Set to -1 to use all available CPUs.
+    max_distance : int, optional
+        If provided, the distances of pairs that are farther apart are reported as inf.
+    num_landmarks : int, default: 16
+        Number of landmarks used by the 'landmark' engine.
+    num_error_samples : int, default: 10
+        Number of source terminals used to measure the error of the 'landmark' engine.
+    seed : int, optional
+        Seed used to sample the source terminals for the error report of the 'landmark' engine.
+    profiler : {'cprofile', 'pyinstrument'}, optional
+        If provided, the entire pipeline is profiled and the profile is saved to the result directory.
+        See graphsimqt.utils.run_metrics.collect_run_metrics() for details.
 
     """
-    compute_shortest_path_distances(reference_graph, distance_graph, result_directory_name,
-                                    reference_node_id_attribute_name, distance_node_id_attribute_name,
-                                    reference_edge_score_attribute_name, exclude_terminals, exclude_as_connectors,
-                                    silent)
-    analyze_shortest_path_distances(result_directory_name, silent)
+    with collect_run_metrics(get_result_directory_path(result_directory_name), profiler):
+        compute_shortest_path_distances(reference_graph, distance_graph, result_directory_name,
+                                        reference_node_id_attribute_name, distance_node_id_attribute_name,
+                                        reference_edge_score_attribute_name, exclude_terminals, exclude_as_connectors,
+                                        silent, engine, n_jobs, max_distance, num_landmarks, num_error_samples, seed)
+        with measure_stage('analyze_shortest_path_distances'):
+            analyze_shortest_path_distances(result_directory_name, silent)
 
 
 if __name__ == '__main__':
     args = get_shortest_path_parser('run_shortest_path_analysis').parse_args()
     run_shortest_path_analysis(args.path_to_reference_graph, args.path_to_distance_graph, args.dirname,
                                args.reference_id, args.distance_id, args.score, not args.use_terminals,
-                               args.exclude_as_connectors, args.silent)
+                               args.exclude_as_connectors, args.silent, args.engine,
+                               args.n_jobs, args.max_distance, args.landmarks, args.error_samples, args.seed,
+                               args.profile)
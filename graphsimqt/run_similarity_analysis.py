@@ -4,6 +4,8 @@ from graphsimqt.normalize_graph import normalize_graph
 from graphsimqt.run_permutation_tests import run_permutation_tests
 from graphsimqt.compute_empirical_p_values import compute_empirical_p_values
 from graphsimqt.compute_mwu_p_values import compute_mwu_p_values
+from graphsimqt.utils.get_directory_paths import get_result_directory_path
+from graphsimqt.utils.run_metrics import collect_run_metrics
 from graphsimqt.utils.get_parsers import get_similarity_parser
 
 
@@ -12,13 +14,18 @@ def run_similarity_analysis(path_to_graph_1: Union[str, Path], path_to_graph_2:
                             edge_score_attribute_name: Optional[str] = None, is_directed: Optional[bool] = None,
                             has_header: bool = False, normalization_method: Optional[str] = 'max',
                             num_permutations: int = 1000, adjust_method: str = 'holm-sidak',
-                            paths_to_node_sets: List[Union[str, Path]] = [], silent: bool = False):
+                            paths_to_node_sets: List[Union[str, Path]] = [], silent: bool = False,
+                            engine: str = 'graph_tool', n_jobs: int = 1, seed: Optional[int] = None,
+                            save_csv: bool = False, resume: bool = False, use_cache: bool = False,
+                            use_null_model_banks: bool = False, early_stopping_alpha: Optional[float] = None,
+                            profiler: Optional[str] = None, chunk_size: Optional[int] = None):
     """Runs the entire similarity analysis pipeline.
 
     Calls graphsimqt.normalize_graph.normalize_graph() on the input graphs and then sequentially runs
     graphsimqt.run_permutation_tests.run_permutation_tests(),
     graphsimqt.compute_empirical_p_values.compute_empirical_p_values(), and
-    graphsimqt.compute_mwu_p_values.compute_mwu_p_values().
+    graphsimqt.compute_mwu_p_values.compute_mwu_p_values(). The metrics of all stages are saved to run_metrics.json
+    in the result directory, see graphsimqt.utils.run_metrics.
 
     Parameters
     ----------
@@ -68,19 +75,51 @@ def run_similarity_analysis(path_to_graph_1: Union[str, Path], path_to_graph_2:
         csv: comma. csv2: semicolon. tsv: tab. 'wsv: whitespace.
     silent : bool, default: False
         Set to True to suppress printing progress to stdout.
+    engine : {'graph_tool', 'sparse', 'incremental'}, default: 'graph_tool'
+        Engine used to compute the distances in the permutation tests.
+        See graphsimqt.run_permutation_tests.run_permutation_tests() for details.
+    n_jobs : int, default: 1
+        Number of worker processes among which the permutations are split. Set to -1 to use all available CPUs.
+    seed : int, optional
+        Master seed from which the seeds of the individual permutations are derived.
+    save_csv : bool, default: False
+        Set to True to additionally export the local distances to local_distances.csv in long format.
+    resume : bool, default: False
+        Set to True to resume interrupted permutation tests from the checkpoint saved in the result directory.
+    use_cache : bool, default: False
+        Set to True to look up the normalized graphs in the normalization cache.
+        See graphsimqt.normalize_graph.normalize_graph() for details.
+    use_null_model_banks : bool, default: False
+        Set to True to store and replay the rewirings of the permutation tests in null model banks.
+        See graphsimqt.run_permutation_tests.run_permutation_tests() for details.
+    early_stopping_alpha : float, optional
+        If provided, the permutations of a distance type are stopped early once it is certain that its global
+        empirical p-value exceeds early_stopping_alpha.
+        See graphsimqt.run_permutation_tests.run_permutation_tests() for details.
+    profiler : {'cprofile', 'pyinstrument'}, optional
+        If provided, the entire pipeline is profiled and the profile is saved to the result directory.
+        See graphsimqt.utils.run_metrics.collect_run_metrics() for details.
+    chunk_size : int, optional
+        If provided, edge list input is streamed in chunks of this many edges.
+        See graphsimqt.normalize_graph.normalize_graph() for details.
 
     """
-    graph_1 = normalize_graph(path_to_graph_1, node_id_attribute_name, edge_score_attribute_name, is_directed,
-                              has_header, normalization_method, silent, False)
-    graph_2 = normalize_graph(path_to_graph_2, node_id_attribute_name, edge_score_attribute_name, is_directed,
-                              has_header, normalization_method, silent, False)
-    run_permutation_tests(graph_1, graph_2, result_directory_name, num_permutations, silent)
-    compute_empirical_p_values(result_directory_name, adjust_method, silent)
-    compute_mwu_p_values(result_directory_name, adjust_method, paths_to_node_sets, silent)
+    with collect_run_metrics(get_result_directory_path(result_directory_name), profiler):
+        graph_1 = normalize_graph(path_to_graph_1, node_id_attribute_name, edge_score_attribute_name, is_directed,
+                                  has_header, normalization_method, silent, False, use_cache, chunk_size=chunk_size)
+        graph_2 = normalize_graph(path_to_graph_2, node_id_attribute_name, edge_score_attribute_name, is_directed,
+                                  has_header, normalization_method, silent, False, use_cache, chunk_size=chunk_size)
+        run_permutation_tests(graph_1, graph_2, result_directory_name, num_permutations, silent, engine, n_jobs,
+                              seed, save_csv, resume, use_null_model_banks=use_null_model_banks,
+                              early_stopping_alpha=early_stopping_alpha)
+        compute_empirical_p_values(result_directory_name, adjust_method, silent)
+        compute_mwu_p_values(result_directory_name, adjust_method, paths_to_node_sets, silent)
 
 
 if __name__ == '__main__':
     args = get_similarity_parser('run_similarity_analysis').parse_args()
     run_similarity_analysis(args.path_to_graph_1, args.path_to_graph_2, args.dirname, args.id, args.score,
                             args.directed, args.header, args.normalization, args.permutations, args.adjust,
-                            args.nodesets, args.silent)
+                            args.nodesets, args.silent, args.engine, args.n_jobs, args.seed,
+                            args.csv, args.resume, args.use_cache, args.null_model_banks, args.early_stopping_alpha,
+                            args.profile, args.chunk_size)
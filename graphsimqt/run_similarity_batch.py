@@ -0,0 +1,268 @@
+import json
+import os
+import warnings
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor, Future, wait, FIRST_COMPLETED
+from pathlib import Path
+from typing import Union, List, Optional, Dict, Tuple
+from graphsimqt.utils.get_directory_paths import get_result_directory_path
+from graphsimqt.utils.get_parsers import get_similarity_parser
+
+
+GRAPH_PARAMETERS = ['node_id_attribute_name', 'edge_score_attribute_name', 'is_directed', 'has_header',
+                    'normalization_method', 'chunk_size']
+
+PAIR_PARAMETERS = ['num_permutations', 'adjust_method', 'paths_to_node_sets', 'engine', 'n_jobs', 'seed', 'save_csv',
+                   'use_null_model_banks', 'early_stopping_alpha']
+
+
+def _load_manifest(manifest: Union[str, Path, List[dict]]) -> List[dict]:
+    if isinstance(manifest, list):
+        return [dict(entry) for entry in manifest]
+    if isinstance(manifest, str):
+        manifest = Path(manifest)
+    if manifest.suffix == '.json':
+        with open(str(manifest)) as fp:
+            return json.load(fp)
+    supported_formats = {'.json', '.csv', '.csv2', '.tsv', '.wsv'}
+    if manifest.suffix not in supported_formats:
+        raise ValueError(f'Unsupported manifest format {manifest.suffix}.\n'
+                         f'Supported formats: {", ".join(supported_formats)}.')
+    sep = {'.csv': ',', '.wsv': ' ', '.tsv': '\t', '.csv2': ';'}[manifest.suffix]
+    entries = pd.read_csv(str(manifest), sep=sep).to_dict(orient='records')
+    return [{key: value for key, value in entry.items() if not pd.isna(value)} for entry in entries]
+
+
+def _get_pair_parameters(entry: dict, defaults: dict) -> Tuple[dict, dict]:
+    for key in ['path_to_graph_1', 'path_to_graph_2', 'result_directory_name']:
+        if key not in entry:
+            raise ValueError(f'Manifest entry {entry} is missing the required key {key}.')
+    unknown_keys = set(entry).difference(defaults, ['path_to_graph_1', 'path_to_graph_2', 'result_directory_name'])
+    if unknown_keys:
+        raise ValueError(f'Manifest entry {entry} contains unknown keys: {", ".join(sorted(unknown_keys))}.')
+    parameters = {**defaults, **entry}
+    graph_parameters = {key: parameters[key] for key in GRAPH_PARAMETERS}
+    pair_parameters = {key: parameters[key] for key in PAIR_PARAMETERS}
+    if isinstance(pair_parameters['paths_to_node_sets'], (str, Path)):
+        pair_parameters['paths_to_node_sets'] = [pair_parameters['paths_to_node_sets']]
+    pair_parameters['paths_to_node_sets'] = [str(path) for path in pair_parameters['paths_to_node_sets']]
+    return graph_parameters, pair_parameters
+
+
+def _get_graph_key(path_to_graph: Path, graph_parameters: dict) -> str:
+    return json.dumps([str(path_to_graph.resolve()), graph_parameters], sort_keys=True)
+
+
+def _get_input_stamps(paths: List[Path]) -> Dict[str, List[int]]:
+    stamps = {}
+    for path in paths:
+        stat = path.stat()
+        if not os.access(str(path), os.R_OK):
+            raise PermissionError(f'Permission denied: {str(path)}')
+        stamps[str(path.resolve())] = [stat.st_size, stat.st_mtime_ns]
+    return stamps
+
+
+def _get_stamp(paths_to_graphs: Tuple[Path, Path], graph_parameters: dict, pair_parameters: dict) -> dict:
+    # The number of worker processes does not affect the results and is hence not part of the stamp. The use of null
+    # model banks is, so that results computed with banks are never reused by runs without banks and vice versa.
+    paths_to_inputs = list(paths_to_graphs) + [Path(path) for path in pair_parameters['paths_to_node_sets']]
+    return {'graph_parameters': graph_parameters,
+            'pair_parameters': {key: value for key, value in pair_parameters.items() if key != 'n_jobs'},
+            'inputs': _get_input_stamps(paths_to_inputs)}
+
+
+def _is_up_to_date(result_directory_name: str, stamp: dict) -> bool:
+    result_dir_path = get_result_directory_path(result_directory_name)
+    path_to_stamp = result_dir_path.joinpath('batch_stamp.json')
+    if not path_to_stamp.exists():
+        return False
+    for file_name in ['global_distances.csv', 'global_empirical_p_values.csv', 'local_empirical_p_values.csv',
+                      'global_mwu_p_values.csv']:
+        if not result_dir_path.joinpath(file_name).exists():
+            return False
+    with open(str(path_to_stamp)) as fp:
+        return json.load(fp) == stamp
+
+
+def _normalize_graph_in_worker(path_to_graph: Path, graph_parameters: dict):
+    # The pipeline modules (and graph_tool) are only imported by the worker processes.
+    from graphsimqt.normalize_graph import normalize_graph
+    normalize_graph(path_to_graph, silent=True, save=False, use_cache=True, **graph_parameters)
+
+
+def _run_pair_in_worker(paths_to_graphs: Tuple[Path, Path], graph_parameters: dict, result_directory_name: str,
+                        pair_parameters: dict, stamp: dict):
+    from graphsimqt.normalize_graph import normalize_graph
+    from graphsimqt.run_permutation_tests import run_permutation_tests
+    from graphsimqt.compute_empirical_p_values import compute_empirical_p_values
+    from graphsimqt.compute_mwu_p_values import compute_mwu_p_values
+    # The normalized graphs are loaded from the normalization cache, or normalized again if they have been evicted.
+    graph_1 = normalize_graph(paths_to_graphs[0], silent=True, save=False, use_cache=True, **graph_parameters)
+    graph_2 = normalize_graph(paths_to_graphs[1], silent=True, save=False, use_cache=True, **graph_parameters)
+    run_permutation_tests(graph_1, graph_2, result_directory_name,
+                          pair_parameters['num_permutations'], True, pair_parameters['engine'],
+                          pair_parameters['n_jobs'], pair_parameters['seed'], pair_parameters['save_csv'],
+                          use_null_model_banks=pair_parameters['use_null_model_banks'],
+                          early_stopping_alpha=pair_parameters['early_stopping_alpha'])
+    compute_empirical_p_values(result_directory_name, pair_parameters['adjust_method'], True)
+    compute_mwu_p_values(result_directory_name, pair_parameters['adjust_method'],
+                         pair_parameters['paths_to_node_sets'], True)
+    # The stamp is written last, so that interrupted pairs are never considered to be up to date.
+    with open(str(get_result_directory_path(result_directory_name).joinpath('batch_stamp.json')), 'w') as fp:
+        json.dump(stamp, fp)
+
+
+def run_similarity_batch(manifest: Union[str, Path, List[dict]], max_workers: int = 4,
+                         node_id_attribute_name: Optional[str] = None, edge_score_attribute_name: Optional[str] = None,
+                         is_directed: Optional[bool] = None, has_header: bool = False,
+                         normalization_method: Optional[str] = 'max', num_permutations: int = 1000,
+                         adjust_method: str = 'holm-sidak', paths_to_node_sets: List[Union[str, Path]] = [],
+                         engine: str = 'graph_tool', n_jobs: int = 1, seed: Optional[int] = None,
+                         save_csv: bool = False, use_null_model_banks: bool = False,
+                         early_stopping_alpha: Optional[float] = None, force: bool = False, silent: bool = False,
+                         chunk_size: Optional[int] = None) -> Dict[str, str]:
+    """Runs the similarity analysis pipeline for a batch of graph pairs.
+
+    Each distinct input graph is normalized only once and stored in the normalization cache (see
+    graphsimqt.utils.normalization_cache), from which it is loaded by all pairs that use it. The pairs are run
+    concurrently on a bounded pool of worker processes, where each pair is started as soon as both of its graphs have
+    been normalized. For each pair, the same steps as in
+    graphsimqt.run_similarity_analysis.run_similarity_analysis() are carried out. Pairs whose outputs are up to date,
+    i.e., which have been computed with the same parameters from unchanged input files, are skipped.
+
+    Parameters
+    ----------
+    manifest : str or pathlib.Path or list of dict
+        (Path to) manifest of the graph pairs. Either a list of dictionaries, a JSON file containing such a list, or a
+        tabular file with one row per pair (the separator is derived from the suffix, see compute_mwu_p_values()).
+        Each entry must specify path_to_graph_1, path_to_graph_2, and result_directory_name and can override the
+        values of the remaining parameters of this function except manifest, max_workers, force, and silent.
+    max_workers : int, default: 4
+        Maximal number of pairs and graph normalizations processed concurrently. Set to -1 to use all available CPUs.
+        Note that each pair can additionally use n_jobs worker processes for its permutation tests.
+    node_id_attribute_name : str, optional
+        Name of node ID attribute to be used for GraphML input.
+    edge_score_attribute_name : str, optional
+        Name of edge score attribute to be used for GraphML input.
+    is_directed : bool, optional
+        Specifies if graphs given as edge lists should be interpreted as directed (True) or undirected (False).
+    has_header : bool, default: False
+        Specifies if edge list input contains a header that should be skipped.
+    normalization_method: {'max', 'max-min', 'z-score'}, default: 'max'
+        Method used to normalize the scores.
+    num_permutations : int, default: 1000
+        Number of permutations.
+    adjust_method : str, default: 'holm-sidak'
+        Method used for adjusting the p-values.
+    paths_to_node_sets : list of str or pathlib.Path, default: []
+        List of paths to node sets files for which MWU p-values should be computed.
+    engine : {'graph_tool', 'sparse', 'incremental'}, default: 'graph_tool'
+        Engine used to compute the distances in the permutation tests.
+    n_jobs : int, default: 1
+        Number of worker processes among which the permutations of each pair are split.
+    seed : int, optional
+        Master seed from which the seeds of the individual permutations are derived.
+    save_csv : bool, default: False
+        Set to True to additionally export the local distances to local_distances.csv in long format.
+    use_null_model_banks : bool, default: False
+        Set to True to store and replay the rewirings of the permutation tests in null model banks.
+    early_stopping_alpha : float, optional
+        If provided, the permutations of a distance type are stopped early once it is certain that its global
+        empirical p-value exceeds early_stopping_alpha.
+        See graphsimqt.run_permutation_tests.run_permutation_tests() for details.
+    force : bool, default: False
+        Set to True to rerun all pairs, even if their outputs are up to date.
+    silent : bool, default: False
+        Set to True to suppress printing progress to stdout.
+    chunk_size : int, optional
+        If provided, edge list input is streamed in chunks of this many edges.
+        See graphsimqt.normalize_graph.normalize_graph() for details.
+
+    Returns
+    -------
+    statuses : dict of str to str
+        Status of each pair ('completed', 'skipped', or 'failed'), keyed by result directory name.
+
+    """
+    defaults = {'node_id_attribute_name': node_id_attribute_name,
+                'edge_score_attribute_name': edge_score_attribute_name, 'is_directed': is_directed,
+                'has_header': has_header, 'normalization_method': normalization_method, 'chunk_size': chunk_size,
+                'num_permutations': num_permutations, 'adjust_method': adjust_method,
+                'paths_to_node_sets': paths_to_node_sets, 'engine': engine, 'n_jobs': n_jobs, 'seed': seed,
+                'save_csv': save_csv, 'use_null_model_banks': use_null_model_banks,
+                'early_stopping_alpha': early_stopping_alpha}
+    if max_workers < 1:
+        max_workers = os.cpu_count()
+    statuses = {}
+    pairs = []
+    graphs = {}
+    for entry in _load_manifest(manifest):
+        graph_parameters, pair_parameters = _get_pair_parameters(entry, defaults)
+        result_directory_name = str(entry['result_directory_name'])
+        if result_directory_name in statuses:
+            raise ValueError(f'Result directory name {result_directory_name} is used by several pairs.')
+        paths_to_graphs = (Path(entry['path_to_graph_1']), Path(entry['path_to_graph_2']))
+        try:
+            stamp = _get_stamp(paths_to_graphs, graph_parameters, pair_parameters)
+        except OSError as error:
+            # Missing or unreadable inputs only fail their own pair.
+            statuses[result_directory_name] = 'failed'
+            warnings.warn(f'Inputs of {result_directory_name} are not accessible: {error}')
+            if not silent:
+                print(f'Finished {result_directory_name} (failed).')
+            continue
+        if not force and _is_up_to_date(result_directory_name, stamp):
+            statuses[result_directory_name] = 'skipped'
+            if not silent:
+                print(f'Skipping {result_directory_name} (up to date).')
+            continue
+        statuses[result_directory_name] = 'pending'
+        graph_keys = tuple(_get_graph_key(path_to_graph, graph_parameters) for path_to_graph in paths_to_graphs)
+        for graph_key, path_to_graph in zip(graph_keys, paths_to_graphs):
+            graphs[graph_key] = (path_to_graph, graph_parameters)
+        pairs.append((result_directory_name, paths_to_graphs, graph_parameters, graph_keys, pair_parameters, stamp))
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        graph_futures = {}
+        for graph_key, (path_to_graph, graph_parameters) in graphs.items():
+            graph_futures[graph_key] = executor.submit(_normalize_graph_in_worker, path_to_graph, graph_parameters)
+        pair_futures: Dict[Future, str] = {}
+        while pairs or pair_futures:
+            waiting_pairs = []
+            for pair in pairs:
+                result_directory_name, paths_to_graphs, graph_parameters, graph_keys, pair_parameters, stamp = pair
+                futures = [graph_futures[graph_key] for graph_key in graph_keys]
+                if not all(future.done() for future in futures):
+                    waiting_pairs.append(pair)
+                    continue
+                exceptions = [future.exception() for future in futures if future.exception() is not None]
+                if exceptions:
+                    statuses[result_directory_name] = 'failed'
+                    warnings.warn(f'Normalization of the graphs for {result_directory_name} failed: {exceptions[0]}')
+                    continue
+                future = executor.submit(_run_pair_in_worker, paths_to_graphs, graph_parameters, result_directory_name,
+                                         pair_parameters, stamp)
+                pair_futures[future] = result_directory_name
+            pairs = waiting_pairs
+            running_futures = set(pair_futures).union(future for future in graph_futures.values() if not future.done())
+            if not running_futures:
+                continue
+            done_futures, _ = wait(running_futures, return_when=FIRST_COMPLETED)
+            for future in done_futures.intersection(pair_futures):
+                result_directory_name = pair_futures.pop(future)
+                if future.exception() is not None:
+                    statuses[result_directory_name] = 'failed'
+                    warnings.warn(f'Similarity analysis {result_directory_name} failed: {future.exception()}')
+                else:
+                    statuses[result_directory_name] = 'completed'
+                if not silent:
+                    print(f'Finished {result_directory_name} ({statuses[result_directory_name]}).')
+    return statuses
+
+
+if __name__ == '__main__':
+    args = get_similarity_parser('run_similarity_batch').parse_args()
+    run_similarity_batch(args.manifest, args.max_workers, args.id, args.score, args.directed, args.header,
+                         args.normalization, args.permutations, args.adjust, args.nodesets, args.engine, args.n_jobs,
+                         args.seed, args.csv, args.null_model_banks, args.early_stopping_alpha,
+                         args.force, args.silent, args.chunk_size)
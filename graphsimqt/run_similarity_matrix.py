@@ -0,0 +1,385 @@
+import graph_tool as gt
+import pandas as pd
+import numpy as np
+import multiprocessing as mp
+import contextlib
+import os
+import time
+import warnings
+from pathlib import Path
+from typing import Union, Optional, List, Tuple, Dict
+from progress.spinner import Spinner
+from progress.bar import IncrementalBar
+from graphsimqt.normalize_graph import normalize_graph, _split_graph_path
+from graphsimqt.run_permutation_tests import DISTANCE_ENGINES, _add_to_results, _get_edge_properties, \
+    _merge_results, _flush_results
+from graphsimqt.compute_empirical_p_values import compute_empirical_p_values
+from graphsimqt.compute_mwu_p_values import compute_mwu_p_values
+from graphsimqt.utils.node_alignment import NodeAlignment
+from graphsimqt.utils.null_model_bank import NullModelBank, build_null_model_bank, get_permutation_seeds, rewire_graph
+from graphsimqt.utils.get_directory_paths import get_result_directory_path
+from graphsimqt.utils.local_distance_store import LocalDistanceWriter, export_local_distances_to_csv
+from graphsimqt.utils.run_metrics import collect_run_metrics, measure_stage, add_permutation_metrics
+from graphsimqt.utils.get_parsers import get_similarity_parser
+
+
+ALIGNMENTS = {'intersection', 'union'}
+
+# Number of permutations after which the distances of all pairs are flushed to disk.
+FLUSH_INTERVAL = 100
+
+_worker_state = {}
+
+
+def _get_graph_names(graphs: List[Union[str, Path, gt.Graph]], graph_names: Optional[List[str]]) -> List[str]:
+    if graph_names is None:
+        graph_names = [_split_graph_path(Path(graph))[0] if not isinstance(graph, gt.Graph) else f'graph_{position}'
+                       for position, graph in enumerate(graphs)]
+    if len(graph_names) != len(graphs):
+        raise ValueError(f'Got {len(graph_names)} names for {len(graphs)} graphs.')
+    if len(set(graph_names)) != len(graph_names):
+        raise ValueError(f'The graph names must be unique, but are {", ".join(graph_names)}.')
+    return [str(graph_name) for graph_name in graph_names]
+
+
+def _align_graphs(graphs: List[gt.Graph], alignment: str) -> Tuple[pd.Index, List[np.ndarray]]:
+    # Hashes the node IDs of all graphs once. Afterwards, all graphs contain the same nodes, and the vertices of each
+    # graph are mapped to their positions in the returned index, from which the alignments of all pairs are built.
+    ids = [pd.Index(np.array(list(graph.vertex_properties['ID']), dtype=object)) for graph in graphs]
+    index = ids[0].append(ids[1:]).unique()
+    positions = [index.get_indexer(graph_ids) for graph_ids in ids]
+    if alignment == 'intersection':
+        is_common = np.bincount(np.concatenate(positions), minlength=index.shape[0]) == len(graphs)
+        if not is_common.any():
+            raise ValueError('The graphs have no nodes in common.')
+        new_positions = np.cumsum(is_common) - 1
+        for graph_index, graph in enumerate(graphs):
+            # Purging preserves the relative order of the remaining vertices.
+            is_kept = is_common[positions[graph_index]]
+            graph.set_vertex_filter(graph.new_vp('bool', vals=is_kept))
+            graph.purge_vertices()
+            graph.clear_filters()
+            positions[graph_index] = new_positions[positions[graph_index][is_kept]]
+        return index[is_common], positions
+    for graph_index, graph in enumerate(graphs):
+        # Nodes missing in a graph are added as isolated vertices, which are not affected by the rewiring.
+        is_contained = np.zeros(index.shape[0], dtype=bool)
+        is_contained[positions[graph_index]] = True
+        missing_positions = np.flatnonzero(~is_contained)
+        if missing_positions.shape[0] > 0:
+            # The vertices are added at once, and the ID property is rebuilt from the hashed IDs.
+            graph.add_vertex(missing_positions.shape[0])
+            graph.vertex_properties['ID'] = graph.new_vp('string', vals=list(ids[graph_index].append(
+                index[missing_positions])))
+        positions[graph_index] = np.concatenate((positions[graph_index], missing_positions))
+    return index, positions
+
+
+def _run_permutations(graphs: List[gt.Graph], pairs: List[Tuple[int, int]], alignments: List[NodeAlignment],
+                      engine: str, permutations: List[Tuple[int, Tuple[int, ...]]],
+                      banks: Optional[List[NullModelBank]]) -> Tuple[List[dict], List[dict], List[dict]]:
+    # Each graph is rewired once per permutation, and the rewiring is shared by all pairs that contain the graph.
+    # As in graphsimqt.run_permutation_tests, the results do not depend on how the permutations are distributed
+    # among the workers.
+    global_distances = [{'permuted': [], 'distance_type': [], 'distance': []} for _ in pairs]
+    local_distances = [{} for _ in pairs]
+    permutation_metrics = []
+    for permutation, seeds in permutations:
+        start_wall_time, start_cpu_time = time.perf_counter(), time.process_time()
+        if banks is None:
+            rewirings = [rewire_graph(graph, seed) for graph, seed in zip(graphs, seeds)]
+        else:
+            rewirings = [bank.get_graph(graph, permutation) for graph, bank in zip(graphs, banks)]
+        permuted_graphs = [permuted_graph for permuted_graph, _ in rewirings]
+        rewiring_wall_time = time.perf_counter() - start_wall_time
+        num_evaluated_nodes = 0
+        for pair_index, (graph_index_1, graph_index_2) in enumerate(pairs):
+            permuted_graph_1, permuted_graph_2 = permuted_graphs[graph_index_1], permuted_graphs[graph_index_2]
+            alignment = alignments[pair_index]
+            for distance_type, edge_property in _get_edge_properties(permuted_graph_1, permuted_graph_2).items():
+                num_evaluated_nodes += len(alignment.node_ids)
+                distances = DISTANCE_ENGINES[engine](permuted_graph_1, permuted_graph_2, alignment.node_ids,
+                                                     edge_property, alignment)
+                _add_to_results(distances, True, distance_type, global_distances[pair_index],
+                                local_distances[pair_index])
+        permutation_metrics.append({'permutation': permutation,
+                                    'wall_time': time.perf_counter() - start_wall_time,
+                                    'cpu_time': time.process_time() - start_cpu_time,
+                                    'rewiring_wall_time': rewiring_wall_time,
+                                    'num_rewired_edges': sum(num_rewired_edges for _, num_rewired_edges in rewirings),
+                                    'num_evaluated_nodes': num_evaluated_nodes})
+    return global_distances, local_distances, permutation_metrics
+
+
+def _initialize_worker(graphs: List[gt.Graph], pairs: List[Tuple[int, int]], alignments: List[NodeAlignment],
+                       engine: str, banks: Optional[List[NullModelBank]]):
+    _worker_state['args'] = (graphs, pairs, alignments, engine)
+    _worker_state['banks'] = banks
+
+
+def _run_permutations_in_worker(permutations: List[Tuple[int, Tuple[int, ...]]]) -> Tuple[List[dict], List[dict],
+                                                                                          List[dict]]:
+    graphs, pairs, alignments, engine = _worker_state['args']
+    return _run_permutations(graphs, pairs, alignments, engine, permutations, _worker_state['banks'])
+
+
+def _get_pair_results(result_directory_name: str, graph_names: List[str], pairs: List[Tuple[int, int]],
+                      pair_directory_names: List[str]) -> pd.DataFrame:
+    pair_results = []
+    for (graph_index_1, graph_index_2), pair_directory_name in zip(pairs, pair_directory_names):
+        pair_dir_path = get_result_directory_path(result_directory_name).joinpath(pair_directory_name)
+        global_distances = pd.read_csv(str(pair_dir_path.joinpath('global_distances.csv')))
+        results = global_distances.loc[~global_distances['permuted'], ['distance_type', 'distance']]
+        empirical_p_values = pd.read_csv(str(pair_dir_path.joinpath('global_empirical_p_values.csv')))
+        mwu_p_values = pd.read_csv(str(pair_dir_path.joinpath('global_mwu_p_values.csv')))
+        results = results.merge(empirical_p_values.rename(columns={'p_value': 'empirical_p_value'}), on='distance_type')
+        results = results.merge(mwu_p_values.rename(columns={'p_value': 'mwu_p_value'}), on='distance_type')
+        results.insert(0, 'graph_1', graph_names[graph_index_1])
+        results.insert(1, 'graph_2', graph_names[graph_index_2])
+        results.insert(2, 'result_directory_name', f'{result_directory_name}/{pair_directory_name}')
+        pair_results.append(results)
+    return pd.concat(pair_results, ignore_index=True)
+
+
+def _get_distance_matrices(graph_names: List[str], pair_results: pd.DataFrame) -> Dict[str, pd.DataFrame]:
+    # Distance types that are not available for a pair (e.g., since one of its graphs has no edge scores) are NaN.
+    distance_matrices = {}
+    for distance_type, results in pair_results.groupby('distance_type', sort=False):
+        distance_matrix = pd.DataFrame(data=np.full((len(graph_names), len(graph_names)), np.nan), index=graph_names,
+                                       columns=graph_names)
+        for graph_name in graph_names:
+            distance_matrix.loc[graph_name, graph_name] = 0.0
+        for graph_1, graph_2, distance in zip(results['graph_1'], results['graph_2'], results['distance']):
+            distance_matrix.loc[graph_1, graph_2] = distance
+            distance_matrix.loc[graph_2, graph_1] = distance
+        distance_matrices[distance_type] = distance_matrix
+    return distance_matrices
+
+
+def run_similarity_matrix(graphs: List[Union[str, Path, gt.Graph]], result_directory_name: str,
+                          graph_names: Optional[List[str]] = None, alignment: str = 'intersection',
+                          node_id_attribute_name: Optional[str] = None, edge_score_attribute_name: Optional[str] = None,
+                          is_directed: Optional[bool] = None, has_header: bool = False,
+                          normalization_method: Optional[str] = 'max', num_permutations: int = 1000,
+                          adjust_method: str = 'holm-sidak', paths_to_node_sets: List[Union[str, Path]] = [],
+                          silent: bool = False, engine: str = 'graph_tool', n_jobs: int = 1,
+                          seed: Optional[int] = None, save_csv: bool = False, use_cache: bool = False,
+                          use_null_model_banks: bool = False, profiler: Optional[str] = None,
+                          chunk_size: Optional[int] = None) -> Tuple[Dict[str, pd.DataFrame], pd.DataFrame]:
+    """Runs the similarity analysis for all pairs of a list of graphs in one pass.
+
+    In contrast to running graphsimqt.run_similarity_analysis.run_similarity_analysis() for each of the N(N-1)/2
+    pairs, each graph is normalized and aligned only once, and each permutation rewires each graph only once and
+    evaluates all pairs on the shared rewirings. For each pair, the same files as in
+    graphsimqt.run_similarity_analysis.run_similarity_analysis() are saved in the subdirectory
+    <graph_name_1>_vs_<graph_name_2> of the result directory, and the empirical and MWU p-values are computed from them.
+    Within each pair, the two graphs are rewired independently, so the null distributions of the individual pairs are
+    the same as in the pairwise analyses. For two graphs, the results coincide with the ones of
+    run_similarity_analysis() with the same seed. Additionally, the global distances of all pairs are saved as one
+    distance matrix per distance type to <distance_type>_distance_matrix.csv and, together with the global p-values,
+    to pair_results.csv. The metrics of all stages are saved to run_metrics.json, see graphsimqt.utils.run_metrics.
+
+    Parameters
+    ----------
+    graphs : list of str or pathlib.Path or graph_tool.Graph
+        Paths to at least two graphs, which are normalized as in graphsimqt.normalize_graph.normalize_graph(), or
+        graphs that have already been normalized.
+    result_directory_name : str
+        Name of the subdirectory of the results/ directory where the results should be saved.
+        Will be created if it does not exist already.
+    graph_names : list of str, optional
+        Unique names of the graphs used in the distance matrices and in the names of the pair subdirectories.
+        If not provided, the stems of the paths are used (and graph_<position> for graph_tool.Graph input).
+    alignment : {'intersection', 'union'}, default: 'intersection'
+        Node set on which all graphs are compared. 'intersection': nodes contained in all graphs. 'union': nodes
+        contained in any graph, where nodes missing in a graph are added to it as isolated nodes. In both cases, all
+        pairs are compared on the same nodes, so the distances are comparable across pairs.
+    node_id_attribute_name : str, optional
+        Name of node ID attribute to be used for GraphML input.
+        If not provided, unique node attribute is used if available.
+        Not used for edge list input.
+    edge_score_attribute_name : str, optional
+        Name of edge score attribute to be used for GraphML input.
+        If not provided, unique edge attribute is used if available.
+        Not used for edge list input.
+    is_directed : bool, optional
+        Specifies if graphs given as edge lists should be interpreted as directed (True) or undirected (False).
+        Not used for GraphML input.
+    has_header : bool, default: False
+        Specifies if edge list input contains a header that should be skipped.
+        Not used for GraphML input.
+    normalization_method: {'max', 'max-min', 'z-score'}, default: 'max'
+        Method used to normalize the scores.
+    num_permutations : int, default: 1000
+        Number of permutations.
+    adjust_method : str, default: 'holm-sidak'
+        Method used for adjusting the p-values.
+        Can be set to any of the methods available in statsmodels.stats.multitest.multipletests().
+    paths_to_node_sets : list of str or pathlib.Path, default: []
+        List of paths to node sets files for which MWU p-values should be computed for each pair.
+        See graphsimqt.compute_mwu_p_values.compute_mwu_p_values() for details.
+    silent : bool, default: False
+        Set to True to suppress printing progress to stdout.
+    engine : {'graph_tool', 'sparse'}, default: 'graph_tool'
+        Engine used to compute the distances.
+        See graphsimqt.run_permutation_tests.run_permutation_tests() for details.
+    n_jobs : int, default: 1
+        Number of worker processes among which the permutations are split. Set to -1 to use all available CPUs.
+        The results do not depend on the number of worker processes.
+    seed : int, optional
+        Master seed from which the seeds of the individual permutations are derived.
+        If not provided, fresh entropy is used and the results are not reproducible.
+    save_csv : bool, default: False
+        Set to True to additionally export the local distances of each pair to local_distances.csv in long format.
+    use_cache : bool, default: False
+        Set to True to look up the normalized graphs in the normalization cache.
+        See graphsimqt.normalize_graph.normalize_graph() for details.
+    use_null_model_banks : bool, default: False
+        Set to True to store and replay the rewirings of each graph in a null model bank. The banks are built for the
+        aligned graphs, i.e., for the graphs that are rewired without banks, so the results do not depend on this flag.
+        Requires a seed, since banks of fresh entropy could never be reused. Without seed, a warning is issued and the
+        graphs are rewired without banks. See graphsimqt.run_permutation_tests.run_permutation_tests() for details.
+    profiler : {'cprofile', 'pyinstrument'}, optional
+        If provided, the run is profiled and the profile is saved to the result directory.
+        See graphsimqt.utils.run_metrics.collect_run_metrics() for details.
+    chunk_size : int, optional
+        If provided, edge list input is streamed in chunks of this many edges.
+        See graphsimqt.normalize_graph.normalize_graph() for details.
+
+    Returns
+    -------
+    distance_matrices : dict of str to pandas.DataFrame
+        Symmetric matrices of the global distances between the unpermuted graphs, keyed by distance type and indexed
+        by the graph names.
+    pair_results : pandas.DataFrame
+        Global distance, empirical p-value, and MWU p-value of each pair and distance type.
+
+    """
+    if len(graphs) < 2:
+        raise ValueError(f'At least two graphs are required, but got {len(graphs)}.')
+    if alignment not in ALIGNMENTS:
+        raise ValueError(f'Unsupported alignment {alignment}.\n'
+                         f'Supported alignments: {", ".join(ALIGNMENTS)}.')
+    if engine not in DISTANCE_ENGINES:
+        raise ValueError(f'Unsupported distance engine {engine}.\n'
+                         f'Supported engines: {", ".join(DISTANCE_ENGINES)}.')
+    graph_names = _get_graph_names(graphs, graph_names)
+    if n_jobs < 1:
+        n_jobs = os.cpu_count()
+    result_dir_path = get_result_directory_path(result_directory_name)
+    with collect_run_metrics(result_dir_path, profiler):
+        graphs = [gt.Graph(graph) if isinstance(graph, gt.Graph) else
+                  normalize_graph(graph, node_id_attribute_name, edge_score_attribute_name, is_directed, has_header,
+                                  normalization_method, silent, False, use_cache, chunk_size=chunk_size)
+                  for graph in graphs]
+        if not silent:
+            spinner = Spinner('Aligning graphs. ')
+            spinner.next()
+        with measure_stage('run_similarity_matrix.align', num_graphs=len(graphs)) as counts:
+            index, positions = _align_graphs(graphs, alignment)
+            pairs = [(graph_index_1, graph_index_2) for graph_index_1 in range(len(graphs))
+                     for graph_index_2 in range(graph_index_1 + 1, len(graphs))]
+            alignments = [NodeAlignment(index, positions[graph_index_1], positions[graph_index_2])
+                          for graph_index_1, graph_index_2 in pairs]
+            counts.update(num_nodes=index.shape[0], num_pairs=len(pairs))
+        pair_directory_names = [f'{graph_names[graph_index_1]}_vs_{graph_names[graph_index_2]}'
+                                for graph_index_1, graph_index_2 in pairs]
+        pair_dir_paths = [result_dir_path.joinpath(pair_directory_name)
+                          for pair_directory_name in pair_directory_names]
+        edge_properties = [_get_edge_properties(graphs[graph_index_1], graphs[graph_index_2])
+                           for graph_index_1, graph_index_2 in pairs]
+        if seed is None:
+            if use_null_model_banks:
+                warnings.warn('Null model banks require a seed. Rewiring without banks.')
+                use_null_model_banks = False
+            seed = np.random.SeedSequence().entropy
+        global_distances = [{'permuted': [], 'distance_type': [], 'distance': []} for _ in pairs]
+        local_distances = [{} for _ in pairs]
+        writers = []
+        with measure_stage('run_similarity_matrix.graph_distance', num_pairs=len(pairs)):
+            for pair_index, ((graph_index_1, graph_index_2), pair_alignment) in enumerate(zip(pairs, alignments)):
+                if not silent:
+                    spinner.next()
+                pair_dir_paths[pair_index].mkdir(parents=True, exist_ok=True)
+                path_to_global_distances = pair_dir_paths[pair_index].joinpath('global_distances.csv')
+                if path_to_global_distances.exists():
+                    path_to_global_distances.unlink()
+                writers.append(LocalDistanceWriter(pair_dir_paths[pair_index], pair_alignment.node_ids,
+                                                   list(edge_properties[pair_index]), num_permutations + 1))
+                for distance_type, edge_property in edge_properties[pair_index].items():
+                    distances = DISTANCE_ENGINES[engine](graphs[graph_index_1], graphs[graph_index_2],
+                                                         pair_alignment.node_ids, edge_property, pair_alignment)
+                    _add_to_results(distances, False, distance_type, global_distances[pair_index],
+                                    local_distances[pair_index])
+                _flush_results(pair_dir_paths[pair_index], writers[pair_index], global_distances[pair_index],
+                               local_distances[pair_index], seed, num_permutations, 0)
+        banks = None
+        if use_null_model_banks:
+            with measure_stage('run_similarity_matrix.null_model_banks', num_permutations=num_permutations):
+                banks = [build_null_model_bank(graph, seed, stream, num_permutations, n_jobs)
+                         for stream, graph in enumerate(graphs)]
+        seeds = get_permutation_seeds(seed, num_permutations, len(graphs))
+        permutations = list(enumerate(seeds))
+        rounds = [permutations[start:start + FLUSH_INTERVAL] for start in range(0, len(permutations), FLUSH_INTERVAL)]
+        permutation_chunk_size = max(1, min(10, min(len(permutations), FLUSH_INTERVAL) // (4 * n_jobs)))
+        if not silent:
+            spinner.finish()
+            bar = IncrementalBar('Running permutation tests.', max=num_permutations)
+        with measure_stage('run_similarity_matrix.permutations', num_permutations=num_permutations,
+                           num_pairs=len(pairs), n_jobs=n_jobs), contextlib.ExitStack() as stack:
+            if n_jobs > 1:
+                # The pool is terminated on exit, also if the permutations are interrupted by an exception.
+                pool = stack.enter_context(mp.Pool(n_jobs, initializer=_initialize_worker,
+                                                   initargs=(graphs, pairs, alignments, engine, banks)))
+            completed_permutations = 0
+            for permutation_round in rounds:
+                chunks = [permutation_round[start:start + permutation_chunk_size]
+                          for start in range(0, len(permutation_round), permutation_chunk_size)]
+                if n_jobs == 1:
+                    chunk_results = (_run_permutations(graphs, pairs, alignments, engine, chunk, banks)
+                                     for chunk in chunks)
+                else:
+                    chunk_results = pool.imap(_run_permutations_in_worker, chunks)
+                for chunk, (chunk_global_distances, chunk_local_distances, chunk_metrics) in zip(chunks, chunk_results):
+                    if not silent:
+                        bar.next(len(chunk))
+                    for pair_index in range(len(pairs)):
+                        _merge_results(global_distances[pair_index], chunk_global_distances[pair_index])
+                        _merge_results(local_distances[pair_index], chunk_local_distances[pair_index])
+                    add_permutation_metrics(chunk_metrics)
+                completed_permutations += len(permutation_round)
+                for pair_index in range(len(pairs)):
+                    _flush_results(pair_dir_paths[pair_index], writers[pair_index], global_distances[pair_index],
+                                   local_distances[pair_index], seed, num_permutations, completed_permutations)
+        if not silent:
+            bar.finish()
+            bar = IncrementalBar('Computing p-values.', max=len(pairs))
+        with measure_stage('run_similarity_matrix.p_values', num_pairs=len(pairs)):
+            for pair_dir_path, pair_directory_name in zip(pair_dir_paths, pair_directory_names):
+                pair_result_directory_name = f'{result_directory_name}/{pair_directory_name}'
+                if save_csv:
+                    export_local_distances_to_csv(pair_dir_path)
+                compute_empirical_p_values(pair_result_directory_name, adjust_method, True)
+                compute_mwu_p_values(pair_result_directory_name, adjust_method, paths_to_node_sets, True)
+                if not silent:
+                    bar.next()
+        if not silent:
+            bar.finish()
+        pair_results = _get_pair_results(result_directory_name, graph_names, pairs, pair_directory_names)
+        distance_matrices = _get_distance_matrices(graph_names, pair_results)
+        path_to_pair_results = result_dir_path.joinpath('pair_results.csv')
+        pair_results.to_csv(str(path_to_pair_results), index=False)
+        for distance_type, distance_matrix in distance_matrices.items():
+            distance_matrix.to_csv(str(result_dir_path.joinpath(f'{distance_type}_distance_matrix.csv')))
+        if not silent:
+            print(f'Saved results of {len(pairs)} pairs to {str(path_to_pair_results)}.')
+            print(f'Saved distance matrices to {str(result_dir_path)}.')
+    return distance_matrices, pair_results
+
+
+if __name__ == '__main__':
+    args = get_similarity_parser('run_similarity_matrix').parse_args()
+    run_similarity_matrix(args.graphs, args.dirname, args.names, args.alignment, args.id, args.score, args.directed,
+                          args.header, args.normalization, args.permutations, args.adjust, args.nodesets, args.silent,
+                          args.engine, args.n_jobs, args.seed, args.csv, args.use_cache, args.null_model_banks,
+                          args.profile, args.chunk_size)
@@ -1,8 +1,9 @@
-from statsmodels.stats.multitest import multipletests
 import pandas as pd
 
 
 def compute_adjusted_p_values(p_values: pd.DataFrame, adjust_method: str):
+    # Importing statsmodels is slow, so it is deferred until p-values are adjusted.
+    from statsmodels.stats.multitest import multipletests
     p_values['adjusted_p_value'] = [None for _ in range(p_values.shape[0])]
     distance_types = list(set(p_values['distance_type']))
     for distance_type in distance_types:
@@ -10,3 +10,9 @@ def get_result_directory_path(result_directory_name: str) -> Path:
 def get_root_directory_path() -> Path:
     path_to_this_module = Path(os.path.abspath(__file__))
     return path_to_this_module.parent.parent.parent
+
+
+def get_cache_directory_path(cache_name: str) -> Path:
+    if os.environ.get('GRAPHSIMQT_CACHE_DIR'):
+        return Path(os.environ['GRAPHSIMQT_CACHE_DIR']).joinpath(cache_name)
+    return get_root_directory_path().joinpath('cache').joinpath(cache_name)
@@ -1,15 +1,28 @@
 import argparse
 from pathlib import Path
 
+SHORTEST_PATH_DESCRIPTIONS = {'compute_shortest_path_distances': 'Compute shortest path distances.',
+                              'analyze_shortest_path_distances': 'Analyze shortest path distances.',
+                              'run_shortest_path_analysis': 'Run shortest path analysis.'}
+
+SIMILARITY_DESCRIPTIONS = {'compute_empirical_p_values': 'Compute empirical p-values.',
+                           'compute_mwu_p_values': 'Compute MWU p-values.',
+                           'normalize_graph': 'Normalize input graph.',
+                           'run_permutation_tests': 'Run permutation tests.',
+                           'run_similarity_analysis': 'Run similarity analysis.',
+                           'run_similarity_batch': 'Run similarity analyses for a batch of graph pairs.',
+                           'run_similarity_matrix': 'Run similarity analyses for all pairs of a list of graphs.'}
+
+BENCHMARK_DESCRIPTION = 'Run benchmarks on synthetic graph pairs.'
+
 
 def get_shortest_path_parser(script_name: str) -> argparse.ArgumentParser:
-    descriptions = {'compute_shortest_path_distances': 'Compute shortest path distances.',
-                    'analyze_shortest_path_distances': 'Analyze shortest path distances.',
-                    'run_shortest_path_analysis': 'Run shortest path analysis.'}
-    parser = argparse.ArgumentParser(descriptions[script_name])
+    parser = argparse.ArgumentParser(SHORTEST_PATH_DESCRIPTIONS[script_name])
     if script_name in {'compute_shortest_path_distances', 'run_shortest_path_analysis'}:
         parser.add_argument('path_to_reference_graph', type=Path, help='Path to reference graph.')
-        parser.add_argument('path_to_distance_graph', type=Path, help='Path to distance graph.')
+        parser.add_argument('path_to_distance_graph', type=Path, help='Path to distance graph or to graph snapshot '
+                                                                      'directory generated by normalize_graph.py '
+                                                                      '--snapshot (bfs and landmark engines only).')
         parser.add_argument('--dirname', type=str, help='Name of the subdirectory of the results/ directory where the '
                                                         'results should be saved. Will be created if it does not exist '
                                                         'already.', required=True)
@@ -20,8 +33,27 @@ def get_shortest_path_parser(script_name: str) -> argparse.ArgumentParser:
         parser.add_argument('--score', type=str, help='Name of edge score attribute in reference graph. '
                                                       'If not provided, unique edge attribute is used if available.')
         parser.add_argument('--use_terminals', action='store_true', help='Use also terminals as connectors.')
-        parser.add_argument('--exclude_as_connectors', type=str, nargs=2, help='Key-value pair of node attribute.')
-        # parser.add_argument('--exclude_as_connectors', type=str, nargs=4, help='Key-value pair of node attribute.')
+        parser.add_argument('--exclude_as_connectors', type=str, nargs=2, action='append',
+                            help='Key-value pair of node attribute. Can be repeated to exclude several values.')
+        parser.add_argument('--engine', type=str, help='Engine used to compute the distances. pairwise: one shortest '
+                                                       'path search per pair of terminals. bfs: one breadth-first '
+                                                       'search per source terminal. landmark: approximate distances '
+                                                       'via the highest-degree nodes. Default: pairwise.',
+                            default='pairwise', choices=['pairwise', 'bfs', 'landmark'])
+        parser.add_argument('--n_jobs', type=int, help='Number of worker processes among which the source terminals '
+                                                       'are split. Set to -1 to use all available CPUs. Default: 1.',
+                            default=1)
+        parser.add_argument('--max_distance', type=int, help='If provided, distances larger than this cutoff are '
+                                                             'reported as inf.')
+        parser.add_argument('--landmarks', type=int, help='Number of landmarks used by the landmark engine. '
+                                                          'Default: 16.', default=16)
+        parser.add_argument('--error_samples', type=int, help='Number of source terminals used to measure the error '
+                                                              'of the landmark engine. Default: 10.', default=10)
+        parser.add_argument('--seed', type=int, help='Seed used to sample the source terminals for the error report '
+                                                     'of the landmark engine.')
+        parser.add_argument('--profile', type=str, help='If provided, the run is profiled with the specified '
+                                                        'profiler and the profile is saved to the result directory.',
+                            choices=['cprofile', 'pyinstrument'])
     else:
         parser.add_argument('--dirname', type=str, help='Name of the subdirectory of the results/ directory where the '
                                                         'results generated by compute_shortest_path_distances.py can '
@@ -31,19 +63,15 @@ def get_shortest_path_parser(script_name: str) -> argparse.ArgumentParser:
 
 
 def get_similarity_parser(script_name: str) -> argparse.ArgumentParser:
-    descriptions = {'compute_empirical_p_values': 'Compute empirical p-values.',
-                    'compute_mwu_p_values': 'Compute MWU p-values.',
-                    'normalize_graph': 'Normalize input graph.',
-                    'run_permutation_tests': 'Run permutation tests.',
-                    'run_similarity_analysis': 'Run similarity analysis.'}
-    parser = argparse.ArgumentParser(descriptions[script_name])
+    parser = argparse.ArgumentParser(SIMILARITY_DESCRIPTIONS[script_name])
 
     # Add paths to graph(s) and .
     graph_file_format_help = 'The file format is derived from the suffix. If the suffix is graphml or gt, the  input ' \
                              'is expected to be in GraphML format (binarized if suffix is gt). Otherwise, an edge ' \
                              'list with lines of the form <SOURCE><SEP><TARGET>[<SEP><SCORE>] is expected. The ' \
                              'separator is derived from the suffix. csv: comma. csv2: semicolon. tsv: tab. wsv: ' \
-                             'whitespace. Providing edge scores is optional.'
+                             'whitespace. Providing edge scores is optional. Edge lists can be compressed with gzip ' \
+                             '(suffix gz) or zstd (suffix zst).'
     if script_name == 'normalize_graph':
         parser.add_argument('graph', type=Path, help=f'Path to graph. {graph_file_format_help}')
     elif script_name == 'run_permutation_tests':
@@ -54,9 +82,29 @@ def get_similarity_parser(script_name: str) -> argparse.ArgumentParser:
     elif script_name == 'run_similarity_analysis':
         parser.add_argument('path_to_graph_1', type=Path, help=f'Path to first graph. {graph_file_format_help}')
         parser.add_argument('path_to_graph_2', type=Path, help=f'Path to second graph. {graph_file_format_help}')
+    elif script_name == 'run_similarity_batch':
+        parser.add_argument('manifest', type=Path, help='Path to manifest of the graph pairs, either a JSON file '
+                                                        'containing a list of objects or a tabular file with one row '
+                                                        'per pair. Each pair must specify path_to_graph_1, '
+                                                        'path_to_graph_2, and result_directory_name and can override '
+                                                        'the parameters of run_similarity_batch().')
+        parser.add_argument('--max_workers', type=int, help='Maximal number of pairs processed concurrently. Set to '
+                                                            '-1 to use all available CPUs. Default: 4.', default=4)
+        parser.add_argument('--force', action='store_true', help='Set this flag to rerun all pairs, even if their '
+                                                                 'outputs are up to date.')
+    elif script_name == 'run_similarity_matrix':
+        parser.add_argument('graphs', type=Path, help=f'Paths to at least two graphs. {graph_file_format_help}',
+                            nargs='+')
+        parser.add_argument('--names', type=str, help='Unique names of the graphs. Default: stems of the paths.',
+                            nargs='+')
+        parser.add_argument('--alignment', type=str, help='Node set on which all graphs are compared. intersection: '
+                                                          'nodes contained in all graphs. union: nodes contained in '
+                                                          'any graph, missing nodes are added as isolated nodes. '
+                                                          'Default: intersection.',
+                            default='intersection', choices=['intersection', 'union'])
 
     # Add parameters for graph normalization.
-    if script_name in {'normalize_graph', 'run_similarity_analysis'}:
+    if script_name in {'normalize_graph', 'run_similarity_analysis', 'run_similarity_batch', 'run_similarity_matrix'}:
         parser.add_argument('--id', type=str, help='Name of node ID attribute to be used for GraphML input. If not '
                                                    'provided, unique node attribute is used if available. Not used for '
                                                    'edge list input.')
@@ -73,9 +121,23 @@ def get_similarity_parser(script_name: str) -> argparse.ArgumentParser:
                                                               'scores by maximum. max-min: Max-min normalization. '
                                                               'z-score: Z-score normalization. Default: max.',
                             default='max', choices=['max', 'max-min', 'z-score'])
+        parser.add_argument('--chunk_size', type=int, help='If provided, edge list input is streamed in chunks of '
+                                                           'this many edges, so that graphs larger than the memory '
+                                                           'can be ingested. Node IDs are then read verbatim. Not '
+                                                           'used for GraphML input.')
+    if script_name in {'normalize_graph', 'run_similarity_analysis', 'run_similarity_matrix'}:
+        parser.add_argument('--use_cache', action='store_true', help='Set this flag to look up normalized graphs in '
+                                                                     'the cache keyed on the content of the input '
+                                                                     'file and the normalization parameters.')
+    if script_name == 'normalize_graph':
+        parser.add_argument('--snapshot', action='store_true', help='Set this flag to also save the normalized graph '
+                                                                    'as memory-mapped CSR snapshot directory '
+                                                                    '<stem>_normalized.snapshot next to the input.')
+        parser.add_argument('--cache_stats', action='store_true', help='Set this flag to print statistics of the '
+                                                                       'normalization cache.')
 
     # Add argument for result directory.
-    if script_name in {'run_permutation_tests', 'run_similarity_analysis'}:
+    if script_name in {'run_permutation_tests', 'run_similarity_analysis', 'run_similarity_matrix'}:
         parser.add_argument('--dirname', type=str, help='Name of the subdirectory of the results/ directory where the '
                                                         'results should be saved. Will be created if it does not exist '
                                                         'already.', required=True)
@@ -85,17 +147,54 @@ def get_similarity_parser(script_name: str) -> argparse.ArgumentParser:
                                                         'and the p-values should be saved.', required=True)
 
     # Add argument for permutation numberss.
-    if script_name in {'run_permutation_tests', 'run_similarity_analysis'}:
+    if script_name in {'run_permutation_tests', 'run_similarity_analysis', 'run_similarity_batch',
+                       'run_similarity_matrix'}:
         parser.add_argument('--permutations', type=int, help='Number of permutations. Default: 1000', default=1000)
+        if script_name == 'run_similarity_matrix':
+            parser.add_argument('--engine', type=str, help='Engine used to compute the distances. graph_tool: '
+                                                           'iterate over the neighborhoods of the nodes. sparse: '
+                                                           'vectorized computation on aligned sparse adjacency '
+                                                           'matrices. Default: graph_tool.', default='graph_tool',
+                                choices=['graph_tool', 'sparse'])
+        else:
+            parser.add_argument('--engine', type=str, help='Engine used to compute the distances. graph_tool: '
+                                                           'iterate over the neighborhoods of the nodes. sparse: '
+                                                           'vectorized computation on aligned sparse adjacency '
+                                                           'matrices. incremental: update the distances of the '
+                                                           'original graphs with the edges changed by double edge '
+                                                           'swaps, which replace the rewiring. Default: graph_tool.',
+                                default='graph_tool', choices=['graph_tool', 'sparse', 'incremental'])
+        parser.add_argument('--n_jobs', type=int, help='Number of worker processes among which the permutations are '
+                                                       'split. Set to -1 to use all available CPUs. Default: 1.',
+                            default=1)
+        parser.add_argument('--seed', type=int, help='Master seed from which the seeds of the individual permutations '
+                                                     'are derived. If not provided, the results are not '
+                                                     'reproducible.')
+        parser.add_argument('--csv', action='store_true', help='Set this flag to additionally export the local '
+                                                               'distances to local_distances.csv in long format.')
+        parser.add_argument('--null_model_banks', action='store_true', help='Set this flag to store the rewirings '
+                                                                            'in null model banks and replay them '
+                                                                            'in later runs on the same graphs with '
+                                                                            'the same seed.')
+    if script_name in {'run_permutation_tests', 'run_similarity_analysis', 'run_similarity_batch'}:
+        parser.add_argument('--early_stopping_alpha', type=float, help='If provided, the permutations of a distance '
+                                                                       'type are stopped early (Besag-Clifford) once '
+                                                                       'it is certain that its global empirical '
+                                                                       'p-value exceeds this significance level.')
+    if script_name in {'run_permutation_tests', 'run_similarity_analysis'}:
+        parser.add_argument('--resume', action='store_true', help='Set this flag to resume interrupted permutation '
+                                                                  'tests from the checkpoint in the result directory.')
 
     # Add argument for adjust method.
-    if script_name in {'compute_empirical_p_values', 'compute_mwu_p_values', 'run_similarity_analysis'}:
+    if script_name in {'compute_empirical_p_values', 'compute_mwu_p_values', 'run_similarity_analysis',
+                       'run_similarity_batch', 'run_similarity_matrix'}:
         parser.add_argument('--adjust', type=str, help='Method used for adjusting p-values. Can be set to any of the '
                                                        'methods in statsmodels.stats.multitest.multipletests().',
                             default='holm-sidak')
 
     # Add argument for node sets.
-    if script_name in {'compute_mwu_p_values', 'run_similarity_analysis'}:
+    if script_name in {'compute_mwu_p_values', 'run_similarity_analysis', 'run_similarity_batch',
+                       'run_similarity_matrix'}:
         parser.add_argument('--nodesets', type=Path, help='Paths to node set files in either JSON or tabular format '
                                                           'for which MWU p-values should be computed. JSON files are '
                                                           'expected to contain named lists of node IDs. Tabular files '
@@ -105,6 +204,44 @@ def get_similarity_parser(script_name: str) -> argparse.ArgumentParser:
                                                           'data, the separator is derived from the suffix. csv: comma. '
                                                           'csv2: semicolon. tsv: tab. wsv: whitespace.', nargs='+',
                             default=[])
+    # Add profiler.
+    if script_name in {'compute_empirical_p_values', 'compute_mwu_p_values', 'run_permutation_tests',
+                       'run_similarity_analysis', 'run_similarity_matrix'}:
+        parser.add_argument('--profile', type=str, help='If provided, the run is profiled with the specified '
+                                                        'profiler and the profile is saved to the result directory.',
+                            choices=['cprofile', 'pyinstrument'])
     # Add silent flag.
     parser.add_argument('--silent', action='store_true', help='Set this flag to suppress printing progress to stdout.')
     return parser
+
+
+def get_benchmark_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(BENCHMARK_DESCRIPTION)
+    parser.add_argument('--dirname', type=str, help='Name of the subdirectory of the results/ directory where the '
+                                                    'results should be saved. Default: benchmarks.',
+                        default='benchmarks')
+    parser.add_argument('--sizes', type=int, nargs='+', help='Numbers of nodes of the generated graph pairs. '
+                                                             'Default: 1000 10000 100000.',
+                        default=[1000, 10000, 100000])
+    parser.add_argument('--mean_degree', type=float, help='Expected mean degree of the generated graphs. Default: 10.',
+                        default=10.0)
+    parser.add_argument('--overlap', type=float, help='Fraction of shared edges of the generated graphs. '
+                                                      'Default: 0.5.', default=0.5)
+    parser.add_argument('--model', type=str, help='Model used to generate the graphs. degree_preserving: the second '
+                                                  'graph is a partial degree-preserving rewiring of the first one. '
+                                                  'block: stochastic block model. Default: degree_preserving.',
+                        default='degree_preserving', choices=['degree_preserving', 'block'])
+    parser.add_argument('--directed', action='store_true', help='Set this flag to generate directed graphs.')
+    parser.add_argument('--engine', type=str, help='Engine used to compute the distances. Default: graph_tool.',
+                        default='graph_tool', choices=['graph_tool', 'sparse', 'incremental'])
+    parser.add_argument('--permutations', type=int, help='Number of permutations of the timed permutation tests. '
+                                                         'Default: 10.', default=10)
+    parser.add_argument('--terminals', type=int, help='Number of nodes of the reference graph of the timed shortest '
+                                                      'path computation. Default: 100.', default=100)
+    parser.add_argument('--shortest_path_engine', type=str, help='Engine used to compute the shortest path '
+                                                                 'distances. Default: bfs.',
+                        default='bfs', choices=['pairwise', 'bfs', 'landmark'])
+    parser.add_argument('--seed', type=int, help='Seed used to generate the graphs and to run the permutations. '
+                                                 'Default: 0.', default=0)
+    parser.add_argument('--silent', action='store_true', help='Set this flag to suppress printing progress to stdout.')
+    return parser
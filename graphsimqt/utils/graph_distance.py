@@ -1,14 +1,16 @@
 import graph_tool as gt
 import numpy as np
-from typing import List, Dict
+from typing import List, Optional
+from graphsimqt.utils.node_alignment import NodeAlignment
 
 
 class GraphDistance(object):
 
-    def __init__(self, g: gt.Graph, h: gt.Graph, node_ids, edge_properties=None):
+    def __init__(self, g: gt.Graph, h: gt.Graph, node_ids, edge_properties=None,
+                 alignment: Optional[NodeAlignment] = None):
         self.global_distance = None
         self.local_distances = {node_id: None for node_id in node_ids}
-        self._compute_distances(g, h, edge_properties)
+        self._compute_distances(g, h, node_ids, edge_properties, alignment)
 
     def as_dict(self):
         return {'global_distance': self.global_distance, 'local_distances': self.local_distances}
@@ -17,62 +19,58 @@ class GraphDistance(object):
         return str(self.as_dict())
 
     @staticmethod
-    def _map_ids_to_nodes(graph: gt.Graph):
-        node_id_property = graph.vertex_properties['ID']
-        return {node_id_property[node]: node for node in graph.vertices()}
-
-    def _compute_local_distance(self, g: gt.Graph, h: gt.Graph, node_id: str, g_ids_to_nodes: Dict[str, gt.Vertex],
-                                h_ids_to_nodes: Dict[str, gt.Vertex], edge_properties: List[gt.EdgePropertyMap],
-                                kind: str):
-        g_node_ids = g.vertex_properties['ID']
-        h_node_ids = h.vertex_properties['ID']
-        node_g = g_ids_to_nodes[node_id]
-        node_h = h_ids_to_nodes[node_id]
+    def _get_neighbors(graph: gt.Graph, node: int, kind: str) -> np.ndarray:
         if kind == 'all':
-            neighbors_g = {g_node_ids[node] for node in g.get_all_neighbors(node_g)}
-            neighbors_h = {h_node_ids[node] for node in h.get_all_neighbors(node_h)}
+            return graph.get_all_neighbors(node)
         elif kind == 'in':
-            neighbors_g = {g_node_ids[node] for node in g.get_in_neighbors(node_g)}
-            neighbors_h = {h_node_ids[node] for node in h.get_in_neighbors(node_h)}
-        elif kind == 'out':
-            neighbors_g = {g_node_ids[node] for node in g.get_out_neighbors(node_g)}
-            neighbors_h = {h_node_ids[node] for node in h.get_out_neighbors(node_h)}
+            return graph.get_in_neighbors(node)
+        return graph.get_out_neighbors(node)
+
+    def _compute_local_distance(self, g: gt.Graph, h: gt.Graph, node_id: str, node_g: int, node_h: int,
+                                alignment: NodeAlignment, edge_properties: List[gt.EdgePropertyMap], kind: str):
+        # Neighbors are compared via their shared node indices rather than via their IDs.
+        neighbors_g = set(alignment.positions_1[self._get_neighbors(g, node_g, kind)].tolist())
+        neighbors_h = set(alignment.positions_2[self._get_neighbors(h, node_h, kind)].tolist())
         neighbors_only_g = neighbors_g.difference(neighbors_h)
         neighbors_only_h = neighbors_h.difference(neighbors_g)
         if not edge_properties:
             self.local_distances[node_id] += float(len(neighbors_only_g) + len(neighbors_only_h))
         else:
             neighbors_both = neighbors_g.intersection(neighbors_h)
-            for node_id_nb in neighbors_both:
+            for position_nb in neighbors_both:
                 if kind == 'in':
-                    edge_g = g.edge(g_ids_to_nodes[node_id_nb], node_g)
-                    edge_h = h.edge(h_ids_to_nodes[node_id_nb], node_h)
+                    edge_g = g.edge(alignment.vertices_1[position_nb], node_g)
+                    edge_h = h.edge(alignment.vertices_2[position_nb], node_h)
                 else:
-                    edge_g = g.edge(node_g, g_ids_to_nodes[node_id_nb])
-                    edge_h = h.edge(node_h, h_ids_to_nodes[node_id_nb])
+                    edge_g = g.edge(node_g, alignment.vertices_1[position_nb])
+                    edge_h = h.edge(node_h, alignment.vertices_2[position_nb])
                 self.local_distances[node_id] += np.fabs(edge_properties[0][edge_g] - edge_properties[1][edge_h])
-            for node_id_nb in neighbors_only_g:
+            for position_nb in neighbors_only_g:
                 if kind == 'in':
-                    edge_g = g.edge(g_ids_to_nodes[node_id_nb], node_g)
+                    edge_g = g.edge(alignment.vertices_1[position_nb], node_g)
                 else:
-                    edge_g = g.edge(node_g, g_ids_to_nodes[node_id_nb])
+                    edge_g = g.edge(node_g, alignment.vertices_1[position_nb])
                 self.local_distances[node_id] += 1.0 + edge_properties[0][edge_g]
-            for node_id_nb in neighbors_only_h:
+            for position_nb in neighbors_only_h:
                 if kind == 'in':
-                    edge_h = h.edge(h_ids_to_nodes[node_id_nb], node_h)
+                    edge_h = h.edge(alignment.vertices_2[position_nb], node_h)
                 else:
-                    edge_h = h.edge(node_h, h_ids_to_nodes[node_id_nb])
+                    edge_h = h.edge(node_h, alignment.vertices_2[position_nb])
                 self.local_distances[node_id] += 1.0 + edge_properties[1][edge_h]
 
-    def _compute_distances(self, g: gt.Graph, h: gt.Graph, edge_properties: List[gt.EdgePropertyMap]):
-        g_ids_to_nodes = self._map_ids_to_nodes(g)
-        h_ids_to_nodes = self._map_ids_to_nodes(h)
+    def _compute_distances(self, g: gt.Graph, h: gt.Graph, node_ids, edge_properties: List[gt.EdgePropertyMap],
+                           alignment: Optional[NodeAlignment]):
+        if alignment is None:
+            alignment = NodeAlignment.from_graphs(g, h)
+        positions = alignment.get_positions(node_ids)
+        nodes_g = alignment.vertices_1[positions].tolist()
+        nodes_h = alignment.vertices_2[positions].tolist()
         self.global_distance = 0.0
-        for node_id in self.local_distances:
+        for node_id, node_g, node_h in zip(self.local_distances, nodes_g, nodes_h):
             self.local_distances[node_id] = 0.0
             if g.is_directed():
-                self._compute_local_distance(g, h, node_id, g_ids_to_nodes, h_ids_to_nodes, edge_properties, 'in')
-                self._compute_local_distance(g, h, node_id, g_ids_to_nodes, h_ids_to_nodes, edge_properties, 'out')
+                self._compute_local_distance(g, h, node_id, node_g, node_h, alignment, edge_properties, 'in')
+                self._compute_local_distance(g, h, node_id, node_g, node_h, alignment, edge_properties, 'out')
             else:
-                self._compute_local_distance(g, h, node_id, g_ids_to_nodes, h_ids_to_nodes, edge_properties, 'all')
-            self.global_distance += (self.local_distances[node_id] / 2)
\ No newline at end of file
+                self._compute_local_distance(g, h, node_id, node_g, node_h, alignment, edge_properties, 'all')
+            self.global_distance += (self.local_distances[node_id] / 2)
@@ -0,0 +1,213 @@
+import json
+import os
+import shutil
+import numpy as np
+import scipy.sparse as spsp
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple, Union, TYPE_CHECKING
+
+if TYPE_CHECKING:
+    import graph_tool as gt
+
+# Version of the on-disk layout, stored in snapshot.json.
+SNAPSHOT_FORMAT_VERSION = 1
+
+# Edge properties of normalized graphs that are stored in snapshots.
+SNAPSHOT_EDGE_PROPERTY_NAMES = ('NORM-SCORE', 'NORM-RANK')
+
+
+def _get_index_dtype(max_value: int) -> type:
+    return np.int32 if max_value <= np.iinfo(np.int32).max else np.int64
+
+
+def _load_array(snapshot_path: Path, name: str) -> np.ndarray:
+    return np.load(str(snapshot_path.joinpath(f'{name}.npy')), mmap_mode='r')
+
+
+def is_graph_snapshot(path: Union[str, Path]) -> bool:
+    """Returns True if the path points to a graph snapshot directory written by save_graph_snapshot()."""
+    return Path(path).joinpath('snapshot.json').is_file()
+
+
+class GraphSnapshot(object):
+    """Read-only, memory-mapped CSR snapshot of a normalized graph.
+
+    The snapshot directory contains the CSR arrays indptr.npy and indices.npy (int32 if the values fit, int64
+    otherwise), one float32 array <property>.npy per stored edge property (NORM-SCORE and NORM-RANK) aligned with
+    indices.npy, the UTF-8 encoded node IDs node_ids.bin with their byte offsets node_id_offsets.npy, and the metadata
+    in snapshot.json. Row v of the CSR arrays contains the out-neighbors of vertex v. For undirected graphs, each edge
+    is stored in the rows of both endpoints (self-loops only once), so that the rows contain all neighbors.
+
+    All arrays are opened via numpy.memmap, so that processes loading the same snapshot share one copy in the page
+    cache. Only the path is pickled, i.e., worker processes map the snapshot instead of receiving copies.
+
+    The snapshot provides the read-only subset of the graph_tool.Graph interface used by
+    graphsimqt.utils.sparse_graph_distance.SparseGraphDistance and by the 'bfs' and 'landmark' engines of
+    graphsimqt.compute_shortest_path_distances, so that distances can be computed without graph_tool objects. Vertices
+    are represented by their integer indices and edge properties by NumPy arrays aligned with indices.npy.
+    """
+
+    def __init__(self, snapshot_path: Union[str, Path]):
+        self.snapshot_path = Path(snapshot_path)
+        with open(str(self.snapshot_path.joinpath('snapshot.json'))) as fp:
+            metadata = json.load(fp)
+        if metadata['format_version'] != SNAPSHOT_FORMAT_VERSION:
+            raise ValueError(f'Unsupported graph snapshot format version {metadata["format_version"]}.\n'
+                             f'Supported version: {SNAPSHOT_FORMAT_VERSION}.')
+        self._directed = metadata['directed']
+        self._num_vertices = metadata['num_vertices']
+        self._num_edges = metadata['num_edges']
+        self.edge_property_names = metadata['edge_property_names']
+        self.indptr = _load_array(self.snapshot_path, 'indptr')
+        self.indices = _load_array(self.snapshot_path, 'indices')
+        self._edge_properties = {name: _load_array(self.snapshot_path, name) for name in self.edge_property_names}
+        self._node_id_offsets = _load_array(self.snapshot_path, 'node_id_offsets')
+        path_to_node_ids = self.snapshot_path.joinpath('node_ids.bin')
+        if path_to_node_ids.stat().st_size > 0:
+            self._node_id_data = np.memmap(str(path_to_node_ids), dtype=np.uint8, mode='r')
+        else:
+            # Empty files cannot be mapped.
+            self._node_id_data = np.empty(0, dtype=np.uint8)
+        self._node_ids = None
+        self._total_degrees = None
+        self._undirected_csr = None
+
+    def __getstate__(self):
+        return {'snapshot_path': self.snapshot_path}
+
+    def __setstate__(self, state: dict):
+        self.__init__(state['snapshot_path'])
+
+    def __repr__(self):
+        return f'<GraphSnapshot {str(self.snapshot_path)}, {"directed" if self._directed else "undirected"}, ' \
+               f'{self._num_vertices} vertices, {self._num_edges} edges>'
+
+    def is_directed(self) -> bool:
+        return self._directed
+
+    def num_vertices(self) -> int:
+        return self._num_vertices
+
+    def num_edges(self) -> int:
+        return self._num_edges
+
+    def vertex(self, index: int) -> int:
+        return int(index)
+
+    @property
+    def node_ids(self) -> List[str]:
+        """Node IDs in vertex order, decoded on first access."""
+        if self._node_ids is None:
+            data = self._node_id_data.tobytes()
+            offsets = self._node_id_offsets.tolist()
+            self._node_ids = [data[start:end].decode() for start, end in zip(offsets[:-1], offsets[1:])]
+        return self._node_ids
+
+    @property
+    def vertex_properties(self) -> Dict[str, List[str]]:
+        return {'ID': self.node_ids}
+
+    @property
+    def edge_properties(self) -> Dict[str, np.ndarray]:
+        return self._edge_properties
+
+    vp = vertex_properties
+    ep = edge_properties
+
+    def get_csr_edges(self) -> Tuple[np.ndarray, np.ndarray]:
+        """Returns the rows and columns of all entries of the CSR arrays, i.e., both directions of undirected edges."""
+        rows = np.repeat(np.arange(self._num_vertices, dtype=self.indices.dtype), np.diff(self.indptr))
+        return rows, np.asarray(self.indices)
+
+    def get_edges(self) -> np.ndarray:
+        """Returns the endpoints of all edges as array of shape (edges, 2), each undirected edge only once."""
+        rows, columns = self.get_csr_edges()
+        if not self._directed:
+            is_first = rows <= columns
+            rows, columns = rows[is_first], columns[is_first]
+        return np.column_stack((rows, columns)).astype(np.int64)
+
+    def get_total_degrees(self, vertices: np.ndarray) -> np.ndarray:
+        """Returns the total degrees of the given vertices, counting self-loops twice as graph_tool does."""
+        if self._total_degrees is None:
+            degrees = np.diff(self.indptr).astype(np.int64)
+            rows, columns = self.get_csr_edges()
+            if self._directed:
+                degrees += np.bincount(columns, minlength=self._num_vertices)
+            else:
+                degrees += np.bincount(rows[rows == columns], minlength=self._num_vertices)
+            self._total_degrees = degrees
+        return self._total_degrees[np.asarray(vertices, dtype=np.int64)]
+
+    def get_undirected_csr(self) -> Tuple[np.ndarray, np.ndarray]:
+        """Returns the indptr and indices arrays of the graph with all edges interpreted as undirected. For undirected
+        graphs, these are the mapped arrays of the snapshot."""
+        if self._directed and self._undirected_csr is None:
+            rows, columns = self.get_csr_edges()
+            adjacency = spsp.csr_matrix((np.ones(rows.shape[0], dtype=np.int8), (rows, columns)),
+                                        shape=(self._num_vertices, self._num_vertices))
+            adjacency = (adjacency + adjacency.T).tocsr()
+            self._undirected_csr = (adjacency.indptr, adjacency.indices)
+        if self._directed:
+            return self._undirected_csr
+        return self.indptr, self.indices
+
+
+def save_graph_snapshot(graph: 'gt.Graph', snapshot_path: Union[str, Path],
+                        edge_property_names: Optional[List[str]] = None) -> GraphSnapshot:
+    """Saves a normalized graph as memory-mapped CSR snapshot, see GraphSnapshot.
+
+    Parameters
+    ----------
+    graph : graph_tool.Graph
+        Normalized graph with string vertex property ID, as returned by graphsimqt.normalize_graph.normalize_graph().
+    snapshot_path : str or pathlib.Path
+        Path to the snapshot directory. An existing snapshot is replaced.
+    edge_property_names : list of str, optional
+        Names of the edge properties that should be stored as float32 arrays.
+        If not provided, the properties NORM-SCORE and NORM-RANK are stored if available.
+
+    Returns
+    -------
+    snapshot : GraphSnapshot
+        Snapshot loaded from the written directory.
+
+    """
+    snapshot_path = Path(snapshot_path)
+    if edge_property_names is None:
+        edge_property_names = [name for name in SNAPSHOT_EDGE_PROPERTY_NAMES if name in graph.edge_properties]
+    num_vertices = graph.num_vertices()
+    edges = graph.get_edges([graph.edge_index]).astype(np.int64)
+    sources, targets, edge_indices = edges[:, 0], edges[:, 1], edges[:, 2]
+    if not graph.is_directed():
+        is_loop = sources == targets
+        sources, targets, edge_indices = (np.concatenate((sources, targets[~is_loop])),
+                                          np.concatenate((targets, sources[~is_loop])),
+                                          np.concatenate((edge_indices, edge_indices[~is_loop])))
+    # The stable sort preserves the edge order within each row, so that the first of parallel edges stays first.
+    order = np.argsort(sources, kind='stable')
+    indptr = np.concatenate(([0], np.cumsum(np.bincount(sources, minlength=num_vertices))))
+    encoded_node_ids = [str(node_id).encode() for node_id in graph.vertex_properties['ID']]
+    node_id_offsets = np.concatenate(([0], np.cumsum([len(node_id) for node_id in encoded_node_ids],
+                                                     dtype=np.int64)))
+    # The snapshot is written to a temporary directory that replaces the existing one once it is complete.
+    path_to_tmp_snapshot = snapshot_path.parent.joinpath(f'{snapshot_path.name}.{os.getpid()}.tmp')
+    if path_to_tmp_snapshot.exists():
+        shutil.rmtree(str(path_to_tmp_snapshot))
+    path_to_tmp_snapshot.mkdir(parents=True)
+    np.save(str(path_to_tmp_snapshot.joinpath('indptr.npy')), indptr.astype(_get_index_dtype(indptr[-1])))
+    np.save(str(path_to_tmp_snapshot.joinpath('indices.npy')), targets[order].astype(_get_index_dtype(num_vertices)))
+    for name in edge_property_names:
+        values = graph.edge_properties[name].a[edge_indices[order]]
+        np.save(str(path_to_tmp_snapshot.joinpath(f'{name}.npy')), values.astype(np.float32))
+    np.save(str(path_to_tmp_snapshot.joinpath('node_id_offsets.npy')), node_id_offsets)
+    with open(str(path_to_tmp_snapshot.joinpath('node_ids.bin')), 'wb') as fp:
+        fp.write(b''.join(encoded_node_ids))
+    with open(str(path_to_tmp_snapshot.joinpath('snapshot.json')), 'w') as fp:
+        json.dump({'format_version': SNAPSHOT_FORMAT_VERSION, 'directed': graph.is_directed(),
+                   'num_vertices': num_vertices, 'num_edges': graph.num_edges(),
+                   'edge_property_names': edge_property_names}, fp)
+    if snapshot_path.exists():
+        shutil.rmtree(str(snapshot_path))
+    os.replace(str(path_to_tmp_snapshot), str(snapshot_path))
+    return GraphSnapshot(snapshot_path)
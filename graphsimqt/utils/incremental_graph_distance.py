@@ -0,0 +1,155 @@
+import graph_tool as gt
+import numpy as np
+from typing import Dict, Optional, Tuple
+from graphsimqt.utils.node_alignment import NodeAlignment
+
+
+class IncrementalGraphDistance(object):
+    """Graph distance that is updated edge by edge instead of being recomputed from scratch.
+
+    The distance is initialized once on an aligned pair of graphs. Afterwards, edge changes of either graph can be
+    applied via apply_edge_changes() (e.g., the swapped edges of a rewiring step) or update_graph(), which only update
+    the costs of the changed node pairs and the local distances of their endpoints. reset() reverts all changes applied
+    since the initialization. The distances coincide with the ones computed by GraphDistance and SparseGraphDistance up
+    to floating point rounding (exactly for topology only distances). As in these engines, parallel edges are counted
+    once, with the weight of the first one. Their multiplicities are tracked, so that a node pair is only removed
+    together with its last edge.
+
+    Only apply_edge_changes() takes time proportional to the number of changed edges. update_graph() compares all
+    edges of the new graph with the current ones in interpreted code and is hence not faster than a recomputation with
+    SparseGraphDistance. The 'incremental' engine of the permutation tests therefore rewires the graphs with
+    graphsimqt.utils.null_model_bank.swap_edges(), which returns the changed edges, instead of random_rewire(), which
+    does not expose them.
+    """
+
+    def __init__(self, g: gt.Graph, h: gt.Graph, node_ids, edge_properties=None,
+                 alignment: Optional[NodeAlignment] = None):
+        if alignment is None:
+            alignment = NodeAlignment.from_graphs(g, h)
+        self.global_distance = None
+        self.local_distances = {node_id: None for node_id in node_ids}
+        self._alignment = alignment
+        self._is_directed = g.is_directed()
+        self._is_weighted = bool(edge_properties)
+        self._num_nodes = alignment.index.shape[0]
+        self._positions = alignment.get_positions(node_ids)
+        g_edge_property, h_edge_property = edge_properties if edge_properties else (None, None)
+        edges_g, multiplicities_g = self._get_edge_weights(g, alignment.positions_1, g_edge_property)
+        edges_h, multiplicities_h = self._get_edge_weights(h, alignment.positions_2, h_edge_property)
+        self._edges = [edges_g, edges_h]
+        self._multiplicities = [multiplicities_g, multiplicities_h]
+        self._local_distances = np.zeros(self._num_nodes)
+        for key in set(self._edges[0]).union(self._edges[1]):
+            self._add_cost(key, self._get_cost(key))
+        self._initial_local_distances = self._local_distances.copy()
+        self._undo_log = []
+        self._update_results()
+
+    def as_dict(self):
+        return {'global_distance': self.global_distance, 'local_distances': self.local_distances}
+
+    def __repr__(self):
+        return str(self.as_dict())
+
+    def _get_keys(self, sources: np.ndarray, targets: np.ndarray) -> np.ndarray:
+        if not self._is_directed:
+            sources, targets = np.minimum(sources, targets), np.maximum(sources, targets)
+        return sources * self._num_nodes + targets
+
+    def _get_edge_weights(self, graph: gt.Graph, node_positions: np.ndarray,
+                          edge_property: Optional[gt.EdgePropertyMap]) -> Tuple[Dict[int, float], Dict[int, int]]:
+        edges = graph.get_edges([graph.edge_index]).astype(np.int64)
+        keys = self._get_keys(node_positions[edges[:, 0]], node_positions[edges[:, 1]])
+        weights = np.zeros(edges.shape[0])
+        if edge_property is not None:
+            weights = edge_property.a[edges[:, 2]].astype(np.float64)
+        keys, first, multiplicities = np.unique(keys, return_index=True, return_counts=True)
+        keys = keys.tolist()
+        return dict(zip(keys, weights[first].tolist())), dict(zip(keys, multiplicities.tolist()))
+
+    def _get_cost(self, key: int) -> float:
+        weight_g = self._edges[0].get(key)
+        weight_h = self._edges[1].get(key)
+        if weight_g is None and weight_h is None:
+            return 0.0
+        if weight_g is None:
+            return 1.0 + weight_h if self._is_weighted else 1.0
+        if weight_h is None:
+            return 1.0 + weight_g if self._is_weighted else 1.0
+        return abs(weight_g - weight_h) if self._is_weighted else 0.0
+
+    def _add_cost(self, key: int, cost: float):
+        # The cost of a node pair contributes to the local distances of both endpoints. Self-loops contribute once to
+        # undirected and twice (as in- and out-edge) to directed local distances.
+        source, target = divmod(key, self._num_nodes)
+        if source == target:
+            self._local_distances[source] += 2 * cost if self._is_directed else cost
+        else:
+            self._local_distances[source] += cost
+            self._local_distances[target] += cost
+
+    def _set_edge(self, graph_index: int, key: int, weight: Optional[float], multiplicity: int):
+        old_weight = self._edges[graph_index].get(key)
+        old_multiplicity = self._multiplicities[graph_index].get(key, 0)
+        if old_weight == weight and old_multiplicity == multiplicity:
+            return
+        old_cost = self._get_cost(key)
+        if multiplicity == 0:
+            del self._edges[graph_index][key]
+            del self._multiplicities[graph_index][key]
+        else:
+            self._edges[graph_index][key] = weight
+            self._multiplicities[graph_index][key] = multiplicity
+        self._add_cost(key, self._get_cost(key) - old_cost)
+        self._undo_log.append((graph_index, key, old_weight, old_multiplicity))
+
+    def _update_results(self):
+        local_distances = self._local_distances[self._positions]
+        self.local_distances = dict(zip(self.local_distances, local_distances.tolist()))
+        self.global_distance = float(local_distances.sum() / 2)
+
+    def apply_edge_changes(self, graph_index: int, removed_edges: np.ndarray, added_edges: np.ndarray,
+                           added_weights: Optional[np.ndarray] = None):
+        """Removes and adds edges, given as arrays of shape (edges, 2) of vertex indices, to the first (graph_index 0)
+        or second (graph_index 1) graph and updates the distances of the affected nodes."""
+        node_positions = self._alignment.positions_1 if graph_index == 0 else self._alignment.positions_2
+        removed_edges = np.asarray(removed_edges, dtype=np.int64).reshape(-1, 2)
+        added_edges = np.asarray(added_edges, dtype=np.int64).reshape(-1, 2)
+        if added_weights is None:
+            added_weights = np.zeros(added_edges.shape[0])
+        edges, multiplicities = self._edges[graph_index], self._multiplicities[graph_index]
+        for key in self._get_keys(node_positions[removed_edges[:, 0]], node_positions[removed_edges[:, 1]]).tolist():
+            if key in edges:
+                multiplicity = multiplicities[key] - 1
+                self._set_edge(graph_index, key, edges[key] if multiplicity > 0 else None, multiplicity)
+        added_keys = self._get_keys(node_positions[added_edges[:, 0]], node_positions[added_edges[:, 1]])
+        for key, weight in zip(added_keys.tolist(), np.asarray(added_weights, dtype=np.float64).tolist()):
+            # Edges parallel to existing ones keep the weight of the existing edge.
+            weight = edges.get(key, weight if self._is_weighted else 0.0)
+            self._set_edge(graph_index, key, weight, multiplicities.get(key, 0) + 1)
+        self._update_results()
+
+    def update_graph(self, graph_index: int, graph: gt.Graph, edge_property: Optional[gt.EdgePropertyMap] = None):
+        """Replaces the first (graph_index 0) or second (graph_index 1) graph by a graph with the same vertices, e.g.,
+        a rewiring, and updates the distances of the nodes incident to changed edges."""
+        node_positions = self._alignment.positions_1 if graph_index == 0 else self._alignment.positions_2
+        edge_weights, multiplicities = self._get_edge_weights(graph, node_positions, edge_property)
+        # Removed edges are processed in sorted order, as the order of the edges depends on previous resets.
+        for key in sorted(key for key in self._edges[graph_index] if key not in edge_weights):
+            self._set_edge(graph_index, key, None, 0)
+        for key, weight in edge_weights.items():
+            self._set_edge(graph_index, key, weight, multiplicities[key])
+        self._update_results()
+
+    def reset(self):
+        """Reverts all edge changes applied since the initialization."""
+        for graph_index, key, weight, multiplicity in reversed(self._undo_log):
+            if multiplicity == 0:
+                self._edges[graph_index].pop(key, None)
+                self._multiplicities[graph_index].pop(key, None)
+            else:
+                self._edges[graph_index][key] = weight
+                self._multiplicities[graph_index][key] = multiplicity
+        self._undo_log = []
+        np.copyto(self._local_distances, self._initial_local_distances)
+        self._update_results()
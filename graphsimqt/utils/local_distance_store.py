@@ -0,0 +1,126 @@
+import json
+import os
+import numpy as np
+import pandas as pd
+from pathlib import Path
+from typing import Dict, List, Tuple, Optional
+
+
+def get_local_distance_store_path(result_dir_path: Path) -> Path:
+    return result_dir_path.joinpath('local_distances')
+
+
+def _load_index(store_path: Path) -> dict:
+    with open(str(store_path.joinpath('index.json'))) as fp:
+        return json.load(fp)
+
+
+def _save_index(store_path: Path, index: dict):
+    path_to_index = store_path.joinpath('index.json')
+    path_to_tmp_index = store_path.joinpath('index.json.tmp')
+    with open(str(path_to_tmp_index), 'w') as fp:
+        json.dump(index, fp)
+    os.replace(str(path_to_tmp_index), str(path_to_index))
+
+
+class LocalDistanceWriter(object):
+    """Incrementally writes local distances into preallocated memory-mapped matrices.
+
+    Each distance type is stored as a dense matrix of shape (capacity, nodes), where the first row contains the
+    distances between the unpermuted graphs. The node IDs of the columns are stored in a JSON sidecar and the number of
+    valid rows per distance type in index.json, which is only updated by flush().
+    """
+
+    def __init__(self, result_dir_path: Path, node_ids: List[str], distance_types: List[str], capacity: int,
+                 num_rows: Optional[Dict[str, int]] = None):
+        self.store_path = get_local_distance_store_path(result_dir_path)
+        self.store_path.mkdir(exist_ok=True)
+        self.num_rows = {distance_type: 0 for distance_type in distance_types}
+        self._matrices = {}
+        if num_rows is None:
+            with open(str(self.store_path.joinpath('nodes.json')), 'w') as fp:
+                json.dump([str(node_id) for node_id in node_ids], fp)
+            for distance_type in distance_types:
+                path = str(self.store_path.joinpath(f'{distance_type}.npy'))
+                self._matrices[distance_type] = np.lib.format.open_memmap(path, mode='w+', dtype=np.float64,
+                                                                          shape=(capacity, len(node_ids)))
+            self.flush()
+        else:
+            self.num_rows.update(num_rows)
+            for distance_type in distance_types:
+                path = str(self.store_path.joinpath(f'{distance_type}.npy'))
+                self._matrices[distance_type] = np.load(path, mmap_mode='r+')
+
+    def write(self, distance_type: str, rows: np.ndarray):
+        start = self.num_rows[distance_type]
+        self._matrices[distance_type][start:start + rows.shape[0]] = rows
+        self.num_rows[distance_type] += rows.shape[0]
+
+    def flush(self):
+        for matrix in self._matrices.values():
+            matrix.flush()
+        num_nodes = next(iter(self._matrices.values())).shape[1] if self._matrices else 0
+        index = {'num_nodes': num_nodes,
+                 'distance_types': {distance_type: {'num_rows': num_rows}
+                                    for distance_type, num_rows in self.num_rows.items()}}
+        _save_index(self.store_path, index)
+
+
+def save_local_distances(result_dir_path: Path, node_ids: List[str], local_distances: Dict[str, np.ndarray]):
+    capacity = max((distances.shape[0] for distances in local_distances.values()), default=0)
+    writer = LocalDistanceWriter(result_dir_path, node_ids, list(local_distances), capacity)
+    for distance_type, distances in local_distances.items():
+        writer.write(distance_type, np.asarray(distances, dtype=np.float64))
+    writer.flush()
+
+
+def _load_local_distances_from_csv(path_to_local_distances: Path) -> Tuple[List[str], Dict[str, np.ndarray]]:
+    local_distances = pd.read_csv(str(path_to_local_distances), dtype={'node': str})
+    local_distances['row'] = local_distances.groupby(['distance_type', 'node'], sort=False).cumcount()
+    node_ids = list(pd.unique(local_distances['node']))
+    matrices = {}
+    for distance_type, distances in local_distances.groupby('distance_type', sort=False):
+        matrix = distances.pivot(index='row', columns='node', values='distance').reindex(columns=node_ids)
+        matrices[distance_type] = matrix.to_numpy(dtype=np.float64)
+    return node_ids, matrices
+
+
+def load_local_distances(result_dir_path: Path) -> Tuple[List[str], Dict[str, np.ndarray]]:
+    """Loads the local distances saved by run_permutation_tests().
+
+    Returns the node IDs and, for each distance type, a memory-mapped matrix of shape (permutations + 1, nodes) whose
+    first row contains the distances between the unpermuted graphs. Falls back to local_distances.csv for result
+    directories generated before the binary store was introduced.
+    """
+    store_path = get_local_distance_store_path(result_dir_path)
+    if not store_path.joinpath('index.json').exists():
+        path_to_local_distances = result_dir_path.joinpath('local_distances.csv')
+        if not path_to_local_distances.exists():
+            raise FileNotFoundError(f'No local distances found in {str(result_dir_path)}.')
+        return _load_local_distances_from_csv(path_to_local_distances)
+    index = _load_index(store_path)
+    with open(str(store_path.joinpath('nodes.json'))) as fp:
+        node_ids = json.load(fp)
+    matrices = {}
+    for distance_type, info in index['distance_types'].items():
+        matrix = np.load(str(store_path.joinpath(f'{distance_type}.npy')), mmap_mode='r')
+        matrices[distance_type] = matrix[:info['num_rows']]
+    return node_ids, matrices
+
+
+def export_local_distances_to_csv(result_dir_path: Path) -> Path:
+    """Exports the binary local distance store to local_distances.csv in the long format used by earlier versions."""
+    node_ids, matrices = load_local_distances(result_dir_path)
+    path_to_local_distances = result_dir_path.joinpath('local_distances.csv')
+    header = True
+    num_rows = max((matrix.shape[0] for matrix in matrices.values()), default=0)
+    for row in range(num_rows):
+        for distance_type, matrix in matrices.items():
+            if row >= matrix.shape[0]:
+                continue
+            local_distances = pd.DataFrame(data={'permuted': row > 0, 'distance_type': distance_type,
+                                                 'node': node_ids, 'distance': matrix[row]})
+            local_distances.to_csv(str(path_to_local_distances), index=False, header=header,
+                                   mode='w' if header else 'a')
+            header = False
+    return path_to_local_distances
@@ -0,0 +1,184 @@
+import numpy as np
+import pandas as pd
+import scipy.sparse as spsp
+import scipy.special as spsc
+from pathlib import Path
+from typing import Dict, List, Optional, Iterable
+from graphsimqt.utils.local_distance_store import load_local_distances
+
+
+def compute_mwu_p_value(distances: np.ndarray, columns: Optional[np.ndarray] = None) -> float:
+    """Returns the p-value of the one-sided MWU test whether the unpermuted local distances (first row) of the given
+    columns are smaller than the permuted ones (remaining rows), computed with SciPy."""
+    # scipy.stats is slow to import and only needed for the tests that are not vectorized.
+    import scipy.stats as sps
+    if columns is not None:
+        distances = distances[:, columns]
+    x = np.asarray(distances[0])
+    y = np.asarray(distances[1:]).ravel()
+    if x.shape[0] == 0 or y.shape[0] == 0:
+        return 1.0
+    try:
+        _, mwu_p_value = sps.mannwhitneyu(x=x, y=y, alternative='less')
+    except ValueError:
+        return 1.0
+    return mwu_p_value
+
+
+def _compute_asymptotic_p_values(u1: np.ndarray, n1: np.ndarray, n2: np.ndarray, tie_term: np.ndarray) -> np.ndarray:
+    # Normal approximation with tie and continuity correction of the MWU test with alternative 'less', as in SciPy.
+    n = n1 + n2
+    u2 = n1 * n2 - u1
+    s = np.sqrt(n1 * n2 / 12 * ((n + 1) - tie_term / (n * (n - 1))))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        z = (u2 - n1 * n2 / 2 - 0.5) / s
+    return np.clip(spsc.ndtr(-z), 0, 1)
+
+
+class RankedLocalDistances(object):
+    """Local distances of one distance type, ranked once for any number of MWU tests.
+
+    Holds the dense ranks of all distances (unpermuted distances in the first row), the sorted permuted ranks of each
+    node, the number of occurrences of each distinct distance, and a sparse matrix with the counts of the tied
+    distances of each node. The results of all tests coincide with the ones of compute_mwu_p_value().
+    """
+
+    def __init__(self, distances: np.ndarray):
+        self.distances = distances
+        distances = np.asarray(distances)
+        self.num_permutations, self.num_nodes = distances.shape[0] - 1, distances.shape[1]
+        is_nan = np.isnan(distances)
+        self.has_nan = is_nan.any(axis=0)
+        _, ranks, value_counts = np.unique(np.where(is_nan, np.inf, distances), return_inverse=True,
+                                           return_counts=True)
+        self.num_values = value_counts.shape[0]
+        self.ranks = ranks.reshape(distances.shape).astype(np.int32 if self.num_values < 2 ** 31 else np.int64)
+        self.value_counts = value_counts
+        offsets = np.arange(self.num_nodes, dtype=np.int64)
+        self.sorted_keys = (np.sort(self.ranks[1:], axis=0).T.astype(np.int64) +
+                            (offsets * self.num_values)[:, None]).ravel()
+        is_tied = value_counts[self.ranks] > 1
+        self.tie_counts = spsp.csr_matrix((np.ones(int(is_tied.sum())),
+                                           (np.broadcast_to(offsets, self.ranks.shape)[is_tied], self.ranks[is_tied])),
+                                          shape=(self.num_nodes, self.num_values))
+
+    def compute_global_p_value(self) -> float:
+        """Returns the p-value of the test over all nodes."""
+        n1, n2 = self.num_nodes, self.num_nodes * self.num_permutations
+        if n1 == 0 or n2 == 0 or self.has_nan.any() or (n1 <= 8 and self.value_counts.max() == 1):
+            return compute_mwu_p_value(self.distances)
+        # The average rank of a distance is the number of smaller distances plus half of its ties plus 1/2.
+        average_ranks = np.cumsum(self.value_counts) - (self.value_counts - 1) / 2
+        u1 = average_ranks[self.ranks[0]].sum() - n1 * (n1 + 1) / 2
+        counts = self.value_counts.astype(np.float64)
+        tie_term = (counts ** 3 - counts).sum()
+        return float(_compute_asymptotic_p_values(np.array([u1]), np.array([float(n1)]), np.array([float(n2)]),
+                                                  np.array([tie_term]))[0])
+
+    def compute_node_set_p_values(self, node_set_columns: List[np.ndarray], max_pairs: int = 1 << 22) -> np.ndarray:
+        """Returns the p-values of the tests restricted to each of the given node sets (arrays of column indices).
+
+        The U statistic of a node set is the sum over all pairs of nodes i, j in the set of the number of permuted
+        distances of j below the unpermuted distance of i (ties count 1/2), which is obtained by binary search in the
+        sorted permuted ranks of j. The tie correction is obtained by multiplying the node set membership matrix with
+        the tied distance counts. Node sets are processed in blocks of at most max_pairs node pairs. Node sets with more
+        than max_pairs node pairs are tested one at a time on the sorted pooled permuted ranks of their nodes, which
+        requires memory linear in the number of their distances.
+        """
+        p_values = np.ones(len(node_set_columns))
+        if self.num_permutations == 0:
+            return p_values
+        sizes = np.array([columns.shape[0] for columns in node_set_columns], dtype=np.int64)
+        is_vectorized = (sizes > 0) & np.array([not self.has_nan[columns].any() for columns in node_set_columns],
+                                               dtype=bool)
+        is_large = is_vectorized & (sizes ** 2 > max_pairs)
+        for node_set in np.flatnonzero(is_large):
+            p_values[node_set] = self._compute_large_set_p_value(node_set_columns[node_set])
+            if np.isnan(p_values[node_set]):
+                p_values[node_set] = compute_mwu_p_value(self.distances, node_set_columns[node_set])
+        node_sets = np.flatnonzero(is_vectorized & ~is_large)
+        start = 0
+        while start < node_sets.shape[0]:
+            stop = start + int(np.searchsorted(np.cumsum(sizes[node_sets[start:]] ** 2), max_pairs, 'right'))
+            block = node_sets[start:stop]
+            block_columns = [node_set_columns[node_set] for node_set in block]
+            block_sizes = sizes[block]
+            p_values[block] = self._compute_block_p_values(block_columns, block_sizes)
+            # SciPy uses the exact distribution for small node sets without ties.
+            for node_set in block[(block_sizes <= 8) & np.isnan(p_values[block])]:
+                p_values[node_set] = compute_mwu_p_value(self.distances, node_set_columns[node_set])
+            start = stop
+        for node_set in np.flatnonzero(~is_vectorized & (sizes > 0)):
+            p_values[node_set] = compute_mwu_p_value(self.distances, node_set_columns[node_set])
+        return p_values
+
+    def _compute_large_set_p_value(self, columns: np.ndarray) -> float:
+        # Returns NaN if the node set requires the exact distribution.
+        unpermuted_ranks = self.ranks[0, columns]
+        permuted_ranks = np.sort(self.ranks[1:, columns], axis=None)
+        u1 = (np.searchsorted(permuted_ranks, unpermuted_ranks, 'left').sum() +
+              np.searchsorted(permuted_ranks, unpermuted_ranks, 'right').sum()) / 2
+        _, counts = np.unique(np.concatenate((unpermuted_ranks, permuted_ranks)), return_counts=True)
+        counts = counts.astype(np.float64)
+        tie_term = (counts ** 3 - counts).sum()
+        n1 = float(columns.shape[0])
+        if n1 <= 8 and tie_term == 0:
+            return np.nan
+        n2 = n1 * self.num_permutations
+        return float(_compute_asymptotic_p_values(np.array([u1]), np.array([n1]), np.array([n2]),
+                                                  np.array([tie_term]))[0])
+
+    def _compute_block_p_values(self, block_columns: List[np.ndarray], block_sizes: np.ndarray) -> np.ndarray:
+        # Returns NaN for the node sets that require the exact distribution.
+        set_indices = np.repeat(np.arange(len(block_columns)), block_sizes ** 2)
+        # Within each node set, the queries are generated in increasing order, which speeds up the binary searches.
+        first_nodes = np.concatenate([np.tile(columns[np.argsort(self.ranks[0, columns], kind='stable')],
+                                              columns.shape[0]) for columns in block_columns])
+        second_nodes = np.concatenate([np.repeat(columns, columns.shape[0]) for columns in block_columns])
+        queries = second_nodes * self.num_values + self.ranks[0, first_nodes]
+        num_leq = (np.searchsorted(self.sorted_keys, queries, 'left') +
+                   np.searchsorted(self.sorted_keys, queries, 'right') - 2 * second_nodes * self.num_permutations) / 2
+        u1 = np.bincount(set_indices, weights=num_leq, minlength=len(block_columns))
+        membership = spsp.csr_matrix((np.ones(block_sizes.sum()),
+                                      (np.repeat(np.arange(len(block_columns)), block_sizes),
+                                       np.concatenate(block_columns))), shape=(len(block_columns), self.num_nodes))
+        tie_counts = (membership @ self.tie_counts).tocoo()
+        tie_term = np.bincount(tie_counts.row, weights=tie_counts.data ** 3 - tie_counts.data,
+                               minlength=len(block_columns))
+        n1 = block_sizes.astype(np.float64)
+        p_values = _compute_asymptotic_p_values(u1, n1, n1 * self.num_permutations, tie_term)
+        p_values[(block_sizes <= 8) & (tie_term == 0)] = np.nan
+        return p_values
+
+
+class MWUContext(object):
+    """Local distances of a result directory shared by all MWU tests.
+
+    The local distances saved by run_permutation_tests() are loaded once, and each distance type is ranked once, when
+    it is first tested (see RankedLocalDistances). The global test and the tests of all node set families are then
+    served from the ranked distances. Node set tests are processed in blocks of at most max_pairs node pairs (see
+    RankedLocalDistances.compute_node_set_p_values()).
+    """
+
+    def __init__(self, result_dir_path: Path, max_pairs: int = 1 << 22):
+        self.max_pairs = max_pairs
+        self.node_ids, self._local_distances = load_local_distances(result_dir_path)
+        self.distance_types = list(self._local_distances)
+        self._node_index = pd.Index(self.node_ids)
+        self._ranked_distances: Dict[str, RankedLocalDistances] = {}
+
+    def get_ranked_distances(self, distance_type: str) -> RankedLocalDistances:
+        if distance_type not in self._ranked_distances:
+            self._ranked_distances[distance_type] = RankedLocalDistances(self._local_distances[distance_type])
+        return self._ranked_distances[distance_type]
+
+    def get_columns(self, node_set: Iterable) -> np.ndarray:
+        """Returns the sorted column indices of the nodes of the node set, ignoring unknown node IDs."""
+        columns = self._node_index.get_indexer([str(node_id) for node_id in node_set])
+        return np.sort(columns[columns >= 0])
+
+    def compute_global_p_value(self, distance_type: str) -> float:
+        return self.get_ranked_distances(distance_type).compute_global_p_value()
+
+    def compute_node_set_p_values(self, distance_type: str, node_set_columns: List[np.ndarray]) -> np.ndarray:
+        return self.get_ranked_distances(distance_type).compute_node_set_p_values(node_set_columns, self.max_pairs)
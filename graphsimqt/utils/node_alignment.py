@@ -0,0 +1,75 @@
+import graph_tool as gt
+import numpy as np
+import pandas as pd
+from typing import Optional, List
+
+
+class NodeAlignment(object):
+    """Integer alignment of the vertices of two graphs via their node IDs.
+
+    The node IDs of both graphs are hashed only once, when the alignment is built. Afterwards, vertices are mapped
+    between the graphs via NumPy arrays, which remain valid as long as the vertices of the graphs are not modified
+    (e.g., rewiring the edges does not invalidate the alignment).
+
+    Attributes
+    ----------
+    index : pandas.Index
+        Union of the node IDs of both graphs. Positions in this index are used as shared node indices.
+    positions_1, positions_2 : numpy.ndarray
+        Shared node indices of the vertices of the first and second graph.
+    vertices_1, vertices_2 : numpy.ndarray
+        Vertex indices in the first and second graph of the shared node indices, -1 if the node is missing.
+    index_2_of_1 : numpy.ndarray
+        Vertex indices in the second graph of the vertices of the first graph, -1 if the node is missing.
+    is_shared_1, is_shared_2 : numpy.ndarray
+        Boolean masks of the vertices of the first and second graph whose nodes are contained in both graphs.
+    shared_vertices_1, shared_vertices_2 : numpy.ndarray
+        Vertex indices in the first and second graph of the nodes contained in both graphs, in vertex order of the
+        first graph.
+    node_ids : list of str
+        IDs of the nodes contained in both graphs, in vertex order of the first graph.
+    """
+
+    def __init__(self, index: pd.Index, positions_1: np.ndarray, positions_2: np.ndarray):
+        self.index = index
+        self.positions_1 = positions_1
+        self.positions_2 = positions_2
+        self.vertices_1 = np.full(index.shape[0], -1, dtype=np.int64)
+        self.vertices_1[positions_1] = np.arange(positions_1.shape[0])
+        self.vertices_2 = np.full(index.shape[0], -1, dtype=np.int64)
+        self.vertices_2[positions_2] = np.arange(positions_2.shape[0])
+        self.index_2_of_1 = self.vertices_2[positions_1]
+        self.is_shared_1 = self.index_2_of_1 >= 0
+        self.is_shared_2 = self.vertices_1[positions_2] >= 0
+        self.shared_vertices_1 = np.flatnonzero(self.is_shared_1)
+        self.shared_vertices_2 = self.index_2_of_1[self.shared_vertices_1]
+        self.shared_positions = positions_1[self.shared_vertices_1]
+        self.node_ids = list(index[self.shared_positions])
+
+    @classmethod
+    def from_graphs(cls, graph_1: gt.Graph, graph_2: gt.Graph,
+                    node_ids_1: Optional[gt.VertexPropertyMap] = None,
+                    node_ids_2: Optional[gt.VertexPropertyMap] = None) -> 'NodeAlignment':
+        """Aligns two unfiltered graphs via the given node ID properties (by default, the 'ID' vertex properties)."""
+        if node_ids_1 is None:
+            node_ids_1 = graph_1.vertex_properties['ID']
+        if node_ids_2 is None:
+            node_ids_2 = graph_2.vertex_properties['ID']
+        ids_1 = pd.Index(np.array(list(node_ids_1), dtype=object))
+        ids_2 = pd.Index(np.array(list(node_ids_2), dtype=object))
+        index = ids_1.append(ids_2).unique()
+        return cls(index, index.get_indexer(ids_1), index.get_indexer(ids_2))
+
+    def restrict_to_shared(self) -> 'NodeAlignment':
+        """Returns the alignment of the graphs obtained by purging the vertices whose nodes are missing in the other
+        graph. Purging preserves the relative order of the remaining vertices, so no IDs need to be rehashed."""
+        is_shared = (self.vertices_1 >= 0) & (self.vertices_2 >= 0)
+        new_positions = np.cumsum(is_shared) - 1
+        return NodeAlignment(self.index[is_shared], new_positions[self.positions_1[self.is_shared_1]],
+                             new_positions[self.positions_2[self.is_shared_2]])
+
+    def get_positions(self, node_ids: List[str]) -> np.ndarray:
+        """Returns the shared node indices of the given node IDs, -1 for unknown IDs. Looking up node_ids is free."""
+        if node_ids is self.node_ids:
+            return self.shared_positions
+        return self.index.get_indexer(list(node_ids))
@@ -0,0 +1,146 @@
+import graph_tool as gt
+import contextlib
+import hashlib
+import json
+import os
+from pathlib import Path
+from typing import Optional, Dict, Tuple
+try:
+    import fcntl
+except ImportError:
+    # Not available on Windows, where the statistics are updated without lock.
+    fcntl = None
+from graphsimqt.utils.get_directory_paths import get_cache_directory_path
+
+# Maximal total size of the cached normalized graphs in bytes, can be overridden via GRAPHSIMQT_CACHE_MAX_SIZE.
+DEFAULT_MAX_CACHE_SIZE = 10 * 1024 ** 3
+
+# Input file hashes of the current process, keyed by (path, size, modification time).
+_file_hashes: Dict[Tuple[str, int, int], str] = {}
+
+
+def get_normalization_cache_path() -> Path:
+    return get_cache_directory_path('normalized_graphs')
+
+
+def _get_max_cache_size() -> int:
+    return int(os.environ.get('GRAPHSIMQT_CACHE_MAX_SIZE', DEFAULT_MAX_CACHE_SIZE))
+
+
+def _hash_file(path_to_file: Path) -> str:
+    stat = path_to_file.stat()
+    file_key = (str(path_to_file.resolve()), stat.st_size, stat.st_mtime_ns)
+    if file_key not in _file_hashes:
+        file_hash = hashlib.sha256()
+        with open(str(path_to_file), 'rb') as fp:
+            for block in iter(lambda: fp.read(1 << 20), b''):
+                file_hash.update(block)
+        _file_hashes[file_key] = file_hash.hexdigest()
+    return _file_hashes[file_key]
+
+
+def get_normalization_cache_key(path_to_graph: Path, parameters: dict) -> str:
+    """Returns the cache key of a normalized graph, i.e., a hash of the input file content and the parameters."""
+    key = json.dumps({'input': _hash_file(path_to_graph), 'parameters': parameters}, sort_keys=True)
+    return hashlib.sha256(key.encode()).hexdigest()
+
+
+@contextlib.contextmanager
+def _lock_stats(cache_path: Path):
+    # Serializes the read-modify-write cycles of concurrent processes (e.g., the workers of run_similarity_batch()).
+    with open(str(cache_path.joinpath('stats.json.lock')), 'a') as lock_fp:
+        if fcntl is not None:
+            fcntl.flock(lock_fp, fcntl.LOCK_EX)
+        yield
+
+
+def _update_stats(cache_path: Path, counter: str):
+    path_to_stats = cache_path.joinpath('stats.json')
+    with _lock_stats(cache_path):
+        stats = {'hits': 0, 'misses': 0}
+        if path_to_stats.exists():
+            try:
+                with open(str(path_to_stats)) as fp:
+                    stats.update(json.load(fp))
+            except ValueError:
+                pass
+        stats[counter] += 1
+        path_to_tmp_stats = cache_path.joinpath(f'stats.json.{os.getpid()}.tmp')
+        with open(str(path_to_tmp_stats), 'w') as fp:
+            json.dump(stats, fp)
+        os.replace(str(path_to_tmp_stats), str(path_to_stats))
+
+
+def load_cached_graph(key: str) -> Tuple[Optional[gt.Graph], Optional[Path]]:
+    """Returns the cached normalized graph with the given key and its path and marks it as recently used, or
+    (None, None) if the graph is not cached. Graphs evicted by another process between the lookup and the loading are
+    treated as not cached. Hits and misses are counted in the cache statistics."""
+    cache_path = get_normalization_cache_path()
+    cache_path.mkdir(parents=True, exist_ok=True)
+    path_to_graph = cache_path.joinpath(f'{key}.gt')
+    try:
+        os.utime(str(path_to_graph))
+        graph = gt.load_graph(str(path_to_graph))
+    except OSError:
+        _update_stats(cache_path, 'misses')
+        return None, None
+    _update_stats(cache_path, 'hits')
+    return graph, path_to_graph
+
+
+def add_graph_to_cache(key: str, graph: gt.Graph) -> Path:
+    """Saves a normalized graph to the cache and evicts the least recently used graphs if the cache is too large."""
+    cache_path = get_normalization_cache_path()
+    cache_path.mkdir(parents=True, exist_ok=True)
+    path_to_graph = cache_path.joinpath(f'{key}.gt')
+    path_to_tmp_graph = cache_path.joinpath(f'{key}.{os.getpid()}.tmp.gt')
+    graph.save(str(path_to_tmp_graph))
+    os.replace(str(path_to_tmp_graph), str(path_to_graph))
+    evict_from_cache(_get_max_cache_size(), keep={path_to_graph.name})
+    return path_to_graph
+
+
+def evict_from_cache(max_size: int, keep: set = frozenset()):
+    """Removes the least recently used graphs from the cache until its total size does not exceed max_size bytes."""
+    cache_path = get_normalization_cache_path()
+    if not cache_path.exists():
+        return
+    entries = []
+    for path_to_graph in cache_path.glob('*.gt'):
+        if '.tmp.' in path_to_graph.name:
+            continue
+        try:
+            stat = path_to_graph.stat()
+        except FileNotFoundError:
+            continue
+        entries.append((stat.st_mtime_ns, stat.st_size, path_to_graph))
+    total_size = sum(size for _, size, _ in entries)
+    for _, size, path_to_graph in sorted(entries):
+        if total_size <= max_size:
+            break
+        if path_to_graph.name in keep:
+            continue
+        try:
+            path_to_graph.unlink()
+        except FileNotFoundError:
+            pass
+        total_size -= size
+
+
+def get_normalization_cache_stats() -> dict:
+    """Returns the location, number of entries, total size in bytes, maximal size, and hit and miss counts of the
+    normalization cache."""
+    cache_path = get_normalization_cache_path()
+    stats = {'path': str(cache_path), 'num_entries': 0, 'size': 0, 'max_size': _get_max_cache_size(), 'hits': 0,
+             'misses': 0}
+    if not cache_path.exists():
+        return stats
+    for path_to_graph in cache_path.glob('*.gt'):
+        if '.tmp.' not in path_to_graph.name:
+            stats['num_entries'] += 1
+            stats['size'] += path_to_graph.stat().st_size
+    path_to_stats = cache_path.joinpath('stats.json')
+    if path_to_stats.exists():
+        with open(str(path_to_stats)) as fp:
+            stats.update(json.load(fp))
+    return stats
@@ -0,0 +1,304 @@
+import graph_tool as gt
+import graph_tool.generation as gtg
+import hashlib
+import json
+import os
+import multiprocessing as mp
+import contextlib
+import numpy as np
+from pathlib import Path
+from typing import List, Tuple, Optional
+try:
+    import fcntl
+except ImportError:
+    # Not available on Windows, where concurrent builds of the same bank are not serialized.
+    fcntl = None
+from graphsimqt.utils.get_directory_paths import get_cache_directory_path
+
+# Number of rewiring sweeps carried out per permutation.
+NUM_REWIRING_ITERATIONS = 100
+
+# Number of sweeps of double edge swaps carried out per permutation by swap_edges(). Each sweep proposes one swap for
+# each of the floor(edges / 2) disjoint pairs of a random pairing of the edges.
+NUM_SWAP_SWEEPS = 10
+
+# Version of the on-disk layout, stored in bank.json and part of the bank path.
+NULL_MODEL_BANK_FORMAT_VERSION = 3
+
+_worker_state = {}
+
+
+def get_permutation_seeds(seed: Optional[int], num_permutations: int, num_graphs: int = 2) -> List[Tuple[int, ...]]:
+    """Returns the rewiring seeds of each graph for each permutation. The seeds of a permutation do not depend on
+    num_permutations, and the seeds of the k-th graph do not depend on num_graphs, i.e., the seeds of the first two
+    graphs coincide with the ones of a pair."""
+    seed_sequences = np.random.SeedSequence(seed).spawn(num_permutations)
+    return [tuple(int(s) for s in seed_sequence.generate_state(num_graphs)) for seed_sequence in seed_sequences]
+
+
+def _get_edges_in_index_order(graph: gt.Graph) -> np.ndarray:
+    # The edges are placed at their indices instead of being sorted by them.
+    edges = graph.get_edges([graph.edge_index]).astype(np.int64)
+    ordered_edges = np.empty((graph.edge_index_range, 2), dtype=np.int64)
+    ordered_edges[edges[:, 2]] = edges[:, :2]
+    if edges.shape[0] == graph.edge_index_range:
+        return ordered_edges
+    is_edge = np.zeros(graph.edge_index_range, dtype=bool)
+    is_edge[edges[:, 2]] = True
+    return ordered_edges[is_edge]
+
+
+def _count_changed_edges(edges: np.ndarray, rewired_edges: np.ndarray, directed: bool) -> int:
+    if directed:
+        return int((edges != rewired_edges).any(axis=1).sum())
+    # The endpoints of undirected edges may be swapped without changing the edge.
+    return int(((edges.min(axis=1) != rewired_edges.min(axis=1)) |
+                (edges.max(axis=1) != rewired_edges.max(axis=1))).sum())
+
+
+def _rewire_graph(graph: gt.Graph, seed: int) -> Tuple[gt.Graph, np.ndarray, int]:
+    # random_rewire() moves the endpoints of the edges but keeps their indices, so the edges of the copy before and
+    # after the rewiring can be compared position by position.
+    permuted_graph = gt.Graph(graph)
+    edges = _get_edges_in_index_order(permuted_graph)
+    gt.seed_rng(seed)
+    gtg.random_rewire(permuted_graph, n_iter=NUM_REWIRING_ITERATIONS)
+    rewired_edges = _get_edges_in_index_order(permuted_graph)
+    return permuted_graph, rewired_edges, _count_changed_edges(edges, rewired_edges, graph.is_directed())
+
+
+def rewire_graph(graph: gt.Graph, seed: int) -> Tuple[gt.Graph, int]:
+    """Returns a degree-preserving rewiring of a copy of the graph and the number of edges whose endpoints changed."""
+    permuted_graph, _, num_rewired_edges = _rewire_graph(graph, seed)
+    return permuted_graph, num_rewired_edges
+
+
+def _get_edge_keys(edges: np.ndarray, num_vertices: int, directed: bool) -> np.ndarray:
+    if directed:
+        return edges[:, 0] * num_vertices + edges[:, 1]
+    return edges.min(axis=1) * num_vertices + edges.max(axis=1)
+
+
+def swap_edges(graph: gt.Graph, seed: int,
+               num_sweeps: int = NUM_SWAP_SWEEPS) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Carries out degree-preserving double edge swaps on the edges of the graph, without modifying the graph.
+
+    Each sweep pairs the edges at random and proposes to replace each pair of edges (a, b), (c, d) by (a, d), (c, b)
+    (for undirected graphs, the second edge is reversed with probability 1/2). All swaps of a sweep are evaluated at
+    once, and swaps that would create self-loops or edges that exist already or are created by another swap of the sweep
+    are rejected. As in random_rewire(), the edges keep their indices, i.e., their properties move with them.
+
+    Returns the indices, the original endpoints, and the new endpoints of the edges whose endpoints changed, which can
+    be passed to graphsimqt.utils.incremental_graph_distance.IncrementalGraphDistance.apply_edge_changes().
+    """
+    edge_list = graph.get_edges([graph.edge_index]).astype(np.int64)
+    edge_indices, original_edges = edge_list[:, 2], edge_list[:, :2]
+    edges = original_edges.copy()
+    directed, num_vertices = graph.is_directed(), graph.num_vertices()
+    num_pairs = edges.shape[0] // 2
+    rng = np.random.default_rng(seed)
+    for _ in range(num_sweeps if num_pairs > 0 else 0):
+        order = rng.permutation(edges.shape[0])
+        first, second = order[:num_pairs], order[num_pairs:2 * num_pairs]
+        a, b = edges[first, 0], edges[first, 1]
+        c, d = edges[second, 0], edges[second, 1]
+        if not directed:
+            is_reversed = rng.random(num_pairs) < 0.5
+            c, d = np.where(is_reversed, d, c), np.where(is_reversed, c, d)
+        new_first, new_second = np.column_stack((a, d)), np.column_stack((c, b))
+        keys = _get_edge_keys(edges, num_vertices, directed)
+        new_first_keys = _get_edge_keys(new_first, num_vertices, directed)
+        new_second_keys = _get_edge_keys(new_second, num_vertices, directed)
+        is_accepted = ((a != d) & (c != b) & (new_first_keys != new_second_keys) &
+                       ~np.isin(new_first_keys, keys) & ~np.isin(new_second_keys, keys))
+        new_keys, counts = np.unique(np.concatenate((new_first_keys[is_accepted], new_second_keys[is_accepted])),
+                                     return_counts=True)
+        is_accepted &= ~np.isin(new_first_keys, new_keys[counts > 1]) & ~np.isin(new_second_keys, new_keys[counts > 1])
+        edges[first[is_accepted]] = new_first[is_accepted]
+        edges[second[is_accepted]] = new_second[is_accepted]
+    is_changed = (_get_edge_keys(original_edges, num_vertices, directed) !=
+                  _get_edge_keys(edges, num_vertices, directed))
+    return edge_indices[is_changed], original_edges[is_changed], edges[is_changed]
+
+
+def get_graph_fingerprint(graph: gt.Graph) -> str:
+    """Returns a hash of the directedness, node IDs, edges, and edge properties of the graph."""
+    fingerprint = hashlib.sha256()
+    fingerprint.update(json.dumps({'directed': graph.is_directed(), 'num_vertices': graph.num_vertices(),
+                                   'edge_properties': sorted(graph.edge_properties.keys())}).encode())
+    fingerprint.update('\x1f'.join(str(node_id) for node_id in graph.vertex_properties['ID']).encode())
+    edges = graph.get_edges([graph.edge_index]).astype(np.int64)
+    fingerprint.update(np.ascontiguousarray(edges[:, :2]).tobytes())
+    for edge_property_name in sorted(graph.edge_properties.keys()):
+        values = graph.edge_properties[edge_property_name].a[edges[:, 2]]
+        fingerprint.update(np.ascontiguousarray(values, dtype=np.float64).tobytes())
+    return fingerprint.hexdigest()
+
+
+def get_null_model_bank_path(graph: gt.Graph, seed: int, stream: int) -> Path:
+    key = json.dumps({'graph': get_graph_fingerprint(graph), 'seed': seed, 'stream': stream,
+                      'n_iter': NUM_REWIRING_ITERATIONS, 'format_version': NULL_MODEL_BANK_FORMAT_VERSION},
+                     sort_keys=True)
+    return get_cache_directory_path('null_model_banks').joinpath(hashlib.sha256(key.encode()).hexdigest())
+
+
+class NullModelBank(object):
+    """Precomputed degree-preserving rewirings of a graph.
+
+    The k-th rewiring is obtained by rewiring the graph with seed
+    get_permutation_seeds(seed, k + 1, stream + 1)[k][stream], i.e., exactly as in the permutation tests of
+    graphsimqt.run_permutation_tests and graphsimqt.run_similarity_matrix. The bank directory contains the memory-mapped
+    matrix edges.npy of shape (permutations, edges, 2) with the rewired endpoints in edge index order, the array
+    num_rewired_edges.npy with the number of edges whose endpoints changed in each rewiring, and the metadata in
+    bank.json. Since random_rewire() only moves the endpoints of the edges, the edge properties stay attached to the
+    edge indices and are not stored. The rewirings are replayed onto copies of the original graph via get_graph(), which
+    adds the edges in edge index order and takes the edge properties from the copy. Since the rewirings are recorded on
+    copies as well, the replay does not depend on whether copying renumbers the edges. Banks are built for the graphs
+    that are rewired without banks, i.e., after their restriction to the nodes shared with the other graph(s), so that
+    the results do not depend on whether banks are used.
+    """
+
+    def __init__(self, bank_path: Path):
+        self.bank_path = bank_path
+        with open(str(bank_path.joinpath('bank.json'))) as fp:
+            metadata = json.load(fp)
+        self.seed = metadata['seed']
+        self.stream = metadata['stream']
+        self.num_permutations = metadata['num_permutations']
+        self.edge_property_names = metadata['edge_property_names']
+        self._edges = np.load(str(bank_path.joinpath('edges.npy')), mmap_mode='r')
+        self._num_rewired_edges = np.load(str(bank_path.joinpath('num_rewired_edges.npy')), mmap_mode='r')
+
+    def __getstate__(self):
+        # Only the path is pickled, so that worker processes map the bank instead of receiving copies.
+        return {'bank_path': self.bank_path}
+
+    def __setstate__(self, state: dict):
+        self.__init__(state['bank_path'])
+
+    def get_graph(self, graph: gt.Graph, permutation: int) -> Tuple[gt.Graph, int]:
+        """Returns a copy of the graph whose edges are replaced by the given rewiring and the number of edges whose
+        endpoints changed, as returned by rewire_graph()."""
+        if permutation >= self.num_permutations:
+            raise IndexError(f'The null model bank contains only {self.num_permutations} permutations.')
+        permuted_graph = gt.Graph(graph)
+        # The edges are added in edge index order, so that the k-th added edge receives the properties of the edge
+        # with the k-th smallest index of the copy (i.e., of the edge with index k if there are no gaps).
+        edge_indices = None
+        if permuted_graph.edge_index_range != permuted_graph.num_edges():
+            edge_indices = np.sort(permuted_graph.get_edges([permuted_graph.edge_index])[:, 2])
+        values = {name: permuted_graph.edge_properties[name].a.copy() for name in self.edge_property_names}
+        permuted_graph.clear_edges()
+        permuted_graph.add_edge_list(self._edges[permutation])
+        for name in self.edge_property_names:
+            permuted_graph.edge_properties[name].a = (values[name] if edge_indices is None
+                                                      else values[name][edge_indices])
+        return permuted_graph, int(self._num_rewired_edges[permutation])
+
+
+def _record_rewiring(graph: gt.Graph, seed: int) -> Tuple[np.ndarray, int]:
+    _, rewired_edges, num_rewired_edges = _rewire_graph(graph, seed)
+    return rewired_edges, num_rewired_edges
+
+
+def _initialize_worker(graph: gt.Graph):
+    _worker_state['graph'] = graph
+
+
+def _record_rewiring_in_worker(seed: int) -> Tuple[np.ndarray, int]:
+    return _record_rewiring(_worker_state['graph'], seed)
+
+
+def _open_array(bank_path: Path, name: str, shape: Tuple[int, ...], dtype, num_existing: int) -> np.memmap:
+    # Opens a temporary array that replaces the existing one once it is complete. Existing rewirings are copied.
+    path_to_tmp_array = str(bank_path.joinpath(f'{name}.{os.getpid()}.tmp.npy'))
+    array = np.lib.format.open_memmap(path_to_tmp_array, mode='w+', dtype=dtype, shape=shape)
+    if num_existing > 0:
+        array[:num_existing] = np.load(str(bank_path.joinpath(f'{name}.npy')), mmap_mode='r')[:num_existing]
+    return array
+
+
+def _extend_null_model_bank(graph: gt.Graph, bank_path: Path, seed: int, stream: int, num_permutations: int,
+                            num_existing: int, n_jobs: int):
+    edge_property_names = sorted(graph.edge_properties.keys())
+    for name in edge_property_names:
+        if graph.edge_properties[name].a is None:
+            raise ValueError(f'Edge property {name} is not scalar and is not supported by null model banks.')
+    num_edges = graph.num_edges()
+    vertex_dtype = np.int32 if graph.num_vertices() < np.iinfo(np.int32).max else np.int64
+    edges = _open_array(bank_path, 'edges', (num_permutations, num_edges, 2), vertex_dtype, num_existing)
+    num_rewired_edges = _open_array(bank_path, 'num_rewired_edges', (num_permutations,), np.int64, num_existing)
+    seeds = [seeds[stream] for seeds in get_permutation_seeds(seed, num_permutations, stream + 1)[num_existing:]]
+    with contextlib.ExitStack() as stack:
+        if n_jobs == 1:
+            rewirings = (_record_rewiring(graph, rewiring_seed) for rewiring_seed in seeds)
+        else:
+            # The pool is terminated on exit, also if the rewiring is interrupted by an exception.
+            pool = stack.enter_context(mp.Pool(n_jobs, initializer=_initialize_worker,
+                                               initargs=(graph,)))
+            rewirings = pool.imap(_record_rewiring_in_worker, seeds, max(1, len(seeds) // (16 * n_jobs)))
+        for permutation, (rewired_edges, num_changed_edges) in enumerate(rewirings, num_existing):
+            edges[permutation] = rewired_edges
+            num_rewired_edges[permutation] = num_changed_edges
+    for array, name in [(edges, 'edges'), (num_rewired_edges, 'num_rewired_edges')]:
+        array.flush()
+        os.replace(array.filename, str(bank_path.joinpath(f'{name}.npy')))
+    metadata = {'format_version': NULL_MODEL_BANK_FORMAT_VERSION, 'seed': seed, 'stream': stream,
+                'num_permutations': num_permutations, 'edge_property_names': edge_property_names,
+                'num_vertices': graph.num_vertices(), 'num_edges': num_edges, 'directed': graph.is_directed(),
+                'n_iter': NUM_REWIRING_ITERATIONS}
+    path_to_tmp_metadata = bank_path.joinpath(f'bank.json.{os.getpid()}.tmp')
+    with open(str(path_to_tmp_metadata), 'w') as fp:
+        json.dump(metadata, fp)
+    os.replace(str(path_to_tmp_metadata), str(bank_path.joinpath('bank.json')))
+
+
+@contextlib.contextmanager
+def _lock_bank(bank_path: Path):
+    # Serializes concurrent builds of the same bank (e.g., by the workers of run_similarity_batch()).
+    with open(str(bank_path.joinpath('bank.lock')), 'a') as lock_fp:
+        if fcntl is not None:
+            fcntl.flock(lock_fp, fcntl.LOCK_EX)
+        yield
+
+
+def build_null_model_bank(graph: gt.Graph, seed: int, stream: int, num_permutations: int,
+                          n_jobs: int = 1) -> NullModelBank:
+    """Returns the null model bank of the graph for the given seed and stream with at least num_permutations
+    rewirings. Existing banks are reused and extended if they contain fewer rewirings. Concurrent builds of the same
+    bank are serialized via a lock on the bank directory, and a bank never shrinks.
+
+    Parameters
+    ----------
+    graph : graph_tool.Graph
+        Graph with string vertex property ID whose rewirings should be stored.
+    seed : int
+        Master seed from which the rewiring seeds are derived, see get_permutation_seeds().
+    stream : int
+        Index of the rewiring seed used for the graph (0 for the first and 1 for the second graph of a pair, or the
+        position of the graph in graphsimqt.run_similarity_matrix.run_similarity_matrix()).
+    num_permutations : int
+        Number of rewirings.
+    n_jobs : int, default: 1
+        Number of worker processes among which the rewirings are split.
+
+    Returns
+    -------
+    bank : NullModelBank
+        Null model bank.
+
+    """
+    bank_path = get_null_model_bank_path(graph, seed, stream)
+    bank_path.mkdir(parents=True, exist_ok=True)
+    with _lock_bank(bank_path):
+        # bank.json is read under the lock, so that a build never replaces the bank with a smaller one.
+        num_existing = 0
+        if bank_path.joinpath('bank.json').exists():
+            bank = NullModelBank(bank_path)
+            if bank.num_permutations >= num_permutations:
+                return bank
+            num_existing = bank.num_permutations
+            del bank
+        _extend_null_model_bank(graph, bank_path, seed, stream, num_permutations, num_existing, n_jobs)
+        return NullModelBank(bank_path)
+
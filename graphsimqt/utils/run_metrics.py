@@ -0,0 +1,190 @@
+import cProfile
+import json
+import sys
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Optional, List
+try:
+    import resource
+except ImportError:
+    resource = None
+
+PROFILERS = {'cprofile', 'pyinstrument'}
+
+_collections = []
+
+# Peak RSS of the open stages, innermost last.
+_open_stages = []
+
+# Largest peak RSS of the main process before a reset, since resetting VmHWM resets ru_maxrss as well.
+_peak_rss_before_resets = {'peak_rss': 0}
+
+
+def _get_process_peak_rss(of_children: bool = False) -> Optional[int]:
+    # Peak resident set size in bytes since the start of the process. ru_maxrss is given in kilobytes on Linux and in
+    # bytes on macOS.
+    if resource is None:
+        return None
+    peak_rss = resource.getrusage(resource.RUSAGE_CHILDREN if of_children else resource.RUSAGE_SELF).ru_maxrss
+    peak_rss = int(peak_rss if sys.platform == 'darwin' else peak_rss * 1024)
+    return peak_rss if of_children else max(peak_rss, _peak_rss_before_resets['peak_rss'])
+
+
+def _get_peak_rss() -> Optional[int]:
+    # Peak resident set size in bytes since the last call of _reset_peak_rss() (VmHWM), None if not available.
+    try:
+        with open('/proc/self/status') as fp:
+            for line in fp:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return None
+
+
+def _reset_peak_rss() -> bool:
+    # Resets VmHWM to the current resident set size (Linux only).
+    peak_rss = _get_peak_rss()
+    if peak_rss is not None:
+        _peak_rss_before_resets['peak_rss'] = max(_peak_rss_before_resets['peak_rss'], peak_rss)
+    try:
+        with open('/proc/self/clear_refs', 'w') as fp:
+            fp.write('5')
+        return True
+    except OSError:
+        return False
+
+
+def _update_open_stages(peak_rss: Optional[int]):
+    for open_stage in _open_stages:
+        if open_stage['peak_rss'] is not None and peak_rss is not None:
+            open_stage['peak_rss'] = max(open_stage['peak_rss'], peak_rss)
+
+
+class RunMetrics(object):
+    """Wall time, CPU time, peak resident set size, and item counts of the stages of a run.
+
+    Stages are measured via measure_stage(), which records into the innermost metrics opened by collect_run_metrics().
+    Peak RSS values are given in bytes. peak_rss is the peak of the main process during the stage, which is measured
+    by resetting the peak at the start of each stage and is hence only available on Linux. process_peak_rss and
+    process_peak_rss_children are the peaks of the main process and of its largest terminated worker process since
+    their start, i.e., up to the end of the stage. The metrics of the individual permutations of
+    graphsimqt.run_permutation_tests are recorded by the workers and added via add_permutation_metrics().
+    """
+
+    def __init__(self, result_dir_path: Path):
+        self.result_dir_path = result_dir_path
+        self.stages = []
+        self.permutations = []
+
+    def as_dict(self):
+        return {'stages': self.stages, 'permutations': self.permutations}
+
+    def __repr__(self):
+        return str(self.as_dict())
+
+    def save(self):
+        """Merges the metrics into run_metrics.json in the result directory. Stages of earlier runs are replaced by
+        stages with the same names, and the permutation metrics are replaced if permutations have been recorded."""
+        self.result_dir_path.mkdir(parents=True, exist_ok=True)
+        path_to_run_metrics = self.result_dir_path.joinpath('run_metrics.json')
+        run_metrics = {'stages': [], 'permutations': []}
+        if path_to_run_metrics.exists():
+            with open(str(path_to_run_metrics)) as fp:
+                run_metrics = json.load(fp)
+        stage_names = {stage['stage'] for stage in self.stages}
+        run_metrics['stages'] = [stage for stage in run_metrics['stages'] if stage['stage'] not in stage_names]
+        run_metrics['stages'].extend(self.stages)
+        if self.permutations:
+            run_metrics['permutations'] = self.permutations
+        with open(str(path_to_run_metrics), 'w') as fp:
+            json.dump(run_metrics, fp, indent=2, default=lambda value: value.item())
+
+
+def _start_profiler(profiler: Optional[str]):
+    if profiler is None:
+        return None
+    if profiler not in PROFILERS:
+        raise ValueError(f'Unsupported profiler {profiler}.\n'
+                         f'Supported profilers: {", ".join(PROFILERS)}.')
+    if profiler == 'cprofile':
+        profile = cProfile.Profile()
+        profile.enable()
+        return profile
+    try:
+        import pyinstrument
+    except ImportError:
+        raise ImportError('The profiler pyinstrument is not installed. Install it via pip install pyinstrument.')
+    profile = pyinstrument.Profiler()
+    profile.start()
+    return profile
+
+
+def _stop_profiler(profile, result_dir_path: Path):
+    if profile is None:
+        return
+    result_dir_path.mkdir(parents=True, exist_ok=True)
+    if isinstance(profile, cProfile.Profile):
+        profile.disable()
+        profile.dump_stats(str(result_dir_path.joinpath('profile.prof')))
+    else:
+        profile.stop()
+        with open(str(result_dir_path.joinpath('profile.html')), 'w') as fp:
+            fp.write(profile.output_html())
+
+
+@contextmanager
+def collect_run_metrics(result_dir_path: Path, profiler: Optional[str] = None):
+    """Collects the metrics of all stages measured within the context and saves them to run_metrics.json in the
+    result directory on exit.
+
+    Nested calls for the same result directory (e.g., run_permutation_tests() called by run_similarity_analysis())
+    record into the metrics of the enclosing call. If profiler is 'cprofile' or 'pyinstrument', the context is
+    profiled, and the profile is saved to profile.prof (readable with pstats or snakeviz) or profile.html,
+    respectively. Profiling nested contexts is not supported, so the profiler of a nested call is ignored.
+    """
+    if _collections and _collections[-1].result_dir_path == result_dir_path:
+        yield _collections[-1]
+        return
+    run_metrics = RunMetrics(result_dir_path)
+    _collections.append(run_metrics)
+    profile = _start_profiler(profiler)
+    try:
+        yield run_metrics
+    finally:
+        _stop_profiler(profile, result_dir_path)
+        _collections.pop()
+        run_metrics.save()
+
+
+@contextmanager
+def measure_stage(stage: str, **counts):
+    """Measures the stage executed within the context. Yields a dictionary of item counts (initialized with the given
+    keyword arguments), which can be updated within the context. Without collection, nothing is recorded."""
+    if not _collections:
+        yield counts
+        return
+    # The peak reached so far is attributed to the enclosing stages before it is reset for this stage.
+    _update_open_stages(_get_peak_rss())
+    open_stage = {'peak_rss': _get_peak_rss() if _reset_peak_rss() else None}
+    _open_stages.append(open_stage)
+    start_wall_time, start_cpu_time = time.perf_counter(), time.process_time()
+    try:
+        yield counts
+    finally:
+        _update_open_stages(_get_peak_rss())
+        _open_stages.pop()
+        if _collections:
+            _collections[-1].stages.append({'stage': stage, 'wall_time': time.perf_counter() - start_wall_time,
+                                            'cpu_time': time.process_time() - start_cpu_time,
+                                            'peak_rss': open_stage['peak_rss'],
+                                            'process_peak_rss': _get_process_peak_rss(),
+                                            'process_peak_rss_children': _get_process_peak_rss(of_children=True),
+                                            'counts': counts})
+
+
+def add_permutation_metrics(permutation_metrics: List[dict]):
+    """Adds the metrics of individual permutations to the innermost collection, if any."""
+    if _collections:
+        _collections[-1].permutations.extend(permutation_metrics)
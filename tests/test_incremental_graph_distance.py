@@ -0,0 +1,161 @@
+import numpy as np
+import pytest
+
+gt = pytest.importorskip('graph_tool')
+
+from graphsimqt.utils.graph_distance import GraphDistance
+from graphsimqt.utils.incremental_graph_distance import IncrementalGraphDistance
+from graphsimqt.utils.node_alignment import NodeAlignment
+from graphsimqt.utils.null_model_bank import swap_edges
+from graphsimqt.utils.sparse_graph_distance import SparseGraphDistance
+
+NUM_NODES = 12
+
+
+def _get_weights(edges: np.ndarray, directed: bool) -> np.ndarray:
+    # Parallel edges receive the same weight, since the engines do not agree on which of them is used.
+    if not directed:
+        edges = np.sort(edges, axis=1)
+    return ((edges[:, 0] * 7 + edges[:, 1] * 3) % 10) / 10.0
+
+
+def _get_graph(edges: np.ndarray, node_ids: list, directed: bool) -> gt.Graph:
+    graph = gt.Graph(directed=directed)
+    graph.add_vertex(len(node_ids))
+    graph.vertex_properties['ID'] = graph.new_vp('string', vals=node_ids)
+    score_property = graph.new_ep('double')
+    edges = np.asarray(edges, dtype=np.int64).reshape(-1, 2)
+    graph.add_edge_list(np.column_stack((edges, _get_weights(edges, directed))), eprops=[score_property])
+    graph.edge_properties['NORM-SCORE'] = score_property
+    return graph
+
+
+def _get_random_edges(rng: np.random.Generator, num_edges: int) -> np.ndarray:
+    edges = rng.integers(0, NUM_NODES, size=(num_edges, 2))
+    # Ensure that the graphs contain self-loops and parallel edges.
+    return np.concatenate((edges, [[3, 3], [5, 5]], edges[:4]))
+
+
+def _get_graph_pair(directed: bool, seed: int):
+    rng = np.random.default_rng(seed)
+    node_ids = [f'n{node}' for node in range(NUM_NODES)]
+    edges_g, edges_h = _get_random_edges(rng, 20), _get_random_edges(rng, 20)
+    # The vertices of the second graph are in a different order, so that the alignment is not the identity.
+    order = rng.permutation(NUM_NODES)
+    edges_h = np.argsort(order)[edges_h]
+    return (_get_graph(edges_g, node_ids, directed), _get_graph(edges_h, [node_ids[node] for node in order], directed),
+            edges_g, edges_h)
+
+
+def _get_edge_properties(g: gt.Graph, h: gt.Graph, weighted: bool):
+    return (g.edge_properties['NORM-SCORE'], h.edge_properties['NORM-SCORE']) if weighted else None
+
+
+def _assert_same_distances(g: gt.Graph, h: gt.Graph, distances: IncrementalGraphDistance, weighted: bool):
+    alignment = NodeAlignment.from_graphs(g, h)
+    for engine in [GraphDistance, SparseGraphDistance]:
+        expected = engine(g, h, alignment.node_ids, _get_edge_properties(g, h, weighted), alignment)
+        assert distances.global_distance == pytest.approx(expected.global_distance, rel=1e-12, abs=1e-12)
+        assert list(distances.local_distances) == list(expected.local_distances)
+        assert np.allclose(list(distances.local_distances.values()), list(expected.local_distances.values()),
+                           rtol=1e-12, atol=1e-12)
+
+
+@pytest.mark.parametrize('weighted', [False, True])
+@pytest.mark.parametrize('directed', [True, False])
+def test_initial_distances_match_full_computation(directed: bool, weighted: bool):
+    g, h, _, _ = _get_graph_pair(directed, 0)
+    alignment = NodeAlignment.from_graphs(g, h)
+    distances = IncrementalGraphDistance(g, h, alignment.node_ids, _get_edge_properties(g, h, weighted), alignment)
+    _assert_same_distances(g, h, distances, weighted)
+
+
+@pytest.mark.parametrize('weighted', [False, True])
+@pytest.mark.parametrize('directed', [True, False])
+def test_apply_edge_changes_matches_full_computation(directed: bool, weighted: bool):
+    g, h, edges_g, edges_h = _get_graph_pair(directed, 1)
+    alignment = NodeAlignment.from_graphs(g, h)
+    distances = IncrementalGraphDistance(g, h, alignment.node_ids, _get_edge_properties(g, h, weighted), alignment)
+    # Removes the self-loop (3, 3) at position 20 and one copy of the parallel edge at position 0, and adds a
+    # self-loop, a parallel edge, and the edge of a swap.
+    removed_edges = np.array([[3, 3], edges_g[0], edges_g[5]])
+    added_edges = np.array([[7, 7], edges_g[1], [edges_g[5, 0], edges_g[6, 1]]])
+    distances.apply_edge_changes(0, removed_edges, added_edges, _get_weights(added_edges, directed))
+    new_edges_g = np.concatenate((np.delete(edges_g, [0, 5, 20], axis=0), added_edges))
+    g = _get_graph(new_edges_g, list(g.vertex_properties['ID']), directed)
+    _assert_same_distances(g, h, distances, weighted)
+    distances.apply_edge_changes(1, edges_h[:2], np.empty((0, 2), dtype=np.int64))
+    h = _get_graph(edges_h[2:], list(h.vertex_properties['ID']), directed)
+    _assert_same_distances(g, h, distances, weighted)
+
+
+@pytest.mark.parametrize('weighted', [False, True])
+@pytest.mark.parametrize('directed', [True, False])
+def test_update_graph_and_reset_match_full_computation(directed: bool, weighted: bool):
+    g, h, edges_g, edges_h = _get_graph_pair(directed, 2)
+    alignment = NodeAlignment.from_graphs(g, h)
+    distances = IncrementalGraphDistance(g, h, alignment.node_ids, _get_edge_properties(g, h, weighted), alignment)
+    rng = np.random.default_rng(3)
+    for _ in range(3):
+        new_g = _get_graph(np.concatenate((edges_g[:10], _get_random_edges(rng, 10))), list(g.vertex_properties['ID']),
+                           directed)
+        new_h = _get_graph(np.concatenate((edges_h[10:], _get_random_edges(rng, 5))), list(h.vertex_properties['ID']),
+                           directed)
+        new_edge_properties = _get_edge_properties(new_g, new_h, weighted)
+        distances.update_graph(0, new_g, new_edge_properties[0] if weighted else None)
+        distances.update_graph(1, new_h, new_edge_properties[1] if weighted else None)
+        _assert_same_distances(new_g, new_h, distances, weighted)
+        distances.reset()
+        _assert_same_distances(g, h, distances, weighted)
+
+
+def _get_swapped_graph(graph: gt.Graph, edge_indices: np.ndarray, added_edges: np.ndarray) -> gt.Graph:
+    # Moves the edges with the given indices to their new endpoints. Their scores move with them.
+    edges = graph.get_edges([graph.edge_index]).astype(np.int64)
+    rows = np.argsort(edges[:, 2])[np.searchsorted(np.sort(edges[:, 2]), edge_indices)]
+    scores = graph.edge_properties['NORM-SCORE'].a[edges[:, 2]]
+    edges = edges[:, :2]
+    edges[rows] = added_edges
+    swapped_graph = gt.Graph(directed=graph.is_directed())
+    swapped_graph.add_vertex(graph.num_vertices())
+    swapped_graph.vertex_properties['ID'] = swapped_graph.new_vp('string', vals=list(graph.vertex_properties['ID']))
+    score_property = swapped_graph.new_ep('double')
+    swapped_graph.add_edge_list(np.column_stack((edges, scores)), eprops=[score_property])
+    swapped_graph.edge_properties['NORM-SCORE'] = score_property
+    return swapped_graph
+
+
+def _get_degrees(graph: gt.Graph) -> np.ndarray:
+    return np.column_stack((graph.get_in_degrees(graph.get_vertices()), graph.get_out_degrees(graph.get_vertices())))
+
+
+@pytest.mark.parametrize('directed', [True, False])
+def test_swap_edges_preserves_degrees(directed: bool):
+    g, _, _, _ = _get_graph_pair(directed, 4)
+    edge_indices, removed_edges, added_edges = swap_edges(g, 5)
+    assert edge_indices.shape[0] > 0
+    swapped_g = _get_swapped_graph(g, edge_indices, added_edges)
+    assert np.array_equal(_get_degrees(swapped_g), _get_degrees(g))
+    # Swaps do not create self-loops, and the same seed yields the same swaps.
+    assert not (added_edges[:, 0] == added_edges[:, 1]).any()
+    for expected, actual in zip((edge_indices, removed_edges, added_edges), swap_edges(g, 5)):
+        assert np.array_equal(expected, actual)
+
+
+@pytest.mark.parametrize('weighted', [False, True])
+@pytest.mark.parametrize('directed', [True, False])
+def test_swapped_edges_match_full_computation(directed: bool, weighted: bool):
+    g, h, _, _ = _get_graph_pair(directed, 6)
+    alignment = NodeAlignment.from_graphs(g, h)
+    edge_properties = _get_edge_properties(g, h, weighted)
+    distances = IncrementalGraphDistance(g, h, alignment.node_ids, edge_properties, alignment)
+    for seed in range(3):
+        swapped_graphs = []
+        for graph_index, graph in enumerate([g, h]):
+            edge_indices, removed_edges, added_edges = swap_edges(graph, seed)
+            added_weights = edge_properties[graph_index].a[edge_indices] if weighted else None
+            distances.apply_edge_changes(graph_index, removed_edges, added_edges, added_weights)
+            swapped_graphs.append(_get_swapped_graph(graph, edge_indices, added_edges))
+        _assert_same_distances(swapped_graphs[0], swapped_graphs[1], distances, weighted)
+        distances.reset()
+        _assert_same_distances(g, h, distances, weighted)
@@ -0,0 +1,68 @@
+import tracemalloc
+import numpy as np
+import pandas as pd
+import pytest
+
+from graphsimqt.utils.local_distance_store import save_local_distances
+from graphsimqt.utils.mwu_context import MWUContext, RankedLocalDistances, compute_mwu_p_value
+from graphsimqt.utils.run_metrics import collect_run_metrics, measure_stage
+
+
+def _get_distances(num_permutations: int, num_nodes: int, seed: int) -> np.ndarray:
+    # Rounded distances produce ties within and across the unpermuted and permuted distances.
+    rng = np.random.default_rng(seed)
+    return np.round(rng.random((num_permutations + 1, num_nodes)), 2)
+
+
+@pytest.mark.parametrize('max_pairs', [1, 64, 1 << 22], ids=['all_large', 'mixed', 'all_blocked'])
+def test_node_set_p_values_match_scipy(max_pairs: int):
+    distances = _get_distances(20, 60, 0)
+    rng = np.random.default_rng(1)
+    node_set_columns = [np.sort(rng.choice(60, size=size, replace=False)) for size in [1, 3, 8, 9, 15, 40, 60]]
+    node_set_columns.append(np.array([], dtype=np.int64))
+    p_values = RankedLocalDistances(distances).compute_node_set_p_values(node_set_columns, max_pairs)
+    expected = [compute_mwu_p_value(distances, columns) for columns in node_set_columns]
+    assert np.allclose(p_values, expected)
+
+
+def test_large_node_set_allocation_is_bounded():
+    # The node set has 25 million node pairs, which would require several arrays of 200 MB each if they were
+    # materialized, while its 100,000 permuted distances require less than 1 MB.
+    num_nodes, num_permutations, max_pairs = 5000, 20, 1 << 22
+    distances = _get_distances(num_permutations, num_nodes, 2)
+    ranked_distances = RankedLocalDistances(distances)
+    node_set_columns = [np.arange(num_nodes), np.arange(0, num_nodes, 2)]
+    assert node_set_columns[0].shape[0] > np.sqrt(max_pairs)
+    tracemalloc.start()
+    try:
+        p_values = ranked_distances.compute_node_set_p_values(node_set_columns, max_pairs)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    assert peak < 32 * 2 ** 20
+    assert np.allclose(p_values, [compute_mwu_p_value(distances, columns) for columns in node_set_columns])
+
+
+def test_context_peak_rss_is_bounded_for_large_partition(tmp_path):
+    # Partition of a tabular node set file as grouped by compute_mwu_p_values(). Its largest class has 36 million node
+    # pairs, which would raise the peak RSS by more than 1 GB if they were materialized, while blocks of at most
+    # max_pairs node pairs require about 50 bytes per pair.
+    num_nodes, num_permutations = 8000, 20
+    node_ids = [f'node{node}' for node in range(num_nodes)]
+    distances = _get_distances(num_permutations, num_nodes, 3)
+    save_local_distances(tmp_path, node_ids, {'distance': distances})
+    partition = pd.DataFrame({'node': node_ids, 'class': np.where(np.arange(num_nodes) < 6000, 'large', 'small')})
+    node_sets = partition.groupby('class')['node'].apply(set).to_dict()
+    with collect_run_metrics(tmp_path) as run_metrics:
+        context = MWUContext(tmp_path, max_pairs=1 << 18)
+        node_set_columns = [context.get_columns(node_set) for node_set in node_sets.values()]
+        context.get_ranked_distances('distance')
+        with measure_stage('baseline'):
+            pass
+        with measure_stage('node_sets'):
+            p_values = context.compute_node_set_p_values('distance', node_set_columns)
+    baseline_rss, peak_rss = (stage['peak_rss'] for stage in run_metrics.stages)
+    if peak_rss is None:
+        pytest.skip('Peak RSS of stages is only available on Linux.')
+    assert peak_rss - baseline_rss < 64 * 2 ** 20
+    assert np.allclose(p_values, [compute_mwu_p_value(distances, columns) for columns in node_set_columns])
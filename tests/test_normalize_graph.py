@@ -0,0 +1,58 @@
+import numpy as np
+import pytest
+
+gt = pytest.importorskip('graph_tool')
+
+from graphsimqt.normalize_graph import _compute_normalized_edge_ranks
+
+
+def _compute_reference_edge_ranks(graph: gt.Graph) -> np.ndarray:
+    # Loop-based implementation that was replaced by the vectorized one. last_val is never updated, so each edge with
+    # positive score increments the rank (ties included), while edges with non-positive scores have rank 0.
+    sorted_edges = []
+    prop = graph.edge_properties['SCORE']
+    for edge in graph.edges():
+        sorted_edges.append((edge, prop[edge]))
+    sorted_edges.sort(key=lambda item: item[1])
+    normalized_rank = graph.new_ep('double')
+    num_lower = -1
+    last_val = 0
+    for edge, val in sorted_edges:
+        if val > last_val:
+            num_lower += 1
+        normalized_rank[edge] = (num_lower + 1.0) / graph.num_edges()
+    return normalized_rank.a.copy()
+
+
+def _get_graph(edges, scores, directed: bool) -> gt.Graph:
+    graph = gt.Graph(directed=directed)
+    graph.add_vertex(int(np.max(edges)) + 1)
+    score_property = graph.new_ep('double')
+    graph.add_edge_list(np.column_stack((np.asarray(edges, dtype=np.float64), scores)), eprops=[score_property])
+    graph.edge_properties['SCORE'] = score_property
+    return graph
+
+
+def _get_random_edges(num_edges: int, seed: int) -> np.ndarray:
+    # Random sources make graph_tool iterate over the edges in a different order than their indices.
+    rng = np.random.default_rng(seed)
+    return rng.integers(0, max(2, num_edges // 2), size=(num_edges, 2))
+
+
+@pytest.mark.parametrize('directed', [True, False])
+@pytest.mark.parametrize('scores', [
+    np.array([0.5, 0.2, 0.5, 0.9, 0.2, 0.5, 0.1]),
+    np.array([0.0, 0.3, 0.0, 0.3, 1.0, 0.0]),
+    np.array([-1.2, 0.0, 0.7, -0.3, 0.7, 2.1, 0.0]),
+    np.full(6, 0.4),
+    np.zeros(5),
+    np.array([0.8]),
+    np.array([0.0]),
+    np.round(np.random.default_rng(0).random(500), 1),
+], ids=['ties', 'zeros', 'negative', 'all_equal', 'all_zero', 'single_edge', 'single_zero_edge', 'random_ties'])
+def test_normalized_edge_ranks_match_reference(scores: np.ndarray, directed: bool):
+    graph = _get_graph(_get_random_edges(scores.shape[0], scores.shape[0]), scores, directed)
+    expected = _compute_reference_edge_ranks(graph)
+    _compute_normalized_edge_ranks(graph)
+    assert np.array_equal(graph.edge_properties['NORM-RANK'].a, expected)
+
@@ -0,0 +1,70 @@
+import numpy as np
+import pytest
+
+gt = pytest.importorskip('graph_tool')
+
+from graphsimqt.run_permutation_tests import run_permutation_tests
+from graphsimqt.run_similarity_matrix import run_similarity_matrix
+from graphsimqt.utils.local_distance_store import load_local_distances
+
+
+def _get_graph(node_ids: list, num_edges: int, directed: bool, seed: int) -> gt.Graph:
+    rng = np.random.default_rng(seed)
+    graph = gt.Graph(directed=directed)
+    graph.add_vertex(len(node_ids))
+    graph.vertex_properties['ID'] = graph.new_vp('string', vals=node_ids)
+    edges = rng.integers(0, len(node_ids), size=(num_edges, 2))
+    graph.add_edge_list(edges[edges[:, 0] != edges[:, 1]])
+    return graph
+
+
+def _get_graphs(directed: bool = False) -> list:
+    # Each graph has nodes that are missing in the other graphs, so the alignment changes the graphs.
+    shared_ids = [f'n{node}' for node in range(30)]
+    return [_get_graph(shared_ids + [f'g{graph_index}_{node}' for node in range(5)], 80, directed, graph_index)
+            for graph_index in range(3)]
+
+
+def _load_pair_distances(result_dir_path) -> dict:
+    return {pair_dir_path.name: load_local_distances(pair_dir_path)[1]['topology_only']
+            for pair_dir_path in sorted(result_dir_path.iterdir()) if pair_dir_path.is_dir()}
+
+
+@pytest.mark.parametrize('alignment', ['intersection', 'union'])
+def test_matrix_distances_do_not_depend_on_banks(tmp_path, monkeypatch, alignment: str):
+    monkeypatch.setenv('GRAPHSIMQT_CACHE_DIR', str(tmp_path.joinpath('cache')))
+    distances = []
+    for use_null_model_banks in [False, True, True]:
+        result_dir_path = tmp_path.joinpath(f'matrix_{len(distances)}')
+        run_similarity_matrix(_get_graphs(), str(result_dir_path), alignment=alignment, num_permutations=5,
+                              silent=True, seed=7, use_null_model_banks=use_null_model_banks)
+        distances.append(_load_pair_distances(result_dir_path))
+    # The second banked run replays the banks of the first one.
+    for pair_distances in distances[1:]:
+        assert list(pair_distances) == list(distances[0])
+        for pair, pair_local_distances in pair_distances.items():
+            assert np.array_equal(np.asarray(pair_local_distances), np.asarray(distances[0][pair]))
+
+
+@pytest.mark.parametrize('directed', [True, False])
+def test_permuted_distances_do_not_depend_on_banks(tmp_path, monkeypatch, directed: bool):
+    monkeypatch.setenv('GRAPHSIMQT_CACHE_DIR', str(tmp_path.joinpath('cache')))
+    graph_1, graph_2, _ = _get_graphs(directed)
+    distances = []
+    for use_null_model_banks in [False, True, True]:
+        result_dir_path = tmp_path.joinpath(f'pair_{len(distances)}')
+        run_permutation_tests(gt.Graph(graph_1), gt.Graph(graph_2), str(result_dir_path), num_permutations=5,
+                              silent=True, seed=7, use_null_model_banks=use_null_model_banks)
+        distances.append(np.asarray(load_local_distances(result_dir_path)[1]['topology_only']))
+    # The second banked run replays the banks of the first one.
+    assert np.array_equal(distances[1], distances[0])
+    assert np.array_equal(distances[2], distances[0])
+
+
+def test_banks_require_seed(tmp_path, monkeypatch):
+    monkeypatch.setenv('GRAPHSIMQT_CACHE_DIR', str(tmp_path.joinpath('cache')))
+    graph_1, graph_2, _ = _get_graphs()
+    with pytest.warns(UserWarning, match='require a seed'):
+        run_permutation_tests(graph_1, graph_2, str(tmp_path.joinpath('pair')), num_permutations=2, silent=True,
+                              use_null_model_banks=True)
+    assert not tmp_path.joinpath('cache', 'null_model_banks').exists()